@@ -2,6 +2,8 @@
 
 from __future__ import with_statement
 
+import os
+
 import nef
 
 from ca.nengo.model import SimulationMode
@@ -10,7 +12,7 @@ from ca.nengo.util import MU
 from ca.nengo.math.impl import IndicatorPDF, ConstantFunction
 
 
-from hrlproject.misc import HRLutils
+from hrlproject.misc import HRLutils, checkpoint
 from hrlproject.agent import memory, actionvalues
 from hrlproject.simplenodes import decoderlearningnode
 
@@ -28,7 +30,8 @@ class QNetwork(NetworkImpl):
     def __init__(self, stateN, stateD, state_encoders, actions, learningrate,
                  stateradius=1.0, Qradius=1.0, load_weights=None,
                  state_evals=None, state_threshold=(0.0, 1.0),
-                 statediff_threshold=0.2, init_Qs=None):
+                 statediff_threshold=0.2, init_Qs=None,
+                 functional_memory=False, decoder_solver=None):
         """Builds the QNetwork.
 
         :param stateN: number of neurons to use to represent state
@@ -46,20 +49,31 @@ class QNetwork(NetworkImpl):
         :param state_threshold: threshold range of state neurons
         :param statediff_threshold: maximum state difference for dual training
         :param init_Qs: initial Q values
+        :param functional_memory: if True, use a GatedMemoryNode (rather than
+            a neural Memory) to store the previous state
+        :param decoder_solver: if True, solve for the state population
+            decoders with decodersolver rather than Nengo's solver (defaults
+            to HRLutils.DECODER_SOLVER)
         """
 
         self.name = "QNetwork"
         net = nef.Network(self, seed=HRLutils.SEED, quick=False)
 
-        N = 50
+        N = HRLutils.BASE_N
         tauPSC = 0.007
         num_actions = len(actions)
         init_Qs = [0.2] * num_actions if init_Qs is None else init_Qs
+        if decoder_solver is None:
+            decoder_solver = HRLutils.DECODER_SOLVER
 
         # if True, use neuron--neuron weight learning, otherwise, use decoder
         # learning
         self.neuron_learning = False
 
+        # if True (and neuron_learning), store the connection weights in
+        # factored form (see ActionValues)
+        self.factored_weights = False
+
         # set up relays
         state_relay = net.make("state_relay", 1, stateD, mode="direct")
         state_relay.fixMode()
@@ -72,27 +86,35 @@ class QNetwork(NetworkImpl):
         state_fac.setIntercept(IndicatorPDF(state_threshold[0],
                                             state_threshold[1]))
 
-        state_pop = net.make("state_pop", stateN, stateD,
-                             radius=stateradius, node_factory=state_fac,
-                             encoders=state_encoders, eval_points=state_evals)
+        # note: seeded in the same way as net.make, but built with the
+        # model's ensemble factory (so the decoders are cached)
+        state_pop = HRLutils.make_ensemble(net, "state_pop", stateN, stateD,
+                                           radius=stateradius,
+                                           node_factory=state_fac,
+                                           encoders=state_encoders,
+                                           eval_points=state_evals,
+                                           decoder_solver=decoder_solver)
         state_pop.fixMode([SimulationMode.DEFAULT, SimulationMode.RATE])
 
         net.connect(state_relay, state_pop, pstc=tauPSC)
 
         # store the state value (used to drive population encoding previous
         # state)
-        saved_state = memory.Memory("saved_state", N * 4, stateD,
-                                    inputscale=50, radius=stateradius,
-                                    direct_storage=True)
+        saved_state = memory.make_memory("saved_state", N * 4, stateD,
+                                         functional=functional_memory,
+                                         inputscale=50, radius=stateradius,
+                                         direct_storage=True)
         net.add(saved_state)
 
         net.connect(state_relay, saved_state.getTermination("target"))
 
         # create population representing previous state
-        old_state_pop = net.make("old_state_pop", stateN, stateD,
-                                 radius=stateradius, node_factory=state_fac,
-                                 encoders=state_encoders,
-                                 eval_points=state_evals)
+        old_state_pop = HRLutils.make_ensemble(net, "old_state_pop", stateN,
+                                               stateD, radius=stateradius,
+                                               node_factory=state_fac,
+                                               encoders=state_encoders,
+                                               eval_points=state_evals,
+                                               decoder_solver=decoder_solver)
         old_state_pop.fixMode([SimulationMode.DEFAULT, SimulationMode.RATE])
 
         net.connect(saved_state, old_state_pop, pstc=tauPSC)
@@ -105,28 +127,29 @@ class QNetwork(NetworkImpl):
             decoders = state_pop.addDecodedOrigin(
                 "init_decoders", [ConstantFunction(stateD, init_Qs)],
                 "AXON").getDecoders()
-            actionvals = actionvalues.ActionValues("actionvals", N, stateN,
-                                                   actions, learningrate,
-                                                   Qradius=Qradius,
-                                                   init_decoders=decoders)
+            actionvals = actionvalues.ActionValues(
+                "actionvals", N, stateN, actions, learningrate,
+                Qradius=Qradius, init_decoders=decoders,
+                factored=self.factored_weights, state_pop=state_pop)
             net.add(actionvals)
 
-            net.connect(state_pop.getOrigin("AXON"),
-                        actionvals.getTermination("state"))
+            if not self.factored_weights:
+                net.connect(state_pop.getOrigin("AXON"),
+                            actionvals.getTermination("state"))
 
             # Q values of previous state
             decoders = old_state_pop.addDecodedOrigin(
                 "init_decoders", [ConstantFunction(stateD, init_Qs)],
                 "AXON").getDecoders()
-            old_actionvals = actionvalues.ActionValues("old_actionvals", N,
-                                                       stateN, actions,
-                                                       learningrate,
-                                                       Qradius=Qradius,
-                                                       init_decoders=decoders)
+            old_actionvals = actionvalues.ActionValues(
+                "old_actionvals", N, stateN, actions, learningrate,
+                Qradius=Qradius, init_decoders=decoders,
+                factored=self.factored_weights, state_pop=old_state_pop)
             net.add(old_actionvals)
 
-            net.connect(old_state_pop.getOrigin("AXON"),
-                        old_actionvals.getTermination("state"))
+            if not self.factored_weights:
+                net.connect(old_state_pop.getOrigin("AXON"),
+                            old_actionvals.getTermination("state"))
         else:
             # just use decoder on state population to compute Q values
 
@@ -206,49 +229,112 @@ class QNetwork(NetworkImpl):
         self.exposeOrigin(actionvals.getOrigin("X"), "vals")
         self.exposeOrigin(old_actionvals.getOrigin("X"), "old_vals")
 
-    def saveParams(self, prefix):
+    def saveParams(self, prefix, dtype="f8", keep=1):
+        """Save the learned parameters.
+
+        :param prefix: prefix for the saved file(s)
+        :param dtype: storage type for checkpoint (see checkpoint.save)
+        :param keep: number of checkpoints to keep (see checkpoint.save)
+        """
+
         # save connection weights
         if self.neuron_learning:
             self.getNode("actionvals").saveWeights(prefix)
             self.getNode("old_actionvals").saveWeights(prefix)
-        else:
-            dec = self.getNode("state_pop").getOrigin("vals").getDecoders()
-            with open(HRLutils.datafile(prefix + "_state_decoders.txt"),
-                      "w") as f:
-                f.write("\n".join([" ".join([str(x) for x in d])
-                                   for d in dec]))
-
-            dec = self.getNode("old_state_pop").getOrigin("vals").getDecoders()
-            with open(HRLutils.datafile(prefix + "_old_state_decoders.txt"),
-                      "w") as f:
-                f.write("\n".join([" ".join([str(x) for x in d])
-                                   for d in dec]))
-
-        # save state encoders
-        enc = self.getNode("state_pop").getEncoders()
-        with open(HRLutils.datafile(prefix + "_state_encoders.txt"), "w") as f:
-            f.write("\n".join([" ".join([str(x) for x in e]) for e in enc]))
+
+        checkpoint.save(HRLutils.datafile(prefix + "_params.ckpt"),
+                        self.snapshot(), dtype=dtype, keep=keep)
+
+    def learning_nodes(self):
+        """Returns the DecoderLearningNodes that modify the Q value
+        decoders."""
+
+        if self.neuron_learning:
+            return []
+        return [self.getNode("state_learningnode"),
+                self.getNode("old_state_learningnode")]
+
+    def version(self):
+        """Returns a number that changes whenever the learned parameters
+        change (or None if the changes can't be tracked, i.e. with
+        neuron_learning)."""
+
+        if self.neuron_learning:
+            return None
+        return sum([n.version for n in self.learning_nodes()])
+
+    def snapshot(self):
+        """Returns a copy of the parameters saved by saveParams (the learned
+        decoders and the state encoders), as a list of (name, matrix)
+        tuples.
+
+        The copy is taken while holding the learning node locks, so the
+        decoders are consistent even if learning is happening in another
+        thread.
+        """
+
+        nodes = self.learning_nodes()
+        for n in nodes:
+            n.lock.acquire()
+        try:
+            arrays = []
+            if not self.neuron_learning:
+                arrays += [("state_decoders", [row[:] for row in self.getNode(
+                    "state_pop").getOrigin("vals").getDecoders()])]
+                arrays += [("old_state_decoders", [row[:] for row in
+                                                   self.getNode(
+                    "old_state_pop").getOrigin("vals").getDecoders()])]
+        finally:
+            for n in nodes:
+                n.lock.release()
+
+        arrays += [("state_encoders", [row[:] for row in self.getNode(
+            "state_pop").getEncoders()])]
+
+        return arrays
 
     def loadParams(self, prefix):
+        """Load parameters saved by saveParams.
+
+        Falls back to the text files saved by older versions (see
+        checkpoint.convert_text) if there is no checkpoint file.
+
+        :param prefix: prefix for the saved file(s)
+        """
+
         print "loading params: %s" % prefix
 
+        filename = HRLutils.datafile(prefix + "_params.ckpt")
+        if os.path.exists(filename):
+            header, arrays = checkpoint.load(filename)
+            for name in arrays:
+                arrays[name] = checkpoint.as_float(arrays[name])
+            if header["code_version"] != checkpoint.CODE_VERSION:
+                print ("warning: loading parameters from code version %s" %
+                       header["code_version"])
+        else:
+            arrays = {}
+            names = ["state_encoders"]
+            if not self.neuron_learning:
+                names += ["state_decoders", "old_state_decoders"]
+            for name in names:
+                with open(HRLutils.datafile("%s_%s.txt" % (prefix,
+                                                           name))) as f:
+                    arrays[name] = [[float(x) for x in d.split(" ")]
+                                    for d in f.readlines()]
+
         # load connection weights
         if self.neuron_learning:
             self.getNode("actionvals").loadWeights(prefix)
             self.getNode("old_actionvals").loadWeights(prefix)
         else:
-            with open(HRLutils.datafile(prefix + "_state_decoders.txt")) as f:
-                self.getNode("state_pop").getOrigin("vals").setDecoders(
-                    [[float(x) for x in d.split(" ")] for d in f.readlines()])
-
-            with open(HRLutils.datafile(prefix +
-                                        "_old_state_decoders.txt")) as f:
-                self.getNode("old_state_pop").getOrigin("vals").setDecoders(
-                    [[float(x) for x in d.split(" ")] for d in f.readlines()])
+            self.getNode("state_pop").getOrigin("vals").setDecoders(
+                arrays["state_decoders"])
+            self.getNode("old_state_pop").getOrigin("vals").setDecoders(
+                arrays["old_state_decoders"])
 
         # load state encoders
-        with open(HRLutils.datafile(prefix + "_state_encoders.txt")) as f:
-            enc = [[float(x) for x in e.split(" ")] for e in f.readlines()]
+        enc = arrays["state_encoders"]
         self.getNode("state_pop").setEncoders(enc)
         # note we assume that state_pop and old_state_pop use the same encoders
         self.getNode("old_state_pop").setEncoders(enc)
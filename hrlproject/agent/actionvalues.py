@@ -1,14 +1,13 @@
 # Copyright 2014, Daniel Rasmussen.  All rights reserved.
 
-from hrlproject.misc.HRLutils import rand as random
-
 from ca.nengo.model import SimulationMode
 from ca.nengo.model.impl import NetworkImpl, EnsembleTermination
 from ca.nengo.util import MU
 
 import nef
 
-from hrlproject.misc import HRLutils
+from hrlproject.misc import HRLutils, weightstore
+from hrlproject.simplenodes import factoredweightnode
 
 
 class ActionValues(NetworkImpl):
@@ -25,7 +24,7 @@ class ActionValues(NetworkImpl):
     """
 
     def __init__(self, name, N, stateN, actions, learningrate, Qradius=1.0,
-                 init_decoders=None):
+                 init_decoders=None, factored=False, state_pop=None):
         """Build ActionValues network.
 
         :param name: name of Network
@@ -37,6 +36,12 @@ class ActionValues(NetworkImpl):
         :param Qradius: expected radius of Q values
         :param init_decoders: if specified, will be used to initialize the
             connection weights to whatever function is specified by decoders
+        :param factored: if True, store the connection weights in factored
+            form (action population encoders x learned vector, see
+            FactoredWeightNode) rather than as full weight matrices
+        :param state_pop: state ensemble (only needed if factored is True,
+            in which case the state activities are read directly from this
+            ensemble rather than through the state termination)
         """
 
         self.name = name
@@ -47,6 +52,7 @@ class ActionValues(NetworkImpl):
         self.supervision = 1.0  # don't use the unsupervised stuff at all
 
         self.tauPSC = 0.007
+        self.factored = factored
 
         modterms = []
         learnterms = []
@@ -55,32 +61,63 @@ class ActionValues(NetworkImpl):
         output = net.make("output", 1, len(actions), mode="direct")
         output.fixMode()
 
+        if factored:
+            assert state_pop is not None
+            if init_decoders is not None:
+                factors = [[row[0] for row in init_decoders]
+                           for _ in actions]
+            else:
+                factors = []
+                for action in actions:
+                    rand = HRLutils.stream("%s/%s" % (name, action[0]))
+                    factors += [[rand.uniform(-1e-3, 1e-3)
+                                 for _ in range(stateN)]]
+            factor_node = factoredweightnode.FactoredWeightNode(
+                state_pop, factors, self.learningrate, name="factors")
+            net.add(factor_node)
+
         for i, action in enumerate(actions):
             # create one population corresponding to each action
             act_pop = net.make("action_" + action[0], self.N * 4, 1,
                                node_factory=HRLutils.node_fac())
             act_pop.fixMode([SimulationMode.DEFAULT, SimulationMode.RATE])
 
-            # add error termination
-            modterm = act_pop.addDecodedTermination(
-                "error", [[0 if j != i else 1 for j in range(len(actions))]],
-                0.005, True)
-            # set modulatory transform so that it selects one dimension of
-            # the error signal
-
-            # create learning termination
-            if init_decoders is not None:
-                weights = MU.prod(act_pop.getEncoders(),
-                                  MU.transpose(init_decoders))
+            if factored:
+                # the action population's encoders applied to the output of
+                # the factor node give the full connection weights
+                learningterm = act_pop.addDecodedTermination(
+                    "learning", [[0 if j != i else 1
+                                  for j in range(len(actions))]],
+                    0.005, False)
+                net.connect(factor_node.getOrigin("X"), learningterm)
             else:
-                weights = [[random.uniform(-1e-3, 1e-3) for j in range(stateN)]
-                           for i in range(act_pop.getNeurons())]
-            learningterm = act_pop.addHPESTermination("learning", weights,
-                                                      0.005, False, None)
-
-            # initialize the learning rule
-            net.learn(act_pop, learningterm, modterm, rate=self.learningrate,
-                      supervisionRatio=self.supervision)
+                # add error termination
+                modterm = act_pop.addDecodedTermination(
+                    "error", [[0 if j != i else 1
+                               for j in range(len(actions))]],
+                    0.005, True)
+                # set modulatory transform so that it selects one dimension
+                # of the error signal
+
+                # create learning termination
+                if init_decoders is not None:
+                    weights = MU.prod(act_pop.getEncoders(),
+                                      MU.transpose(init_decoders))
+                else:
+                    rand = HRLutils.stream("%s/%s" % (name, action[0]))
+                    weights = [[rand.uniform(-1e-3, 1e-3)
+                                for j in range(stateN)]
+                               for i in range(act_pop.getNeurons())]
+                learningterm = act_pop.addHPESTermination("learning", weights,
+                                                          0.005, False, None)
+
+                # initialize the learning rule
+                net.learn(act_pop, learningterm, modterm,
+                          rate=self.learningrate,
+                          supervisionRatio=self.supervision)
+
+                modterms += [modterm]
+                learnterms += [learningterm]
 
             # connect each action back to output relay
             net.connect(act_pop.getOrigin("X"), output,
@@ -90,52 +127,89 @@ class ActionValues(NetworkImpl):
             # note, we learn all the Q values with radius 1, then just
             # multiply by the desired Q radius here
 
-            modterms += [modterm]
-            learnterms += [learningterm]
-
-        # use EnsembleTerminations to group the individual action terminations
-        # into one multi-dimensional termination
-        self.exposeTermination(EnsembleTermination(self, "state", learnterms),
-                               "state")
-        self.exposeTermination(EnsembleTermination(self, "error", modterms),
-                               "error")
+        if factored:
+            self.exposeTermination(factor_node.getTermination("error"),
+                                   "error")
+        else:
+            # use EnsembleTerminations to group the individual action
+            # terminations into one multi-dimensional termination
+            self.exposeTermination(EnsembleTermination(self, "state",
+                                                       learnterms), "state")
+            self.exposeTermination(EnsembleTermination(self, "error",
+                                                       modterms), "error")
 
         self.exposeOrigin(output.getOrigin("X"), "X")
 
-    def saveWeights(self, prefix):
-        """Save the connection weights to file."""
+    def saveWeights(self, prefix, shards=1):
+        """Save the connection weights to file (one memory mapped weight file
+        per action population, see weightstore).
+
+        :param prefix: prefix for the saved files
+        :param shards: number of files to split each weight matrix across
+        """
 
         prefix = prefix + "_" + self.name
+        if self.factored:
+            weightstore.save(HRLutils.datafile(prefix + "_factors"),
+                             self.getNode("factors").factors, shards=shards)
+            return
+
         for n in self.getNodes():
             if n.getName().startswith("action"):
                 term = n.getTermination("learning")
-                weights = [t.getWeights() for t in term.getNodeTerminations()]
-
-                f = open(HRLutils.datafile(prefix + "_" + n.getName() +
-                                           ".txt"), "w")
-                f.write(str(HRLutils.SEED) + "\n")
-                for row in weights:
-                    f.write(" ".join([str(x) for x in row]) + "\n")
-                f.close()
+                weightstore.save(
+                    HRLutils.datafile(prefix + "_" + n.getName()),
+                    [t.getWeights() for t in term.getNodeTerminations()],
+                    shards=shards)
 
     def loadWeights(self, prefix):
-        """Load the connection weights from file."""
+        """Load the connection weights from file.
+
+        Falls back to the text files saved by older versions if there is no
+        weight file.
+
+        Note: all the weights are read here (each row with one bulk read),
+        since the terminations copy their weights when they are set.
+        """
 
         prefix = prefix + "_" + self.name
+        if self.factored:
+            factors = weightstore.MappedMatrix(
+                HRLutils.datafile(prefix + "_factors"))
+            self.getNode("factors").factors = [list(factors[i]) for i in
+                                               range(len(factors))]
+            return
+
         for n in self.getNodes():
             if n.getName().startswith("action"):
-                f = open(HRLutils.datafile(prefix + "_" + n.getName() +
-                                           ".txt"), "r")
-                seed = int(f.readline())
+                filename = HRLutils.datafile(prefix + "_" + n.getName())
+                if weightstore.exists(filename):
+                    weights = weightstore.MappedMatrix(filename)
+                    seed = weights.seed
+                else:
+                    seed, weights = self.load_text(filename + ".txt")
+
                 if seed != HRLutils.SEED:
-                    print ("Warning, loading weights with a seed (" + seed +
-                           ") that doesn't match current (" + HRLutils.SEED +
-                           ")")
-                weights = []
-                for line in f:
-                    weights += [[float(x) for x in line.split()]]
-                f.close()
+                    print ("Warning, loading weights with a seed (%s) that "
+                           "doesn't match current (%s)" % (seed,
+                                                          HRLutils.SEED))
 
                 term = n.getTermination("learning")
                 for i, t in enumerate(term.getNodeTerminations()):
                     t.setWeights(weights[i], True)
+
+    def load_text(self, filename):
+        """Load weights from a text file (the format used by older versions of
+        saveWeights).
+
+        :returns: seed and list of weight rows
+        """
+
+        f = open(filename, "r")
+        seed = int(f.readline())
+        weights = []
+        for line in f:
+            weights += [[float(x) for x in line.split()]]
+        f.close()
+
+        return seed, weights
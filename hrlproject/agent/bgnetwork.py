@@ -13,6 +13,9 @@ from hrlproject.misc import HRLutils
 from hrlproject.agent import memory
 from hrlproject.simplenodes import noisenode
 
+BG_NEURONS = 200  # neurons per action in each basal ganglia nucleus
+WEIGHT_ACTIONS_N = 50  # neurons per dimension of the output action
+
 
 class BGNetwork(NetworkImpl):
     """A network that performs action selection given a set of Q values as
@@ -28,7 +31,8 @@ class BGNetwork(NetworkImpl):
     :output saved_action: saved curr_action output (see save_output)
     """
 
-    def __init__(self, actions, Qradius=1, noiselevel=0.03):
+    def __init__(self, actions, Qradius=1, noiselevel=0.03,
+                 functional_memory=False):
         """Builds the BGNetwork.
 
         :param actions: actions available to the system
@@ -36,12 +40,14 @@ class BGNetwork(NetworkImpl):
         :param Qradius: expected radius of Q values
         :param noiselevel: standard deviation of noise added to Q values for
             exploration
+        :param functional_memory: if True, use GatedMemoryNodes (rather than
+            neural Memory networks) to store the selected action
         """
 
         self.name = "BGNetwork"
         net = nef.Network(self, seed=HRLutils.SEED, quick=False)
 
-        self.N = 50
+        self.N = HRLutils.BASE_N
         self.d = len(actions)
         self.mut_inhib = 1.0  # mutual inhibition between actions
         self.tauPSC = 0.007
@@ -60,7 +66,8 @@ class BGNetwork(NetworkImpl):
         bgoutput.fixMode()
 
         basalganglia.make_basal_ganglia(netbg, bginput, bgoutput,
-                                        dimensions=self.d, neurons=200)
+                                        dimensions=self.d,
+                                        neurons=BG_NEURONS)
         bg = netbg.network
         net.add(bg)
         bg.fixMode([SimulationMode.DEFAULT, SimulationMode.RATE])
@@ -111,7 +118,7 @@ class BGNetwork(NetworkImpl):
                     pstc=self.tauPSC)
 
         # output action (action vectors weighted by BG output)
-        weight_actions = net.make_array("weight_actions", 50,
+        weight_actions = net.make_array("weight_actions", WEIGHT_ACTIONS_N,
                                         len(actions[0][1]), intercept=(0, 1))
         net.connect(val_threshold.getOrigin("output"), weight_actions,
                     transform=MU.transpose([actions[i][1]
@@ -123,14 +130,17 @@ class BGNetwork(NetworkImpl):
         save_relay.fixMode()
         save_relay.addDecodedTermination("input", [[1]], 0.001, False)
 
-        saved_action = memory.Memory("saved_action", self.N * 2,
-                                     len(actions[0][1]), inputscale=75)
+        saved_action = memory.make_memory("saved_action", self.N * 2,
+                                          len(actions[0][1]),
+                                          functional=functional_memory,
+                                          inputscale=75)
         net.add(saved_action)
         net.connect(weight_actions, saved_action.getTermination("target"))
         net.connect(save_relay, saved_action.getTermination("transfer"))
 
-        saved_vals = memory.Memory("saved_values", self.N * 2, self.d,
-                                   inputscale=75)
+        saved_vals = memory.make_memory("saved_values", self.N * 2, self.d,
+                                        functional=functional_memory,
+                                        inputscale=75)
         net.add(saved_vals)
         net.connect(val_threshold.getOrigin("output"),
                     saved_vals.getTermination("target"))
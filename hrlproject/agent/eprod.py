@@ -4,7 +4,6 @@ import math
 
 from ca.nengo.model import SimulationMode
 from ca.nengo.model.impl import NetworkImpl
-from ca.nengo.model.nef.impl import NEFEnsembleFactoryImpl
 from ca.nengo.math.impl import IndicatorPDF, PostfixFunction
 from ca.nengo.util import MU
 
@@ -72,7 +71,10 @@ class Eprod(NetworkImpl):
         in2.fixMode()
 
         # ensemble for intermediate populations
-        multef = NEFEnsembleFactoryImpl()
+        # note: the model factory is the same as NEFEnsembleFactoryImpl, but
+        # with the decoder cache and eval point policy (see
+        # HRLutils.EVAL_POINT_TARGETS)
+        multef = HRLutils.modelEnsembleFactory()
         multef.nodeFactory.tauRC = 0.05
         multef.nodeFactory.tauRef = 0.002
         multef.nodeFactory.maxRate = IndicatorPDF(200, 500)
@@ -25,7 +25,7 @@ class ErrorCalc(NetworkImpl):
         self.name = "ErrorCalc"
         tauPSC = 0.007
         intPSC = 0.1
-        N = 50
+        N = HRLutils.BASE_N
 
         ef = HRLutils.defaultEnsembleFactory()
 
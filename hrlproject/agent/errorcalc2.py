@@ -10,6 +10,13 @@ from hrlproject.misc import HRLutils
 from hrlproject.agent import memory
 
 
+def qthresh_eval_points():
+    """Eval points for the Qthresh population (only positive values, since
+    the output is thresholded at zero)."""
+
+    return [[x * 0.001] for x in range(1000)]
+
+
 class ErrorCalc2(NetworkImpl):
     """A network to calculate continuous SMDP TD error.
 
@@ -24,12 +31,15 @@ class ErrorCalc2(NetworkImpl):
     :output X: TD error value
     """
 
-    def __init__(self, discount, rewardradius=1.0, Qradius=1.0):
+    def __init__(self, discount, rewardradius=1.0, Qradius=1.0,
+                 functional_memory=False):
         """Builds the ErrorCalc2 network.
 
         :param discount: discount factor, controls rate of integration
         :param rewardradius: expected radius of reward value
         :param Qradius: expected radius of Q values
+        :param functional_memory: if True, use GatedMemoryNodes (rather than
+            neural Memory networks) to accumulate the reward and discount
         """
 
         self.name = "ErrorCalc"
@@ -37,7 +47,7 @@ class ErrorCalc2(NetworkImpl):
 
         tauPSC = 0.007
         intPSC = 0.1
-        N = 50
+        N = HRLutils.BASE_N
 
         # relay for current Q input
         currQ = net.make("currQ", 1, 1, node_factory=HRLutils.node_fac(),
@@ -64,7 +74,9 @@ class ErrorCalc2(NetworkImpl):
         storeQ.addDecodedTermination("input", [[1]], 0.001, False)
 
         # calculate "discount" by integrating output of storeQ
-        acc_storeQ = memory.Memory("acc_storeQ", N * 8, 1, inputscale=50)
+        acc_storeQ = memory.make_memory("acc_storeQ", N * 8, 1,
+                                        functional=functional_memory,
+                                        inputscale=50)
         net.add(acc_storeQ)
 
         zero_input = net.make_input("zero_input", [0])
@@ -78,7 +90,7 @@ class ErrorCalc2(NetworkImpl):
         # it will always be selected.  negative Q values are instead pushed
         # upwards by the PositiveBias mechanism.
         Qthresh = net.make("Qthresh", N * 2, 1, encoders=[[1]],
-                           eval_points=[[x * 0.001] for x in range(1000)],
+                           eval_points=qthresh_eval_points(),
                            radius=Qradius, intercept=(0, 1))
         net.connect(storeQ, Qthresh, pstc=tauPSC)
         net.connect(Qthresh, acc_storeQ, pstc=intPSC,
@@ -86,8 +98,9 @@ class ErrorCalc2(NetworkImpl):
                                                                         0.0))
 
         # accumulate  reward
-        reward = memory.Memory("reward", N * 4, 1, radius=rewardradius,
-                               inputscale=50)
+        reward = memory.make_memory("reward", N * 4, 1,
+                                    functional=functional_memory,
+                                    radius=rewardradius, inputscale=50)
         net.add(reward)
 
         reward.addDecodedTermination("input", [[intPSC]], intPSC, False)
@@ -25,19 +25,21 @@ class ErrorNetwork(NetworkImpl):
     """
 
     def __init__(self, num_actions, Qradius=1.0, rewardradius=1.0,
-                 discount=0.3):
+                 discount=0.3, functional_memory=False):
         """Builds the ErrorNetwork.
 
         :param num_actions: the number of actions available to the system
         :param Qradius: expected radius of Q values
         :param rewardradius: expected radius of reward signal
         :param discount: discount factor
+        :param functional_memory: if True, use GatedMemoryNodes (rather than
+            neural Memory networks) in the error calculation
         """
 
         self.name = "ErrorNetwork"
         net = nef.Network(self, seed=HRLutils.SEED, quick=False)
 
-        N = 50
+        N = HRLutils.BASE_N
         tauPSC = 0.007
         errorcap = 0.1  # soft cap on error magnitude (large errors seem to
         # cause problems with overly-generalizing the learning)
@@ -108,7 +110,8 @@ class ErrorNetwork(NetworkImpl):
 
         # create error calculation network
         error = errorcalc2.ErrorCalc2(discount, rewardradius=rewardradius,
-                                      Qradius=Qradius)
+                                      Qradius=Qradius,
+                                      functional_memory=functional_memory)
         net.add(error)
 
         net.connect(currQ, error.getTermination("currQ"))
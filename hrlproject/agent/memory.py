@@ -7,6 +7,14 @@ from ca.nengo.util import MU
 import nef
 
 from hrlproject.misc import HRLutils
+from hrlproject.simplenodes import gatedmemorynode
+
+
+def storage_eval_points():
+    """Eval points for the storage populations (more than normal, so that
+    the stored value is represented accurately across the range)."""
+
+    return [[x * 0.001] for x in range(-1000, 1000)]
 
 
 class Memory(NetworkImpl):
@@ -44,8 +52,7 @@ class Memory(NetworkImpl):
         if not direct_storage:
             storage = net.make_array("storage", N, d,
                                      node_factory=HRLutils.node_fac(),
-                                     eval_points=[[x * 0.001]
-                                                  for x in range(-1000, 1000)])
+                                     eval_points=storage_eval_points())
         else:
             storage = net.make("storage", 1, d, mode="direct")
             storage.fixMode()
@@ -136,3 +143,19 @@ class Memory(NetworkImpl):
 
         self.exposeTermination(t, name)
         return self.getTermination(name)
+
+
+def make_memory(name, N, d, functional=False, **kwargs):
+    """Create a memory component.
+
+    :param name: name of memory
+    :param N: base number of neurons
+    :param d: dimension of stored value
+    :param functional: if True, create a GatedMemoryNode (which computes the
+        memory dynamics directly), otherwise a neural Memory network
+    :param kwargs: other arguments for Memory/GatedMemoryNode
+    """
+
+    if functional:
+        return gatedmemorynode.GatedMemoryNode(name, N, d, **kwargs)
+    return Memory(name, N, d, **kwargs)
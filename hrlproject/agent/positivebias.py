@@ -8,6 +8,14 @@ from hrlproject.misc import HRLutils
 
 import nef
 
+BIAS_LEVEL = 0.03  # the value to be output for negative inputs
+
+
+def bias_eval_points(biaslevel=BIAS_LEVEL):
+    """Eval points for the bias population (covering 0 -- 2 * biaslevel)."""
+
+    return [[x * 0.01] for x in range(0, int(biaslevel * 200))]
+
 
 class PositiveBias(NetworkImpl):
     """Produces a small positive bias corresponding to any negative inputs.
@@ -29,7 +37,7 @@ class PositiveBias(NetworkImpl):
         net = nef.Network(self, seed=HRLutils.SEED, quick=False)
 
         tauPSC = 0.007
-        biaslevel = 0.03  # the value to be output for negative inputs
+        biaslevel = BIAS_LEVEL
 
         # threshold the input signal to detect positive values
         nfac = HRLutils.node_fac()
@@ -43,8 +51,7 @@ class PositiveBias(NetworkImpl):
         bias_input = net.make_input("bias_input", [biaslevel])
         bias_pop = net.make_array("bias_pop", N, d,
                                   node_factory=HRLutils.node_fac(),
-                                  eval_points=[[x * 0.01] for x in
-                                               range(0, biaslevel * 200)])
+                                  eval_points=bias_eval_points(biaslevel))
 
         net.connect(bias_input, bias_pop, pstc=tauPSC)
 
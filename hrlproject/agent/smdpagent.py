@@ -9,6 +9,10 @@ from hrlproject.misc import HRLutils
 from hrlproject.agent import bgnetwork, Qnetwork, errornetwork
 from hrlproject.simplenodes import bgnode, errornode, noisenode
 
+# subsystems that can be switched between neural and functional
+# implementations (see the backend parameter of SMDPAgent)
+SUBSYSTEMS = ["selection", "error", "memory"]
+
 
 class SMDPAgent(NetworkImpl):
     """A network that performs reinforcement learning in an SMDP environment.
@@ -28,7 +32,8 @@ class SMDPAgent(NetworkImpl):
                  learningrate=0.0, manual_control=False, optimal_control=False,
                  state_encoders=None, state_evals=None, load_weights=None,
                  discount=0.3, state_threshold=(0.0, 1.0),
-                 statediff_threshold=0.2, init_Qs=None, noiselevel=0.03):
+                 statediff_threshold=0.2, init_Qs=None, noiselevel=0.03,
+                 backend="neural"):
         """Builds the SMDPAgent network.
 
         :param stateN: number of neurons in state population
@@ -54,35 +59,83 @@ class SMDPAgent(NetworkImpl):
         :param init_Qs: initial Q values
         :param noiselevel: standard deviation of noise added to Q values for
             exploration
+        :param backend: "neural" to build all subsystems out of neurons, or
+            "functional" to replace the action selection (BGNetwork), error
+            calculation (ErrorNetwork), and memories (Memory) with SimpleNodes
+            that compute the same functions directly (much faster to build
+            and run, e.g. for parameter sweeps where only the Q value learning
+            matters). Can also be a dict mapping subsystem names (see
+            SUBSYSTEMS) to "neural" or "functional", to set each subsystem
+            individually (unspecified subsystems are neural).
         """
 
         self.name = name
         net = nef.Network(self, seed=HRLutils.SEED, quick=False)
 
+        # random streams for components in this agent will be identified by
+        # the agent name
+        # note: the scope is popped even if the build fails, so that it
+        # doesn't leak into whatever is built next
+        HRLutils.push_scope(name)
+        try:
+            self.build(net, stateN, stateD, actions, stateradius, Qradius,
+                       rewardradius, learningrate, manual_control,
+                       optimal_control, state_encoders, state_evals,
+                       load_weights, discount, state_threshold,
+                       statediff_threshold, init_Qs, noiselevel, backend)
+        finally:
+            HRLutils.pop_scope()
+
+    def build(self, net, stateN, stateD, actions, stateradius, Qradius,
+              rewardradius, learningrate, manual_control, optimal_control,
+              state_encoders, state_evals, load_weights, discount,
+              state_threshold, statediff_threshold, init_Qs, noiselevel,
+              backend):
+        """Builds the components of the network (see __init__ for the
+        parameters).
+
+        :param net: nef.Network wrapping this network
+        """
+
         # internal parameters
         num_actions = len(actions)
 
+        # which implementation to use for each subsystem
+        if isinstance(backend, dict):
+            self.backends = dict([(s, "neural") for s in SUBSYSTEMS])
+            self.backends.update(backend)
+        else:
+            self.backends = dict([(s, backend) for s in SUBSYSTEMS])
+        for s, b in self.backends.items():
+            assert s in SUBSYSTEMS, "Unknown subsystem: %s" % s
+            assert b in ("neural", "functional"), "Unknown backend: %s" % b
+
         # if True, use a simplenode to perform BG function
-        useBGNode = False
+        useBGNode = self.backends["selection"] == "functional"
 
         # if True, use a simplenode to perform error calculation
-        useErrorNode = False
+        useErrorNode = self.backends["error"] == "functional"
+
+        # if True, use simplenodes for the memories in the neural subsystems
+        functional_memory = self.backends["memory"] == "functional"
 
         # calculate Q values
         print "building Q network"
         q_net = Qnetwork.QNetwork(stateN, stateD, state_encoders, actions,
                                   learningrate, stateradius, Qradius,
                                   load_weights, state_evals, state_threshold,
-                                  statediff_threshold, init_Qs)
+                                  statediff_threshold, init_Qs,
+                                  functional_memory=functional_memory)
         net.add(q_net)
 
         # create basal ganglia
         print "building selection network"
         if not useBGNode:
-            bg = bgnetwork.BGNetwork(actions, Qradius, noiselevel)
+            bg = bgnetwork.BGNetwork(actions, Qradius, noiselevel,
+                                     functional_memory=functional_memory)
             net.add(bg)
         else:
-            bg = bgnode.BGNode(actions)
+            bg = bgnode.BGNode(actions, name="BGNetwork")
             net.add(bg)
 
             noiselevel = net.make_input("noiselevel", [noiselevel])
@@ -113,12 +166,15 @@ class SMDPAgent(NetworkImpl):
         # calculate error
         print "building error network"
         if not useErrorNode:
-            error_net = errornetwork.ErrorNetwork(num_actions, Qradius,
-                                                  rewardradius,
-                                                  discount=discount)
+            error_net = errornetwork.ErrorNetwork(
+                num_actions, Qradius, rewardradius, discount=discount,
+                functional_memory=functional_memory)
         else:
+            # note: errorcap matches the radius of the error population in
+            # ErrorNetwork
             error_net = errornode.ErrorNode(num_actions, Qradius,
-                                            discount=discount)
+                                            discount=discount, errorcap=0.1,
+                                            name="ErrorNetwork")
         net.add(error_net)
 
         net.connect(q_net.getOrigin("vals"), error_net.getTermination("vals"))
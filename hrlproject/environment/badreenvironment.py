@@ -5,7 +5,6 @@ from ca.nengo.util.impl import RandomHypersphereVG
 
 from hrlproject.environment.environmenttemplate import EnvironmentTemplate
 from hrlproject.misc import HRLutils
-from hrlproject.misc.HRLutils import rand as random
 
 
 class BadreEnvironment(EnvironmentTemplate):
@@ -27,6 +26,11 @@ class BadreEnvironment(EnvironmentTemplate):
 
         self.rewardval = 1.5
 
+        # random streams
+        self.rand_stimuli = HRLutils.stream("BadreEnvironment/stimuli")
+        self.rand_answers = HRLutils.stream("BadreEnvironment/answers")
+        self.rand_encoders = HRLutils.stream("BadreEnvironment/encoders")
+
         # actions correspond to three different button presses
         actions = [("left", [1, 0, 0]), ("middle", [0, 1, 0]),
                    ("right", [0, 0, 1])]
@@ -47,7 +51,8 @@ class BadreEnvironment(EnvironmentTemplate):
         self.rewardperiod = [self.presentationtime,
                              self.presentationtime + self.rewardtime]
 
-        self.answer = random.choice(actions)[0]  # answer selected by agent
+        # answer selected by agent
+        self.answer = self.rand_stimuli.choice(actions)[0]
 
         self.stateD = (self.num_orientations + self.num_shapes +
                        self.num_colours)
@@ -75,7 +80,7 @@ class BadreEnvironment(EnvironmentTemplate):
             # pick a random stimuli at beginning of presentation period
             # and set that as the current state for the duration of
             # the presentation period
-            self.state = random.choice(self.answers.keys())
+            self.state = self.rand_stimuli.choice(self.answers.keys())
             self.answer = self.answers[self.state]
             self.state = list(self.state)
 
@@ -127,7 +132,7 @@ class BadreEnvironment(EnvironmentTemplate):
             responses = (["left" for _ in range(len(stimuli) / 3)] +
                          ["middle" for _ in range(len(stimuli) / 3)] +
                          ["right" for _ in range(len(stimuli) / 3)])
-            random.shuffle(responses)
+            self.rand_answers.shuffle(responses)
             for stim in stimuli:
                 answers[tuple(stim)] = responses.pop()
         else:
@@ -167,8 +172,8 @@ class BadreEnvironment(EnvironmentTemplate):
                  for c in MU.I(self.num_colours)])
 
         return [HRLutils.normalize(
-            HRLutils.normalize(random.choice(encs)) +
-            [x * context_scale for x in random.choice(contexts)])
+            HRLutils.normalize(self.rand_encoders.choice(encs)) +
+            [x * context_scale for x in self.rand_encoders.choice(contexts)])
             for _ in range(N)]
 
         # random encoders
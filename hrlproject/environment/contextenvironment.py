@@ -6,7 +6,6 @@ from ca.nengo.util import MU
 
 from hrlproject.environment.placecell_bmp import PlaceCellEnvironment
 from hrlproject.misc import HRLutils
-from hrlproject.misc.HRLutils import rand as random
 
 
 class ContextEnvironment(PlaceCellEnvironment):
@@ -40,13 +39,15 @@ class ContextEnvironment(PlaceCellEnvironment):
                                       name="ContextEnvironment", **kwargs)
 
         self.rewards = context_rewards
+        self.rand_context = HRLutils.stream("ContextEnvironment/context")
 
         # generate vectors representing each context
         self.contexts = {}  # mapping from region label to context vector
         for i, r in enumerate(self.rewards):
             self.contexts[r] = list(MU.I(contextD)[i])
 
-        self.context = self.contexts[random.choice(self.contexts.keys())]
+        self.context = self.contexts[self.rand_context.choice(
+            self.contexts.keys())]
 
         # randomly pick a new context every context_delay seconds
         self.context_delay = 60
@@ -77,7 +78,8 @@ class ContextEnvironment(PlaceCellEnvironment):
 
     def update_context(self):
         if self.t > self.context_update:
-            self.context = self.contexts[random.choice(self.contexts.keys())]
+            self.context = self.contexts[self.rand_context.choice(
+                self.contexts.keys())]
             self.context_update = self.t + self.context_delay
 
     def gen_encoders(self, N, contextD, context_scale):
@@ -89,7 +91,8 @@ class ContextEnvironment(PlaceCellEnvironment):
         """
 
         s_encoders = PlaceCellEnvironment.gen_encoders(self, N)
-        c_encoders = [random.choice(MU.I(contextD)) for _ in range(N)]
+        c_encoders = [self.rand_encoders.choice(MU.I(contextD))
+                      for _ in range(N)]
         c_encoders = [[x * context_scale for x in enc] for enc in c_encoders]
         encoders = [s + list(c) for s, c in zip(s_encoders, c_encoders)]
         encoders = [[x / math.sqrt(sum([y ** 2 for y in e])) for x in e]
@@ -9,7 +9,6 @@ from ca.nengo.util import MU
 
 from hrlproject.environment.placecell_bmp import PlaceCellEnvironment
 from hrlproject.misc import HRLutils
-from hrlproject.misc.HRLutils import rand as random
 
 
 class DeliveryEnvironment(PlaceCellEnvironment):
@@ -77,7 +76,8 @@ class DeliveryEnvironment(PlaceCellEnvironment):
         """
 
         s_encoders = PlaceCellEnvironment.gen_encoders(self, N)
-        c_encoders = [random.choice(MU.I(contextD)) for _ in range(N)]
+        c_encoders = [self.rand_encoders.choice(MU.I(contextD))
+                      for _ in range(N)]
         c_encoders = [[x * context_scale for x in enc] for enc in c_encoders]
         encoders = [s + list(c) for s, c in zip(s_encoders, c_encoders)]
         encoders = [[x / math.sqrt(sum([y ** 2 for y in e])) for x in e]
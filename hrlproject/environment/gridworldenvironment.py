@@ -1,9 +1,9 @@
 # Copyright 2014, Daniel Rasmussen.  All rights reserved.
 
-import random
 import copy
 
 from hrlproject.environment import environmenttemplate as et
+from hrlproject.misc import HRLutils
 
 
 class GridWorldEnvironment(et.EnvironmentTemplate):
@@ -37,6 +37,8 @@ class GridWorldEnvironment(et.EnvironmentTemplate):
 
         et.EnvironmentTemplate.__init__(self, name, stateD, actions)
 
+        self.rand = HRLutils.stream(name)
+
         self.cartesian = cartesian
         self.delay = delay
         self.update_time = 0.5
@@ -105,8 +107,8 @@ class GridWorldEnvironment(et.EnvironmentTemplate):
             if isinstance(self.delay, float):
                 self.update_time = self.t + self.delay
             else:
-                self.update_time = self.t + random.uniform(self.delay[0],
-                                                           self.delay[1])
+                self.update_time = self.t + self.rand.uniform(self.delay[0],
+                                                              self.delay[1])
 
             self.stepcount += 1
 
@@ -196,7 +198,7 @@ class GridWorldEnvironment(et.EnvironmentTemplate):
 
     def pickRandomLocation(self):
         while True:
-            cell = random.choice(random.choice(self.grid))
+            cell = self.rand.choice(self.rand.choice(self.grid))
             if not cell.wall and not cell.target:
                 return cell.location()
 
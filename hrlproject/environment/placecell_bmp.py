@@ -1,6 +1,7 @@
 # Copyright 2014, Daniel Rasmussen.  All rights reserved.
 
 import math
+import os
 
 from javax.imageio import ImageIO
 from java.io import File
@@ -9,7 +10,6 @@ from java.awt.image import BufferedImage
 
 from hrlproject.environment.environmenttemplate import EnvironmentTemplate
 from hrlproject.misc import HRLutils
-from hrlproject.misc.HRLutils import rand as random
 
 
 class PlaceCellEnvironment(EnvironmentTemplate):
@@ -42,6 +42,18 @@ class PlaceCellEnvironment(EnvironmentTemplate):
 
         EnvironmentTemplate.__init__(self, name, 2, actions)
 
+        # random streams
+        # note: the place cell stream is keyed by the map (rather than the
+        # environment name), so that all environments using the same map
+        # have the same place cells (e.g. the eval points generated with a
+        # ContextEnvironment need to match the DeliveryEnvironment). Only
+        # the file name is used, so the place cells don't depend on where
+        # the code is checked out.
+        self.rand_places = HRLutils.stream("placecells/" +
+                                           os.path.basename(mapname))
+        self.rand_encoders = HRLutils.stream(name + "/encoders")
+        self.rand_location = HRLutils.stream(name + "/location")
+
         # parameters
         self.colormap = colormap
         self.rewardamount = 0  # number of timesteps spent in reward
@@ -80,9 +92,7 @@ class PlaceCellEnvironment(EnvironmentTemplate):
         self.update_state()
 
         # update place cell activations
-        dists = [self.calc_dist(self.state, l) for l in self.placecells]
-        self.place_activations = [math.exp(-d ** 2 / (2 * self.placedev ** 2))
-                                  for d in dists]
+        self.place_activations = self.calc_place_activations(self.state)
 
         self.update_reward()
 
@@ -121,18 +131,25 @@ class PlaceCellEnvironment(EnvironmentTemplate):
         else:
             self.reward = self.defaultreward
 
-    def random_location(self, avoid=[]):
+    def random_location(self, avoid=[], rand=None):
         """Pick a random location, avoiding regions with the specified
-        labels."""
+        labels.
+
+        :param avoid: list of labels to avoid
+        :param rand: random stream to use (defaults to the location stream)
+        """
 
-        pt = (random.uniform(-self.imgsize[0] / 2.0, self.imgsize[0] / 2.0),
-              random.uniform(-self.imgsize[1] / 2.0, self.imgsize[1] / 2.0))
+        if rand is None:
+            rand = self.rand_location
+
+        pt = (rand.uniform(-self.imgsize[0] / 2.0, self.imgsize[0] / 2.0),
+              rand.uniform(-self.imgsize[1] / 2.0, self.imgsize[1] / 2.0))
 
         while any([self.is_in(pt, s) for s in avoid]):
-            pt = (random.uniform(-self.imgsize[0] / 2.0,
-                                 self.imgsize[0] / 2.0),
-                  random.uniform(-self.imgsize[1] / 2.0,
-                                 self.imgsize[1] / 2.0))
+            pt = (rand.uniform(-self.imgsize[0] / 2.0,
+                               self.imgsize[0] / 2.0),
+                  rand.uniform(-self.imgsize[1] / 2.0,
+                               self.imgsize[1] / 2.0))
 
         return pt
 
@@ -153,12 +170,23 @@ class PlaceCellEnvironment(EnvironmentTemplate):
 
         return x, y
 
+    def get_label(self, pt):
+        """Returns the label of the region containing the point."""
+
+        x, y = self.pt_to_pixel(pt)
+
+        return self.colormap[self.map.getRGB(x, y)]
+
     def is_in(self, pt, label):
         """Returns true if the point is in a region with the given label."""
 
-        x, y = self.pt_to_pixel(pt)
+        return self.get_label(pt) == label
+
+    def calc_place_activations(self, pt):
+        """Returns the activation of each place cell at the given point."""
 
-        return self.colormap[self.map.getRGB(x, y)] == label
+        dists = [self.calc_dist(pt, l) for l in self.placecells]
+        return [math.exp(-d ** 2 / (2 * self.placedev ** 2)) for d in dists]
 
     def calc_dist(self, p1, p2):
         return math.sqrt((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2)
@@ -211,16 +239,17 @@ class PlaceCellEnvironment(EnvironmentTemplate):
         num_tries = 1000
 
         # assign random x,y locations to each neuron
-        locations = [self.random_location(avoid=["wall"])]
+        rand = self.rand_places
+        locations = [self.random_location(avoid=["wall"], rand=rand)]
         while True:
             # generate a random new point
-            new_loc = self.random_location(avoid=["wall"])
+            new_loc = self.random_location(avoid=["wall"], rand=rand)
 
             # check that the point isn't too close to previous points
             count = 0
             while min([self.calc_dist(new_loc, l)
                        for l in locations]) < min_spread and count < num_tries:
-                new_loc = self.random_location(avoid=["wall"])
+                new_loc = self.random_location(avoid=["wall"], rand=rand)
                 count += 1
 
             # add the new point
@@ -242,7 +271,7 @@ class PlaceCellEnvironment(EnvironmentTemplate):
         for i in range(N):
             # pick a random point for the neuron
             # note: could make this avoid walls if we want
-            pt = self.random_location()
+            pt = self.random_location(rand=self.rand_encoders)
 
             # set the encoder to be the inverse of the distance from each
             # placecell to that point
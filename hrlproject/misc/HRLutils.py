@@ -13,13 +13,33 @@ import time
 from ca.nengo.model.nef.impl import NEFEnsembleFactoryImpl
 from ca.nengo.model import SimulationMode
 from ca.nengo.model.neuron.impl import LIFNeuronFactory
+from ca.nengo.math import PDFTools
 from ca.nengo.math.impl import IndicatorPDF
+from hrlproject.misc import (decodercache, decodersolver, evalpoints,
+                             vectorgenerators)
 
 SIMULATION_MODE = SimulationMode.RATE  # default simulation mode
 SEED = 0  # random seed
+DECODER_CACHE = True  # whether to use the decoder cache (see decodercache)
+# whether to solve for the state population decoders with decodersolver
+# rather than Nengo's solver (see make_ensemble)
+DECODER_SOLVER = False
 
-# all random number generation should be done through this generator
-# (so we can control it all with a single seed)
+# base number of neurons for the ensembles in the agent networks (most
+# ensembles use a multiple of this, see also sizing)
+BASE_N = 50
+
+# policy for number of eval points in the default ensemble factory, "fixed"
+# (see num_eval_points) or "adaptive" (see evalpoints)
+EVAL_POINTS = "fixed"
+EVAL_POINT_OVERRIDES = {}  # ensemble name -> number of eval points
+# ensemble name (or name prefix) -> function decoded from the ensemble, which
+# the adaptive policy calibrates against (see evalpoints)
+EVAL_POINT_TARGETS = {"mpop_": evalpoints.product}
+
+# general purpose random number generator (controlled by SEED). model
+# components should use their own stream instead (see stream), so that the
+# numbers they get don't depend on what else is in the model
 rand = random.Random()
 rand.seed(SEED)
 
@@ -30,22 +50,251 @@ def set_seed(seed):
     rand.seed(SEED)
 
 
+MASK64 = (1 << 64) - 1
+GOLDEN64 = 0x9E3779B97F4A7C15
+
+
+def _mix64(z):
+    # splitmix64 finalizer
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+def _hash64(s):
+    # 64 bit FNV-1a hash of a string (unlike hash(), this is the same on
+    # every platform and run)
+    h = 0xCBF29CE484222325
+    for c in s:
+        h = ((h ^ ord(c)) * 0x100000001B3) & MASK64
+    return h
+
+
+class RandomStream:
+    """A reproducible stream of random numbers identified by a seed and a
+    path (e.g. "NavAgent/NoiseNode").
+
+    The n'th number in the stream is computed directly from (seed, path, n),
+    so streams are independent of each other. That is, the numbers a
+    component gets don't depend on what other components exist, or the order
+    in which they are built or run (e.g. in different threads).
+
+    Note that a single stream should only be used by one component.
+    """
+
+    def __init__(self, path, seed=None):
+        """Initialize stream.
+
+        :param path: name identifying this stream
+        :param seed: seed for stream (if None, uses SEED)
+        """
+
+        if seed is None:
+            seed = SEED
+        self.path = path
+        self.seed = seed
+        self.key = _mix64((_hash64(path) ^ _mix64(seed & MASK64)) & MASK64)
+        self.counter = 0
+
+    def reset(self):
+        """Go back to the beginning of the stream."""
+
+        self.counter = 0
+
+    def random(self):
+        """Returns a random float in [0, 1)."""
+
+        i = self.counter
+        self.counter += 1
+        x = _mix64((self.key + (i + 1) * GOLDEN64) & MASK64)
+        return (x >> 11) * (1.0 / (1 << 53))
+
+    def block(self, n):
+        """Returns a list of n random floats in [0, 1) (the same as calling
+        random n times)."""
+
+        key = self.key
+        start = self.counter
+        self.counter += n
+        scale = 1.0 / (1 << 53)
+        return [(_mix64((key + (i + 1) * GOLDEN64) & MASK64) >> 11) * scale
+                for i in range(start, start + n)]
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    def randint(self, a, b):
+        """Returns a random int in [a, b] (including both end points)."""
+
+        return a + int(self.random() * (b - a + 1))
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def shuffle(self, x):
+        """Shuffle list x in place."""
+
+        for i in reversed(range(1, len(x))):
+            j = int(self.random() * (i + 1))
+            x[i], x[j] = x[j], x[i]
+
+    def gauss(self, mu=0.0, sigma=1.0):
+        return self.gauss_block(1, mu, sigma)[0]
+
+    def gauss_block(self, n, mu=0.0, sigma=1.0):
+        """Returns a list of n gaussian random values (the same as calling
+        gauss n times).
+
+        Uses the Box-Muller transform (two uniform values per gaussian
+        value).
+        """
+
+        u = self.block(2 * n)
+        return [mu + sigma * math.sqrt(-2.0 * math.log(1.0 - u[i])) *
+                math.cos(2 * math.pi * u[i + 1])
+                for i in range(0, 2 * n, 2)]
+
+
+# current scope (e.g. the name of the agent being built) used to prefix stream
+# paths, tracked separately for each thread so that components can be built in
+# parallel
+_scope = threading.local()
+
+
+def _scope_stack():
+    if not hasattr(_scope, "stack"):
+        _scope.stack = []
+    return _scope.stack
+
+
+def push_scope(name):
+    _scope_stack().append(name)
+
+
+def pop_scope():
+    _scope_stack().pop()
+
+
+# returns the random stream with the given name (in the current scope)
+def stream(name, seed=None):
+    return RandomStream("/".join(_scope_stack() + [name]), seed)
+
+
+# number of eval points for a d dimensional ensemble (more than normal)
+def num_eval_points(d):
+    pointsPerDim = [0, 1000, 2000]
+    if d < 3:
+        return(pointsPerDim[d])
+    else:
+        return(d * 500)
+
+
 # default ensemble factory used in the model
 def defaultEnsembleFactory():
     # an NEF ensemble factory with more evaluation points than normal
     class NEFMorePoints(NEFEnsembleFactoryImpl):
         def getNumEvalPoints(self, d):
-            pointsPerDim = [0, 1000, 2000]
-            if d < 3:
-                return(pointsPerDim[d])
-            else:
-                return(d * 500)
-    ef = NEFMorePoints()
+            return(num_eval_points(d))
+
+    if EVAL_POINTS == "adaptive":
+        ef = evalpoints.AdaptiveEnsembleFactory(
+            num_eval_points, overrides=EVAL_POINT_OVERRIDES,
+            targets=EVAL_POINT_TARGETS)
+    else:
+        ef = NEFMorePoints()
     ef.nodeFactory = node_fac()
+    install_cache(ef)
     ef.beQuiet()
     return(ef)
 
 
+# wrap the approximator factory of ef with the decoder cache (if it is on and
+# not already installed)
+def install_cache(ef):
+    if DECODER_CACHE and not isinstance(
+            ef.getApproximatorFactory(),
+            decodercache.CachedApproximatorFactory):
+        ef.setApproximatorFactory(decodercache.CachedApproximatorFactory(
+            ef.getApproximatorFactory()))
+
+
+# the model's versions of Nengo's ensemble factory, with the decoder cache
+# installed and (for the adaptive version) the eval point policy applied
+# note: the cache is installed in make (rather than in __init__) so that it
+# wraps whatever approximator factory has been set by then
+class CachedEnsembleFactory(NEFEnsembleFactoryImpl):
+    def make(self, name, n, radii):
+        install_cache(self)
+        return NEFEnsembleFactoryImpl.make(self, name, n, radii)
+
+
+class AdaptiveCachedEnsembleFactory(evalpoints.AdaptiveEnsembleFactory):
+    def __init__(self):
+        evalpoints.AdaptiveEnsembleFactory.__init__(
+            self, num_eval_points, overrides=EVAL_POINT_OVERRIDES,
+            targets=EVAL_POINT_TARGETS)
+
+    def make(self, name, n, radii):
+        install_cache(self)
+        return evalpoints.AdaptiveEnsembleFactory.make(self, name, n, radii)
+
+
+# returns the model's ensemble factory class for the current eval point
+# policy (see EVAL_POINTS)
+def model_factory_class():
+    if EVAL_POINTS == "adaptive":
+        return AdaptiveCachedEnsembleFactory
+    return CachedEnsembleFactory
+
+
+# ensemble factory with Nengo's default settings, but with the decoder cache
+# and eval point policy (for code that builds ensembles with its own factory
+# rather than net.make, e.g. Eprod)
+def modelEnsembleFactory():
+    ef = model_factory_class()()
+    ef.beQuiet()
+    return ef
+
+
+# seed for the next ensemble in net, drawn in the same way as nef.Network.make
+# does (so that building an ensemble with make_ensemble rather than net.make
+# doesn't change its parameters, or those of the ensembles built after it)
+def ensemble_seed(net):
+    if getattr(net, "fixed_seed", None) is not None:
+        return net.fixed_seed
+    if getattr(net, "seed", None) is not None:
+        return net.random.randrange(0x7fffffff)
+    return None
+
+
+# make an ensemble with the model's ensemble factory (see modelEnsembleFactory)
+# and add it to net, seeded in the same way as net.make (takes a subset of the
+# arguments of net.make, node_factory defaults to node_fac()). if
+# decoder_solver is True, the decoders for all the ensemble's origins are
+# solved with decodersolver rather than Nengo's solver.
+def make_ensemble(net, name, N, d, radius=1.0, node_factory=None,
+                  encoders=None, eval_points=None, decoder_solver=False):
+    ef = modelEnsembleFactory()
+    ef.nodeFactory = node_factory or node_fac()
+    if decoder_solver:
+        # note: the decoder cache wraps this when the ensemble is made
+        ef.setApproximatorFactory(decodersolver.SolverApproximatorFactory())
+    if encoders is not None:
+        ef.setEncoderFactory(vectorgenerators.FixedVectorGenerator(encoders))
+    if eval_points is not None:
+        ef.setEvalPointFactory(
+            vectorgenerators.FixedVectorGenerator(eval_points))
+
+    seed = ensemble_seed(net)
+    if seed is not None:
+        PDFTools.setSeed(seed)
+        random.seed(seed)
+
+    ens = ef.make(name, N, [radius for _ in range(d)])
+    net.add(ens)
+    return ens
+
+
 # default node factory used in the model
 def node_fac():
     tauRC = 0.02
@@ -0,0 +1,289 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+"""Profiler for the construction of a model.
+
+enable() wraps the constructor of every NetworkImpl subclass in
+hrlproject.agent, and the functions that create ensembles
+(nef.Network.make, nef.Network.make_array, and HRLutils.make_ensemble), so
+that each call records its wall time. Calls made while another one is in
+progress are recorded as its children, giving a hierarchical breakdown of
+the build time (e.g. SMDPAgent -> QNetwork -> state_pop). Other functions
+(e.g. loading eval points) can be added as build phases.
+
+For each node the report gives the total and self (excluding children)
+wall time, number of neurons, dimensions, number of eval points, and time
+spent solving for decoders. Decoder solve time is only available for
+ensembles whose decoders go through the decoder cache (see decodercache and
+HRLutils.DECODER_CACHE), it includes the time for decoders solved in the
+node's constructor after the ensembles are made (e.g. addDecodedOrigin), and
+the time for cache lookups (the number of cache hits and misses is also
+recorded).
+
+The report is emitted when the model is first run or viewed (see
+nef.Network.run/view/add_to_nengo), i.e. at the end of construction, or
+can be generated directly with report(). It is printed, and saved as text
+(filename.txt) and as tab separated values (filename.tsv) with one row per
+node.
+"""
+
+import inspect
+import time
+
+import nef
+
+from ca.nengo.model.impl import NetworkImpl
+
+from hrlproject.misc import HRLutils, decodercache
+from hrlproject.agent import (smdpagent, Qnetwork, bgnetwork, errornetwork,
+                              memory, actionvalues, eprod, positivebias,
+                              errorcalc, errorcalc2)
+
+NETWORK_MODULES = [smdpagent, Qnetwork, bgnetwork, errornetwork, memory,
+                   actionvalues, eprod, positivebias, errorcalc, errorcalc2]
+
+COLUMNS = ["path", "kind", "time", "self_time", "neurons", "dimensions",
+           "eval_points", "solve_time", "cache_hits", "cache_misses"]
+
+
+class Frame:
+    """Record of one profiled call."""
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.children = []
+
+        self.start = time.time()
+        self.solve_start = decodercache.stats["time"]
+        self.hits_start = decodercache.stats["hits"]
+        self.misses_start = decodercache.stats["misses"]
+        self.time = None
+        self.solve_time = None
+        self.cache_hits = None
+        self.cache_misses = None
+
+        self.neurons = None
+        self.dimensions = None
+        self.eval_points = None
+
+    def finish(self):
+        self.time = time.time() - self.start
+        self.solve_time = decodercache.stats["time"] - self.solve_start
+        self.cache_hits = decodercache.stats["hits"] - self.hits_start
+        self.cache_misses = decodercache.stats["misses"] - self.misses_start
+
+    def self_time(self):
+        return self.time - sum([c.time for c in self.children])
+
+    def describe(self, obj):
+        """Record the size of the network/ensemble obj."""
+
+        if obj is None:
+            return
+        if hasattr(obj, "getName"):
+            self.name = obj.getName()
+        for attr, method in [("neurons", "countNeurons"),
+                             ("neurons", "getNeurons"),
+                             ("dimensions", "getDimension")]:
+            if getattr(self, attr) is None and hasattr(obj, method):
+                try:
+                    setattr(self, attr, getattr(obj, method)())
+                except Exception:
+                    pass
+        if hasattr(obj, "getEvalPoints"):
+            try:
+                self.eval_points = len(obj.getEvalPoints())
+            except Exception:
+                pass
+
+
+# profiler state
+roots = []  # top level frames
+stack = []  # frames currently in progress
+patched = []  # (owner, attribute, original value) of the wrapped functions
+options = {"filename": None, "reported": False}
+
+
+def wrap(owner, attr, kind, describe_result=True):
+    """Replace owner.attr with a version that records a Frame for each call.
+
+    :param owner: class or module
+    :param attr: name of the function to wrap
+    :param kind: kind of node (e.g. "network", "ensemble", or "phase")
+    :param describe_result: if True, the size of the returned object is
+        recorded (see Frame.describe)
+    """
+
+    original = getattr(owner, attr)
+
+    def wrapper(*args, **kwargs):
+        frame = push(attr, kind)
+        result = None
+        try:
+            result = original(*args, **kwargs)
+        finally:
+            pop(frame)
+            if kind == "network":
+                # note: for constructors, describe the new network (self)
+                frame.describe(args[0])
+            elif describe_result:
+                frame.describe(result)
+        return result
+
+    # note: storing the entry from the owner's own namespace (if it has one),
+    # so that restore doesn't turn inherited methods into local ones
+    patched.append((owner, attr, vars(owner).get(attr)))
+    setattr(owner, attr, wrapper)
+
+
+def push(name, kind):
+    frame = Frame(name, kind)
+    if len(stack) > 0:
+        stack[-1].children += [frame]
+    else:
+        roots.append(frame)
+    stack.append(frame)
+    return frame
+
+
+def pop(frame):
+    frame.finish()
+    while len(stack) > 0 and stack.pop() is not frame:
+        # note: this shouldn't happen, but if it does (e.g. an exception
+        # escaped between push and pop) don't leave stale frames
+        pass
+
+
+def network_classes():
+    """Returns the NetworkImpl subclasses defined in NETWORK_MODULES."""
+
+    classes = []
+    for module in NETWORK_MODULES:
+        for obj in vars(module).values():
+            if (inspect.isclass(obj) and issubclass(obj, NetworkImpl) and
+                    obj.__module__ == module.__name__):
+                classes += [obj]
+    return classes
+
+
+def enable(filename=None, phases=None):
+    """Start profiling.
+
+    :param filename: base name for the report files (defaults to
+        data/buildprofile)
+    :param phases: list of (owner, attribute) pairs for additional functions
+        to profile as build phases (e.g. [(run, "load_evalpoints")])
+    """
+
+    if len(patched) > 0:
+        return
+
+    options["filename"] = filename or HRLutils.datafile("buildprofile")
+    options["reported"] = False
+
+    for cls in network_classes():
+        wrap(cls, "__init__", "network")
+    wrap(nef.Network, "make", "ensemble")
+    wrap(nef.Network, "make_array", "ensemble")
+    wrap(HRLutils, "make_ensemble", "ensemble")
+    for owner, attr in phases or []:
+        wrap(owner, attr, "phase", describe_result=False)
+
+    # emit the report when construction is finished
+    for attr in ["run", "view", "add_to_nengo"]:
+        wrap_finish(nef.Network, attr)
+
+
+def wrap_finish(owner, attr):
+    """Make owner.attr generate the report (the first time it is called)."""
+
+    original = getattr(owner, attr)
+
+    def wrapper(*args, **kwargs):
+        if not options["reported"]:
+            options["reported"] = True
+            report()
+        return original(*args, **kwargs)
+
+    patched.append((owner, attr, vars(owner).get(attr)))
+    setattr(owner, attr, wrapper)
+
+
+def disable():
+    """Stop profiling (restores the wrapped functions)."""
+
+    while len(patched) > 0:
+        owner, attr, original = patched.pop()
+        if original is None:
+            delattr(owner, attr)
+        else:
+            setattr(owner, attr, original)
+
+
+def reset():
+    """Clear the recorded frames."""
+
+    del roots[:]
+    del stack[:]
+
+
+def rows(frames=None, path=""):
+    """Flatten the frame tree.
+
+    :returns: list of (depth, path, frame) tuples
+    """
+
+    if frames is None:
+        frames = roots
+    result = []
+    for f in frames:
+        p = path + "/" + f.name
+        result += [(p.count("/") - 1, p, f)]
+        result += rows(f.children, p)
+    return result
+
+
+def fmt(val, spec="%d"):
+    if val is None:
+        return "-"
+    return spec % val
+
+
+def report(filename=None):
+    """Print the profile and save it to filename.txt and filename.tsv.
+
+    :param filename: base name for the report files (defaults to the one
+        given to enable)
+    """
+
+    filename = filename or options["filename"] or HRLutils.datafile(
+        "buildprofile")
+    flat = [r for r in rows() if r[2].time is not None]
+
+    lines = []
+    for depth, _, f in flat:
+        lines += ["%s%s [%s]: %.2fs (self %.2fs), %s neurons, %sD, "
+                  "%s eval points, solve %ss" %
+                  ("  " * depth, f.name, f.kind, f.time, f.self_time(),
+                   fmt(f.neurons), fmt(f.dimensions), fmt(f.eval_points),
+                   fmt(f.solve_time, "%.2f"))]
+    total = sum([f.time for f in roots if f.time is not None])
+    lines += ["total: %.2fs, solve %.2fs (cache hits %d, misses %d)" %
+              (total, decodercache.stats["time"], decodercache.stats["hits"],
+               decodercache.stats["misses"])]
+
+    print "\n".join(lines)
+
+    f = open(filename + ".txt", "w")
+    f.write("\n".join(lines) + "\n")
+    f.close()
+
+    f = open(filename + ".tsv", "w")
+    f.write("\t".join(COLUMNS) + "\n")
+    for _, path, fr in flat:
+        f.write("\t".join([path, fr.kind, "%.6f" % fr.time,
+                           "%.6f" % fr.self_time(), fmt(fr.neurons),
+                           fmt(fr.dimensions), fmt(fr.eval_points),
+                           fmt(fr.solve_time, "%.6f"), fmt(fr.cache_hits),
+                           fmt(fr.cache_misses)]) + "\n")
+    f.close()
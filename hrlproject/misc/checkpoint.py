@@ -0,0 +1,270 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+"""Binary checkpoint files for model parameters (e.g. decoders/encoders).
+
+File format (big-endian):
+
+- header: the string "HRLC", format version (int), code version (UTF
+  string), seed (long), number of arrays (int)
+- for each array: name (UTF string), dtype ("f" for float32 or "d" for
+  float64, one byte), number of rows (int), number of columns (int),
+  followed by the data (row-major)
+
+Files are written to a temporary file and then renamed, so a checkpoint file
+is always complete (even if the process is killed in the middle of a save).
+When older checkpoints are kept (see save and rotate), they are only shifted
+once the new file has been written, so a failed save never loses the newest
+checkpoint.
+"""
+
+import os
+import shutil
+import sys
+
+import jarray
+
+from java.io import (File, FileOutputStream, RandomAccessFile,
+                     ByteArrayOutputStream, DataOutputStream)
+from java.nio import ByteBuffer
+
+from hrlproject.misc import HRLutils
+
+try:
+    from java.nio.file import Paths, Files, StandardCopyOption
+except ImportError:
+    # java < 7
+    Files = None
+
+MAGIC = "HRLC"
+FORMAT_VERSION = 1
+
+# version of the model code that generated the parameters (increment this
+# when a change to the model means that old parameters are no longer valid)
+CODE_VERSION = "1"
+
+DTYPES = {"f4": "f", "f8": "d"}
+
+
+def save(filename, arrays, dtype="f8", seed=None, keep=1):
+    """Save arrays to a checkpoint file.
+
+    :param filename: name of file to save to
+    :param arrays: list of (name, matrix) tuples (matrices can be Java arrays
+        or lists of lists)
+    :param dtype: "f8" to store values as doubles, or "f4" to store them as
+        floats (note: Nengo decoders/encoders are floats anyway, so this is
+        lossless for them)
+    :param seed: seed stored in the header (defaults to HRLutils.SEED)
+    :param keep: total number of checkpoints to keep (if > 1, the existing
+        checkpoints are shifted to filename.1, filename.2 ..., see rotate)
+    """
+
+    if seed is None:
+        seed = HRLutils.SEED
+    code = DTYPES[dtype]
+    itemsize = 4 if code == "f" else 8
+
+    # header
+    header = ByteArrayOutputStream()
+    out = DataOutputStream(header)
+    out.writeBytes(MAGIC)
+    out.writeInt(FORMAT_VERSION)
+    out.writeUTF(CODE_VERSION)
+    out.writeLong(seed)
+    out.writeInt(len(arrays))
+    for name, data in arrays:
+        out.writeUTF(name)
+        out.writeByte(ord(code))
+        out.writeInt(len(data))
+        out.writeInt(len(data[0]) if len(data) > 0 else 0)
+    out.flush()
+
+    # data
+    size = sum([len(data) * (len(data[0]) if len(data) > 0 else 0)
+                for _, data in arrays])
+    buf = ByteBuffer.allocate(header.size() + size * itemsize)
+    buf.put(header.toByteArray())
+    for _, data in arrays:
+        if code == "f":
+            view = buf.asFloatBuffer()
+        else:
+            view = buf.asDoubleBuffer()
+        for row in data:
+            # note: bulk put of the whole row (this is much faster than
+            # writing values one at a time)
+            view.put(jarray.array(row, code))
+        buf.position(buf.position() + view.position() * itemsize)
+
+    # write to a temporary file, then rename
+    # note: the old checkpoints are only rotated once the new file is
+    # complete, so if the write fails the existing files are untouched
+    tmpname = filename + ".tmp"
+    f = FileOutputStream(tmpname)
+    try:
+        f.write(buf.array())
+        f.getFD().sync()
+    finally:
+        f.close()
+    if keep > 1:
+        rotate(filename, keep)
+    replace_file(tmpname, filename)
+
+
+def replace_file(src, dst):
+    """Rename src to dst, replacing dst (atomically, where possible)."""
+
+    if Files is not None:
+        try:
+            Files.move(Paths.get(src), Paths.get(dst),
+                       [StandardCopyOption.ATOMIC_MOVE])
+        except Exception:
+            # atomic moves aren't supported on some platforms/filesystems
+            Files.move(Paths.get(src), Paths.get(dst),
+                       [StandardCopyOption.REPLACE_EXISTING])
+        return
+
+    if not File(src).renameTo(File(dst)):
+        # note: renameTo won't replace an existing file on some platforms
+        File(dst).delete()
+        if not File(src).renameTo(File(dst)):
+            raise IOError("could not rename %s to %s" % (src, dst))
+
+
+def rotate(filename, keep):
+    """Shift existing checkpoints to make room for a new one (filename ->
+    filename.1 -> filename.2 ...), keeping at most keep - 1 old files.
+
+    The newest checkpoint is copied (rather than renamed) to filename.1, so
+    filename still exists until the new checkpoint replaces it.
+
+    :param filename: name of the newest checkpoint file
+    :param keep: total number of checkpoints to keep (including the one
+        about to be saved to filename)
+    """
+
+    for i in range(keep - 1, 0, -1):
+        if i == 1:
+            src = filename
+        else:
+            src = "%s.%d" % (filename, i - 1)
+        if not os.path.exists(src):
+            continue
+        if i == 1:
+            copy_file(src, "%s.%d" % (filename, i))
+        else:
+            replace_file(src, "%s.%d" % (filename, i))
+
+
+def copy_file(src, dst):
+    """Copy src to dst, replacing dst (via a temporary file, so dst is
+    always complete)."""
+
+    tmpname = dst + ".tmp"
+    if Files is not None:
+        Files.copy(Paths.get(src), Paths.get(tmpname),
+                   [StandardCopyOption.REPLACE_EXISTING])
+    else:
+        shutil.copyfile(src, tmpname)
+    replace_file(tmpname, dst)
+
+
+def load(filename):
+    """Load a checkpoint file.
+
+    :returns: header (dict with keys "version", "code_version", "seed",
+        "shapes", and "dtypes") and a dict mapping array names to matrices
+        (lists of Java arrays)
+    """
+
+    f = RandomAccessFile(filename, "r")
+    try:
+        data = jarray.zeros(f.length(), "b")
+        f.readFully(data)
+    finally:
+        f.close()
+    buf = ByteBuffer.wrap(data)
+
+    magic = "".join([chr(buf.get()) for _ in range(4)])
+    if magic != MAGIC:
+        raise IOError("%s is not a checkpoint file" % filename)
+
+    header = {"version": buf.getInt()}
+    header["code_version"] = _read_utf(buf)
+    header["seed"] = buf.getLong()
+
+    entries = []
+    for _ in range(buf.getInt()):
+        name = _read_utf(buf)
+        code = chr(buf.get())
+        entries += [(name, code, buf.getInt(), buf.getInt())]
+    header["shapes"] = dict([(e[0], (e[2], e[3])) for e in entries])
+    header["dtypes"] = dict([(e[0], e[1]) for e in entries])
+
+    arrays = {}
+    for name, code, rows, cols in entries:
+        if code == "f":
+            view = buf.asFloatBuffer()
+            itemsize = 4
+        else:
+            view = buf.asDoubleBuffer()
+            itemsize = 8
+
+        matrix = []
+        for _ in range(rows):
+            row = jarray.zeros(cols, code)
+            view.get(row)
+            matrix += [row]
+        buf.position(buf.position() + rows * cols * itemsize)
+
+        arrays[name] = matrix
+
+    return header, arrays
+
+
+def as_float(matrix):
+    """Convert a matrix loaded from a checkpoint to Java float arrays (e.g.
+    for setDecoders/setEncoders)."""
+
+    return [row if row.typecode == "f" else jarray.array(row, "f")
+            for row in matrix]
+
+
+def _read_utf(buf):
+    # read a string written by DataOutputStream.writeUTF
+    n = buf.getShort() & 0xFFFF
+    s = jarray.zeros(n, "b")
+    buf.get(s)
+    return s.tostring().decode("utf-8")
+
+
+def convert_text(prefix, dtype="f8"):
+    """Convert the text parameter files saved by older versions of
+    QNetwork.saveParams to a checkpoint file.
+
+    :param prefix: prefix of the parameter files (the same as was passed to
+        saveParams)
+    :param dtype: see save
+    :returns: name of the new checkpoint file
+    """
+
+    arrays = []
+    for name in ["state_decoders", "old_state_decoders", "state_encoders"]:
+        textfile = HRLutils.datafile("%s_%s.txt" % (prefix, name))
+        if not os.path.exists(textfile):
+            continue
+        f = open(textfile)
+        try:
+            arrays += [(name, [[float(x) for x in l.split(" ")]
+                               for l in f.readlines()])]
+        finally:
+            f.close()
+
+    filename = HRLutils.datafile(prefix + "_params.ckpt")
+    save(filename, arrays, dtype=dtype)
+    return filename
+
+
+if __name__ == "__main__":
+    # e.g. "checkpoint.py delivery_params_0" converts
+    # delivery_params_0_state_decoders.txt etc.
+    print "saved", convert_text(sys.argv[1])
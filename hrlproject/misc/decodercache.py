@@ -0,0 +1,205 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+"""A disk cache for decoders, so that rebuilding a model that has been built
+before doesn't need to solve for the decoders again.
+
+CachedApproximatorFactory wraps the approximator factory of an ensemble
+factory (see HRLutils.defaultEnsembleFactory). Cache entries are keyed by a
+hash of the evaluation points, the neuron activities at those points (which
+are determined by the encoders, gains/biases, and neuron model), the
+approximator settings, and the target function (evaluated at the evaluation
+points). The underlying approximator (which does the expensive gamma matrix
+inversion) is only created if there is a cache miss.
+
+Cache files are stored in data/decodercache. When the total size of the
+cache goes over max_size the least recently used files are deleted.
+"""
+
+import os
+import time
+
+import jarray
+
+from java.io import (Serializable, DataInputStream, DataOutputStream,
+                     BufferedInputStream, BufferedOutputStream,
+                     FileInputStream, FileOutputStream)
+from java.lang import String
+from java.nio import ByteBuffer
+from java.security import MessageDigest
+
+from ca.nengo.math import LinearApproximator, LinearApproximatorFactory
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data",
+                         "decodercache")
+MAX_SIZE = 500 * 2 ** 20  # bytes
+
+# cache statistics (for all factories), time is the total time spent finding
+# decoders (including cache lookups)
+stats = {"hits": 0, "misses": 0, "time": 0.0}
+
+
+def digest_matrix(md, matrix):
+    """Add the values in matrix (a list of Java float arrays) to the
+    MessageDigest md."""
+
+    md.update(ByteBuffer.allocate(4).putInt(len(matrix)).array())
+    for row in matrix:
+        buf = ByteBuffer.allocate(4 * len(row))
+        buf.asFloatBuffer().put(row)
+        md.update(buf.array())
+
+
+def hexdigest(md):
+    return "".join(["%02x" % (b & 0xFF) for b in md.digest()])
+
+
+class CachedApproximatorFactory(LinearApproximatorFactory, Serializable):
+    """Approximator factory that looks up decoders in the disk cache before
+    using the wrapped factory."""
+
+    serialVersionUID = 1
+
+    def __init__(self, base, cache_dir=CACHE_DIR, max_size=MAX_SIZE):
+        """Initialize factory.
+
+        :param base: the approximator factory used for cache misses
+        :param cache_dir: directory to store cache files in
+        :param max_size: maximum total size of the cache files (in bytes)
+        """
+
+        self.base = base
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def getApproximator(self, evalPoints, values):
+        md = MessageDigest.getInstance("SHA-1")
+        settings = "%s %s" % (self.base.getClass().getName(),
+                              getattr(self.base, "noise", None))
+        md.update(String(settings).getBytes("UTF-8"))
+        digest_matrix(md, evalPoints)
+        digest_matrix(md, values)
+
+        return CachedApproximator(self, hexdigest(md), evalPoints, values)
+
+    def filename(self, key):
+        return os.path.join(self.cache_dir, key + ".dec")
+
+    def load(self, key):
+        """Returns the cached decoders for key (or None if there aren't
+        any)."""
+
+        filename = self.filename(key)
+        if not os.path.exists(filename):
+            return None
+
+        f = DataInputStream(BufferedInputStream(FileInputStream(filename)))
+        try:
+            coefficients = jarray.zeros(f.readInt(), "f")
+            for i in range(len(coefficients)):
+                coefficients[i] = f.readFloat()
+        finally:
+            f.close()
+
+        # mark as recently used
+        os.utime(filename, None)
+
+        return coefficients
+
+    def save(self, key, coefficients):
+        """Save decoders to the cache."""
+
+        filename = self.filename(key)
+        tmpname = filename + ".tmp"
+        f = DataOutputStream(BufferedOutputStream(FileOutputStream(tmpname)))
+        try:
+            f.writeInt(len(coefficients))
+            for c in coefficients:
+                f.writeFloat(c)
+        finally:
+            f.close()
+        if os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmpname, filename)
+
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used cache files until the cache is
+        smaller than max_size."""
+
+        files = [os.path.join(self.cache_dir, f) for f in
+                 os.listdir(self.cache_dir) if f.endswith(".dec")]
+        files = [(os.path.getmtime(f), os.path.getsize(f), f) for f in files]
+        files.sort()
+
+        total = sum([f[1] for f in files])
+        for _, size, f in files:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(f)
+            except OSError:
+                # another process may have removed it already
+                pass
+            total -= size
+
+    def clone(self):
+        return CachedApproximatorFactory(self.base.clone(), self.cache_dir,
+                                         self.max_size)
+
+
+class CachedApproximator(LinearApproximator, Serializable):
+    """Approximator that looks up decoders in the disk cache, only solving
+    for the decoders (with the base approximator) on a miss."""
+
+    serialVersionUID = 1
+
+    def __init__(self, factory, key, evalPoints, values):
+        self.factory = factory
+        self.key = key
+        self.evalPoints = evalPoints
+        self.values = values
+        self.base = None  # created on the first cache miss
+
+    def getEvalPoints(self):
+        return self.evalPoints
+
+    def getValues(self):
+        return self.values
+
+    def findCoefficients(self, target):
+        start = time.time()
+        try:
+            return self.find(target)
+        finally:
+            stats["time"] += time.time() - start
+
+    def find(self, target):
+        """Look up the decoders for target in the cache, or solve for them
+        if they aren't there."""
+
+        md = MessageDigest.getInstance("SHA-1")
+        md.update(String(self.key).getBytes("UTF-8"))
+        digest_matrix(md, [jarray.array([target.map(p) for p in
+                                         self.evalPoints], "f")])
+        key = hexdigest(md)
+
+        coefficients = self.factory.load(key)
+        if coefficients is not None:
+            stats["hits"] += 1
+            return coefficients
+        stats["misses"] += 1
+
+        if self.base is None:
+            self.base = self.factory.base.getApproximator(self.evalPoints,
+                                                          self.values)
+        coefficients = self.base.findCoefficients(target)
+        self.factory.save(key, coefficients)
+        return coefficients
+
+    def clone(self):
+        return CachedApproximator(self.factory, self.key, self.evalPoints,
+                                  self.values)
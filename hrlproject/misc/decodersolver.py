@@ -0,0 +1,372 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+"""A decoder solver for large ensembles (e.g. the state populations).
+
+DecoderSolver can be used to re-solve the decoders of an existing origin
+(e.g. over a new set of evaluation points, see EvalReservoir), or it can
+replace Nengo's solver for all the origins of an ensemble by building the
+ensemble with a SolverApproximatorFactory (see HRLutils.make_ensemble).
+
+The neuron activities at the evaluation points are computed in batch (the
+encoder/gain products are done as one matrix multiplication), and the
+decoders are found by solving the regularized least squares problem
+(A^T A + reg*I) d = A^T f(x) with a Cholesky factorization of the Gram
+matrix. When new evaluation points are added the factorization is updated
+with rank-1 updates (if that is expected to be faster), rather than being
+recomputed.
+"""
+
+import math
+import time
+
+import jarray
+
+from java.io import Serializable
+
+from ca.nengo.math import LinearApproximator, LinearApproximatorFactory
+
+from Jama import Matrix
+
+
+def activities(ens, points):
+    """Firing rates of the neurons in a LIF ensemble at the given points.
+
+    :param ens: NEFEnsemble (with LIF neurons)
+    :param points: list of points (in the represented space, i.e. not
+        divided by radius)
+    :returns: Jama Matrix of rates (one row per point, one column per
+        neuron)
+    """
+
+    nodes = ens.getNodes()
+    radii = ens.getRadii()
+    encoders = ens.getEncoders()
+
+    # note: scale encoders by gain/radius, so J = x.E + bias
+    scaled = Matrix([[encoders[i][j] * nodes[i].getScale() / radii[j]
+                      for i in range(len(nodes))]
+                     for j in range(len(radii))])
+    bias = [n.getBias() for n in nodes]
+    tau_rc = [n.getGenerator().getTauRC() for n in nodes]
+    tau_ref = [n.getGenerator().getTauRef() for n in nodes]
+    cols = range(len(nodes))
+
+    J = Matrix([list(p) for p in points]).times(scaled).getArray()
+    for row in J:
+        for i in cols:
+            j = row[i] + bias[i]
+            if j > 1:
+                row[i] = 1.0 / (tau_ref[i] - tau_rc[i] * math.log(1 - 1 / j))
+            else:
+                row[i] = 0.0
+
+    return Matrix(J)
+
+
+def max_rates(ens):
+    """Maximum firing rates of the neurons in a LIF ensemble (i.e. the rate
+    at the point on the radius in each neuron's preferred direction).
+
+    :param ens: NEFEnsemble (with LIF neurons)
+    :returns: list of rates (one per neuron)
+    """
+
+    rates = []
+    for n in ens.getNodes():
+        # note: encoders are unit length, so J = gain + bias at the radius
+        j = n.getScale() + n.getBias()
+        gen = n.getGenerator()
+        if j > 1:
+            rates += [1.0 / (gen.getTauRef() -
+                             gen.getTauRC() * math.log(1 - 1 / j))]
+        else:
+            rates += [0.0]
+    return rates
+
+
+def evaluate(funcs, points):
+    """Evaluate target functions at the given points.
+
+    :param funcs: list of ca.nengo.math.Functions (one for each output
+        dimension), or a Python function mapping a point to a list of values,
+        or a Jama Matrix of values already evaluated at the points
+    :returns: Jama Matrix of values (one row per point)
+    """
+
+    if isinstance(funcs, Matrix):
+        assert funcs.getRowDimension() == len(points)
+        return funcs.copy()
+    if callable(funcs):
+        return Matrix([list(funcs(p)) for p in points])
+    return Matrix([[f.map(p) for f in funcs] for p in points])
+
+
+class DecoderSolver:
+    """Regularized least squares decoder solver for one ensemble."""
+
+    def __init__(self, ens, points, noise=0.1, max_update=None,
+                 weights=None, A=None):
+        """Compute the activities at the evaluation points and factor the
+        Gram matrix.
+
+        :param ens: ensemble to solve decoders for (only needed if A is
+            None, or to add points later)
+        :param points: evaluation points
+        :param noise: standard deviation of noise added to activities, as a
+            fraction of the maximum rate (as in Nengo's solver). Sets the
+            regularization, which is fixed based on the initial points.
+        :param max_update: if more than this many points are added at once,
+            the Gram matrix is refactored rather than updated. If None, this
+            is decided based on the measured time of the last factorization
+            and of the rank-1 updates (see add_points).
+        :param weights: if not None, a weight for each point (for weighted
+            least squares, e.g. if each point represents several points in
+            the original distribution, see evalpoints.reduce_points)
+        :param A: if not None, the activities at the evaluation points (Jama
+            Matrix, one row per point), rather than calculating them (see
+            activities)
+        """
+
+        self.ens = ens
+        self.points = [list(p) for p in points]
+        self.A = activities(ens, self.points) if A is None else A
+        self.N = self.A.getColumnDimension()
+        self.max_update = max_update
+
+        # measured time of the last factorization, and of one rank-1 update
+        # (None until an update has been done)
+        self.factor_time = None
+        self.update_time = None
+
+        # note: weighted least squares is the same as unweighted least
+        # squares with the rows of A and f(x) scaled by sqrt(weight)
+        if weights is None:
+            self.row_scale = None
+            total_weight = len(self.points)
+        else:
+            self.row_scale = [math.sqrt(w) for w in weights]
+            total_weight = sum(weights)
+
+        # regularization
+        max_rate = max([max(row) for row in self.A.getArray()])
+        self.reg = (noise * max_rate) ** 2 * total_weight
+
+        if self.row_scale is not None:
+            scale_rows(self.A, self.row_scale)
+
+        self.G = self.A.transpose().times(self.A)
+        for i in range(self.N):
+            self.G.set(i, i, self.G.get(i, i) + self.reg)
+        self.factor()
+
+    def factor(self):
+        """Recompute the Cholesky factorization of the Gram matrix."""
+
+        start = time.time()
+        chol = self.G.chol()
+        if not chol.isSPD():
+            raise ValueError("Gram matrix for %s is not positive definite" %
+                             (self.ens.getName() if self.ens is not None
+                              else "ensemble"))
+        self.L = chol.getL().getArray()
+        self.factor_time = time.time() - start
+
+        # note: the decomposition can be used to solve directly, until L is
+        # modified by a rank-1 update
+        self.chol = chol
+
+    def add_points(self, points, weights=None):
+        """Add evaluation points, updating the factorization.
+
+        :param points: list of new evaluation points
+        :param weights: weight for each new point (only used if the solver
+            was created with weights, defaults to 1)
+        """
+
+        if len(points) == 0:
+            return
+
+        points = [list(p) for p in points]
+        A_new = activities(self.ens, points)
+        if self.row_scale is not None:
+            if weights is None:
+                weights = [1.0 for _ in points]
+            scale = [math.sqrt(w) for w in weights]
+            scale_rows(A_new, scale)
+            self.row_scale += scale
+        self.points += points
+        self.A = stack(self.A, A_new)
+        self.G.plusEquals(A_new.transpose().times(A_new))
+
+        if self.use_updates(len(points)):
+            start = time.time()
+            for row in A_new.getArray():
+                self.update(list(row))
+            self.update_time = (time.time() - start) / len(points)
+        else:
+            self.factor()
+
+    def use_updates(self, n):
+        """Returns True if adding n points should be done with rank-1 updates
+        rather than refactoring.
+
+        Note: the updates are O(N^2) per point in Python, whereas the
+        factorization is O(N^3) in Java, so the updates are only faster for
+        a few points. Unless max_update is set, this compares the measured
+        times (trying a single update if there is no measurement yet).
+        """
+
+        if self.max_update is not None:
+            return n <= self.max_update
+        if self.update_time is None:
+            return n == 1
+        return n * self.update_time < self.factor_time
+
+    def update(self, x):
+        """Rank-1 update of the Cholesky factor (L L^T += x x^T).
+
+        :param x: activity vector (modified)
+        """
+
+        self.chol = None
+
+        L = self.L
+        n = self.N
+        for k in range(n):
+            if x[k] == 0:
+                continue
+            Lk = L[k]
+            r = math.sqrt(Lk[k] * Lk[k] + x[k] * x[k])
+            c = r / Lk[k]
+            s = x[k] / Lk[k]
+            Lk[k] = r
+            for i in range(k + 1, n):
+                Li = L[i]
+                Li[k] = (Li[k] + s * x[i]) / c
+                x[i] = c * x[i] - s * Li[k]
+
+    def solve(self, funcs):
+        """Solve for decoders.
+
+        :param funcs: target functions (see evaluate)
+        :returns: decoders (list of Java float arrays, one per neuron)
+        """
+
+        target = evaluate(funcs, self.points)
+        if self.row_scale is not None:
+            scale_rows(target, self.row_scale)
+        rhs = self.A.transpose().times(target)
+        if self.chol is not None:
+            return [jarray.array(row, "f")
+                    for row in self.chol.solve(rhs).getArray()]
+
+        L = self.L
+        n = self.N
+
+        decoders = [jarray.zeros(rhs.getColumnDimension(), "f")
+                    for _ in range(n)]
+        for d in range(rhs.getColumnDimension()):
+            # forward substitution (L y = b)
+            y = [0.0] * n
+            for i in range(n):
+                Li = L[i]
+                y[i] = (rhs.get(i, d) -
+                        sum([Li[j] * y[j] for j in range(i)])) / Li[i]
+
+            # back substitution (L^T z = y)
+            z = [0.0] * n
+            for i in range(n - 1, -1, -1):
+                z[i] = (y[i] - sum([L[j][i] * z[j]
+                                    for j in range(i + 1, n)])) / L[i][i]
+
+            for i in range(n):
+                decoders[i][d] = z[i]
+
+        return decoders
+
+    def install(self, origin, funcs):
+        """Solve for decoders and set them on the given origin.
+
+        :param origin: DecodedOrigin of the ensemble
+        :param funcs: target functions (see evaluate)
+        """
+
+        origin.setDecoders(self.solve(funcs))
+
+
+class SolverApproximatorFactory(LinearApproximatorFactory, Serializable):
+    """Approximator factory that solves for decoders with DecoderSolver
+    (rather than Nengo's solver)."""
+
+    serialVersionUID = 1
+
+    def __init__(self, noise=0.1):
+        """Initialize factory.
+
+        :param noise: see DecoderSolver
+        """
+
+        self.noise = noise
+
+    def getApproximator(self, evalPoints, values):
+        return SolverApproximator(evalPoints, values, self.noise)
+
+    def clone(self):
+        return SolverApproximatorFactory(self.noise)
+
+
+class SolverApproximator(LinearApproximator, Serializable):
+    """Approximator that solves for decoders with DecoderSolver.
+
+    The Gram matrix is factored the first time decoders are requested, and
+    the factorization is reused for every origin of the ensemble.
+    """
+
+    serialVersionUID = 1
+
+    def __init__(self, evalPoints, values, noise):
+        """Initialize approximator.
+
+        :param evalPoints: evaluation points
+        :param values: activity of each neuron at each evaluation point (one
+            row per neuron, as given by Nengo)
+        :param noise: see DecoderSolver
+        """
+
+        self.evalPoints = evalPoints
+        self.values = values
+        self.noise = noise
+        self.solver = None  # created on first use
+
+    def getEvalPoints(self):
+        return self.evalPoints
+
+    def getValues(self):
+        return self.values
+
+    def findCoefficients(self, target):
+        if self.solver is None:
+            A = Matrix([list(row) for row in self.values]).transpose()
+            self.solver = DecoderSolver(None, self.evalPoints,
+                                        noise=self.noise, A=A)
+        return jarray.array([row[0] for row in self.solver.solve([target])],
+                            "f")
+
+    def clone(self):
+        return SolverApproximator(self.evalPoints, self.values, self.noise)
+
+
+def stack(A, B):
+    """Concatenate the rows of two Jama matrices."""
+
+    # note: the new matrix shares the row arrays of A and B
+    return Matrix(list(A.getArray()) + list(B.getArray()))
+
+
+def scale_rows(M, scale):
+    """Multiply each row of the Jama matrix M by the corresponding value in
+    scale (in place)."""
+
+    for row, c in zip(M.getArray(), scale):
+        for i in range(len(row)):
+            row[i] *= c
@@ -0,0 +1,340 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+"""Adaptive selection of the number of evaluation points for ensembles.
+
+AdaptiveEnsembleFactory picks the number of evaluation points for each
+ensemble by calibration: a probe ensemble with the same neuron parameters is
+built, and the number of points used to solve for its decoders is doubled
+until the decoding error on a held-out set of points stops improving by more
+than the given tolerance. The decoders are solved for the function the
+ensemble computes (see the targets parameter, e.g. product for the
+multiplication populations), since nonlinear functions need more points than
+the identity. The resulting counts are cached (by number of neurons,
+dimension, neuron parameters, and target function), so the calibration is
+only done once for each type of ensemble.
+
+The policy applies to the ensembles built with HRLutils.defaultEnsembleFactory,
+HRLutils.modelEnsembleFactory, and HRLutils.make_ensemble (ensembles built
+directly with nef.Network.make and make_array use Nengo's defaults).
+
+report() prints the number of points used for each ensemble built, compared
+to the fixed policy.
+
+reduce_points() shrinks a set of evaluation points (e.g. states recorded
+from the environment) to a smaller set that covers the same distribution.
+"""
+
+import math
+import random
+import time
+
+from Jama import Matrix
+
+from ca.nengo.model.nef.impl import NEFEnsembleFactoryImpl
+from ca.nengo.util.impl import RandomHypersphereVG
+
+from hrlproject.misc import decodersolver
+
+# calibrated number of points, by ensemble type (see AdaptiveEnsembleFactory
+# .key)
+counts = {}
+
+# (name, neurons, dimensions, points used, fixed points, build time) for each
+# ensemble built with an AdaptiveEnsembleFactory
+built = []
+
+
+class ProbeFactory(NEFEnsembleFactoryImpl):
+    """Factory for probe ensembles (uses very few evaluation points, since
+    the probe's own decoders aren't used)."""
+
+    def getNumEvalPoints(self, d):
+        return d * 10
+
+
+class AdaptiveEnsembleFactory(NEFEnsembleFactoryImpl):
+    """NEF ensemble factory that chooses the number of evaluation points
+    adaptively (see module docstring)."""
+
+    def __init__(self, fixed, tolerance=0.05, min_points=100, num_test=500,
+                 overrides=None, targets=None):
+        """Initialize factory.
+
+        :param fixed: function mapping dimension to number of points under
+            the fixed policy (this is also the maximum number of points)
+        :param tolerance: stop adding points when the relative improvement in
+            held-out error is less than this
+        :param min_points: number of points per dimension to start with
+        :param num_test: number of held-out points used to measure error
+        :param overrides: dict mapping ensemble names to a fixed number of
+            points (bypassing the calibration)
+        :param targets: dict mapping ensemble names (or name prefixes, e.g.
+            "mpop_") to the function decoded from the ensemble, which the
+            calibration solves for (ensembles not in targets use identity)
+        """
+
+        NEFEnsembleFactoryImpl.__init__(self)
+
+        self.fixed = fixed
+        self.tolerance = tolerance
+        self.min_points = min_points
+        self.num_test = num_test
+        self.overrides = overrides or {}
+        self.targets = targets or {}
+
+        self.current = None  # (name, neurons) of the ensemble being built
+
+    def make(self, name, n, radii):
+        if self.current is not None:
+            # note: the int overload of make calls back into this method
+            # with the radii, so only record the outer call
+            return NEFEnsembleFactoryImpl.make(self, name, n, radii)
+
+        # note: recording the name/size here so that getNumEvalPoints (which
+        # is only given the dimension) can look them up
+        self.current = (name, n)
+        start = time.time()
+        try:
+            ens = NEFEnsembleFactoryImpl.make(self, name, n, radii)
+            d = ens.getDimension()
+            built.append((name, n, d, self.getNumEvalPoints(d),
+                          self.fixed(d), time.time() - start))
+        finally:
+            self.current = None
+        return ens
+
+    def getNumEvalPoints(self, d):
+        if self.current is None:
+            return self.fixed(d)
+        name, n = self.current
+        if name in self.overrides:
+            return self.overrides[name]
+
+        func = self.target(name)
+        key = self.key(n, d) + (getattr(func, "__name__", repr(func)),)
+        if key not in counts:
+            counts[key] = self.calibrate(n, d, func)
+        return counts[key]
+
+    def target(self, name):
+        """Returns the target function for the named ensemble (the entry in
+        targets with the longest matching prefix, or identity)."""
+
+        best = None
+        for prefix in self.targets:
+            if name.startswith(prefix) and (best is None or
+                                            len(prefix) > len(best)):
+                best = prefix
+        if best is None:
+            return identity
+        return self.targets[best]
+
+    def key(self, n, d):
+        """Key identifying ensembles that need the same number of points
+        (not including the target function)."""
+
+        nodes = self.getNodeFactory()
+        params = [nodes.getClass().getName()]
+        for attr in ["intercept", "maxRate", "tauRC", "tauRef"]:
+            val = getattr(nodes, attr, None)
+            if hasattr(val, "getLow"):
+                val = (val.getLow(), val.getHigh())
+            params += [str(val)]
+        return (n, d, " ".join(params),
+                self.getEncoderFactory().getClass().getName())
+
+    def calibrate(self, n, d, func=None):
+        """Find the number of points needed for an ensemble with n neurons
+        and d dimensions.
+
+        :param func: function decoded from the ensemble (defaults to
+            identity)
+        """
+
+        if func is None:
+            func = identity
+
+        probe_factory = ProbeFactory()
+        probe_factory.setNodeFactory(self.getNodeFactory())
+        probe_factory.setEncoderFactory(self.getEncoderFactory())
+        probe_factory.beQuiet()
+        probe = probe_factory.make("probe", n, [1.0 for _ in range(d)])
+
+        gen = RandomHypersphereVG(False, 1.0, 0.0)
+        test = gen.genVectors(self.num_test, d)
+        A_test = decodersolver.activities(probe, test)
+        target = decodersolver.evaluate(func, test)
+
+        def error(solver):
+            decoders = Matrix([list(row) for row in solver.solve(func)])
+            return (A_test.times(decoders).minus(target).normF() /
+                    math.sqrt(self.num_test * target.getColumnDimension()))
+
+        cap = self.fixed(d)
+        points = min(self.min_points * d, cap)
+        solver = decodersolver.DecoderSolver(probe, gen.genVectors(points, d))
+        err = error(solver)
+        while points < cap:
+            new = min(points, cap - points)
+            solver.add_points(gen.genVectors(new, d))
+            points += new
+            new_err = error(solver)
+            if err - new_err < self.tolerance * err:
+                break
+            err = new_err
+
+        return points
+
+
+def identity(x):
+    return list(x)
+
+
+def product(x):
+    return [x[0] * x[1]]
+
+
+def dedup(points, tolerance=1e-3):
+    """Remove near-duplicate points (points that fall into the same cell of
+    a grid with spacing tolerance).
+
+    :returns: the unique points and the number of original points each one
+        represents
+    """
+
+    cells = {}
+    unique = []
+    counts = []
+    for p in points:
+        cell = tuple([int(math.floor(x / tolerance)) for x in p])
+        i = cells.get(cell)
+        if i is None:
+            cells[cell] = len(unique)
+            unique += [list(p)]
+            counts += [1]
+        else:
+            counts[i] += 1
+    return unique, counts
+
+
+def select_centers(points, weights, size, method, rand):
+    """Select a subset of points.
+
+    :param points: list of points
+    :param weights: weight of each point
+    :param size: number of points to select
+    :param method: "kmeans++" (pick each new point with probability
+        proportional to weight * squared distance from the selected points)
+        or "farthest" (pick the point farthest from the selected points)
+    :param rand: random number generator
+    :returns: indices of the selected points, and the index (into the
+        selected points) of the nearest selected point for every point
+    """
+
+    X = Matrix(points)
+    sq_norms = [sum([x * x for x in p]) for p in points]
+
+    # squared distance to the nearest selected point, and the index of that
+    # point
+    dist = [1e300 for _ in points]
+    nearest = [0 for _ in points]
+
+    total = float(sum(weights))
+    r = rand.random() * total
+    i = 0
+    while r > weights[i] and i < len(points) - 1:
+        r -= weights[i]
+        i += 1
+    selected = [i]
+
+    while True:
+        # update distances with the new point
+        # note: |x - c|^2 = |x|^2 - 2 x.c + |c|^2 (with x.c computed for all
+        # the points at once)
+        c = selected[-1]
+        dots = X.times(Matrix([[x] for x in points[c]])).getColumnPackedCopy()
+        k = len(selected) - 1
+        for j in range(len(points)):
+            d = sq_norms[j] - 2 * dots[j] + sq_norms[c]
+            if d < dist[j]:
+                dist[j] = d
+                nearest[j] = k
+
+        if len(selected) >= size:
+            break
+
+        if method == "farthest":
+            i = max(range(len(points)), key=lambda j: dist[j])
+        elif method == "kmeans++":
+            scores = [w * max(d, 0.0) for w, d in zip(weights, dist)]
+            r = rand.random() * sum(scores)
+            i = 0
+            while r > scores[i] and i < len(points) - 1:
+                r -= scores[i]
+                i += 1
+        else:
+            raise ValueError("unknown method %s" % method)
+
+        if dist[i] <= 0:
+            # all the remaining points are duplicates of selected points
+            break
+        selected += [i]
+
+    return selected, nearest
+
+
+def reduce_points(points, size, method="kmeans++", tolerance=1e-3,
+                  weighted=False, rand=None):
+    """Reduce a set of evaluation points to (at most) the given size.
+
+    :param points: list of points
+    :param size: target number of points (ignored if method is "dedup")
+    :param method: "dedup" (only remove near-duplicates, so the result can
+        have more than size points), "kmeans++", or "farthest" (see
+        select_centers). Near-duplicates are always removed first.
+    :param tolerance: spacing for removing near-duplicates (see dedup)
+    :param weighted: if True, also return the number of original points each
+        selected point represents (for weighted least squares, see
+        decodersolver.DecoderSolver)
+    :param rand: random number generator (for kmeans++)
+    :returns: the selected points (and weights, if weighted is True)
+    """
+
+    if rand is None:
+        rand = random.Random(0)
+
+    points, counts = dedup(points, tolerance)
+
+    if method != "dedup" and len(points) > size:
+        selected, nearest = select_centers(points, counts, size, method,
+                                           rand)
+        weights = [0 for _ in selected]
+        for j, c in zip(nearest, counts):
+            weights[j] += c
+        points = [points[i] for i in selected]
+        counts = weights
+
+    if weighted:
+        return points, counts
+    return points
+
+
+def report():
+    """Print the number of evaluation points used for each ensemble built
+    with an AdaptiveEnsembleFactory."""
+
+    total_used = 0
+    total_fixed = 0
+    total_saved = 0.0
+    for name, n, d, used, fixed, build_time in built:
+        # note: estimate, assuming the build time is proportional to the
+        # number of points
+        saved = build_time * (fixed - used) / max(used, 1)
+        print "%s (%d neurons, %dD): %d points (fixed %d), ~%.2fs saved" % (
+            name, n, d, used, fixed, saved)
+        total_used += used
+        total_fixed += fixed
+        total_saved += saved
+    print "total: %d points (fixed %d), ~%.2fs saved" % (total_used,
+                                                         total_fixed,
+                                                         total_saved)
@@ -0,0 +1,145 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+"""Sample eval points for the state population directly from a
+PlaceCellEnvironment, without running a simulation.
+
+Points are place cell activations at locations drawn from the free space in
+the environment map, crossed with each context vector. Optionally some
+fraction of the points are instead drawn from short rollouts of the optimal
+policy (so that the points are weighted towards the states the agent
+actually visits, as when recording them from a running environment, see
+run.gen_evalpoints).
+"""
+
+import math
+
+from hrlproject.misc import HRLutils, weightstore
+
+
+def find_goal(env, label, stepsize=0.1):
+    """Find the target point for a goal region (the same point used in
+    PlaceCellEnvironment.calc_optimal_move).
+
+    :param env: the environment
+    :param label: label of the goal region
+    :param stepsize: grid spacing of the search
+    :returns: the goal point (or None if the region isn't found)
+    """
+
+    for y in [v * stepsize for v in
+              range(int(-env.imgsize[1] / (2 * stepsize)) + 1,
+                    int(env.imgsize[1] / (2 * stepsize)) - 1)]:
+        for x in [v * stepsize for v in
+                  range(int(-env.imgsize[0] / (2 * stepsize)) + 1,
+                        int(env.imgsize[0] / (2 * stepsize)) - 1)]:
+            if env.is_in((x, y), label):
+                return (x, y)
+    return None
+
+
+def optimal_action(env, pt, goal, step):
+    """Returns the action the optimal policy takes at pt (or None if every
+    action would move into a wall).
+
+    :param env: the environment
+    :param pt: current location
+    :param goal: target point (see find_goal)
+    :param step: distance moved by each action
+    """
+
+    angle = math.atan2(goal[1] - pt[1], goal[0] - pt[0])
+    direction = (math.cos(angle), math.sin(angle))
+
+    best = None
+    best_sim = None
+    for a in env.actions:
+        if env.is_in((pt[0] + a[1][0] * step, pt[1] + a[1][1] * step),
+                     "wall"):
+            continue
+        sim = HRLutils.similarity(a[1], direction)
+        if best is None or sim > best_sim:
+            best = a
+            best_sim = sim
+    return best
+
+
+def rollout(env, label, rand, step=0.05, max_steps=200):
+    """Follow the optimal policy to the goal region from a random location.
+
+    :param env: the environment
+    :param label: label of the goal region
+    :param rand: random stream (for the start location)
+    :param step: distance moved each step (larger than the environment's dx,
+        since only the visited locations matter)
+    :param max_steps: maximum length of the rollout
+    :returns: list of visited locations
+    """
+
+    goal = find_goal(env, label)
+    pt = env.random_location(avoid=["wall", label], rand=rand)
+    visited = [pt]
+    if goal is None:
+        return visited
+
+    for _ in range(max_steps):
+        if env.is_in(pt, label):
+            break
+        a = optimal_action(env, pt, goal, step)
+        if a is None:
+            break
+        pt = (pt[0] + a[1][0] * step, pt[1] + a[1][1] * step)
+        visited += [pt]
+
+    return visited
+
+
+def sample(env, contexts, num_points, visitation=0.0, rand=None, **kwargs):
+    """Sample eval points.
+
+    :param env: the environment (used for the map and place cells)
+    :param contexts: dict mapping goal labels to context vectors (e.g.
+        ContextEnvironment.contexts)
+    :param num_points: total number of points
+    :param visitation: fraction of the points drawn from optimal policy
+        rollouts (the rest are uniform over the free space)
+    :param rand: random stream (defaults to HRLutils.stream("evalsampler"))
+    :param kwargs: passed to rollout
+    :returns: list of points (place activations + context)
+    """
+
+    if rand is None:
+        rand = HRLutils.stream("evalsampler")
+    labels = sorted(contexts.keys())
+
+    # uniform points, each location crossed with every context
+    num_uniform = int(num_points * (1 - visitation))
+    locations = [env.random_location(avoid=["wall"], rand=rand)
+                 for _ in range(num_uniform // len(labels))]
+    points = []
+    for pt in locations:
+        place = env.calc_place_activations(pt)
+        points += [place + list(contexts[l]) for l in labels]
+
+    # points along optimal trajectories
+    # note: the rollout locations are subsampled at random, so that long
+    # rollouts don't dominate
+    visited = []
+    while len(points) + len(visited) < num_points:
+        label = rand.choice(labels)
+        visited += [(pt, label) for pt in rollout(env, label, rand, **kwargs)]
+    rand.shuffle(visited)
+    for pt, label in visited[:num_points - len(points)]:
+        points += [env.calc_place_activations(pt) + list(contexts[label])]
+
+    return points
+
+
+def save(filename, points, seed=None):
+    """Save eval points in binary format (see weightstore).
+
+    :param filename: base name of the file (without extension)
+    :param points: list of eval points
+    :param seed: seed recorded in the file header
+    """
+
+    weightstore.save(filename, points, seed=seed)
@@ -0,0 +1,195 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+"""Helpers for SimpleNodes that read origin values or modify decoders.
+
+Origin values and decoders are Java arrays. These classes let SimpleNodes
+work on those arrays directly (copying them with System.arraycopy into
+reusable buffers), rather than building new Python lists every timestep.
+"""
+
+import math
+
+import jarray
+
+from java.lang import System, RuntimeException
+
+
+class OriginBuffer:
+    """A reusable buffer containing the current output of an origin."""
+
+    def __init__(self, origin):
+        """Initialize buffer.
+
+        :param origin: origin to be read
+        """
+
+        self.origin = origin
+        self.buffer = None  # allocated on first successful read
+
+        # True if the last read failed (so buffer contains the values from
+        # an earlier read)
+        self.stale = True
+
+    def read(self):
+        """Copy the current output of the origin into the buffer.
+
+        If the origin can't be read right now (e.g. because the simulator is
+        in the process of writing to the origin), the buffer keeps its
+        previous contents and stale is set to True.
+
+        :returns: the buffer (a Java array, which will be overwritten by the
+            next read), or None if the origin has never been read
+            successfully
+        """
+
+        try:
+            vals = self.origin.getValues().getValues()
+            n = len(vals)
+            if self.buffer is None or len(self.buffer) != n:
+                self.buffer = jarray.zeros(n, vals.typecode)
+            System.arraycopy(vals, 0, self.buffer, 0, n)
+            self.stale = False
+        except (AttributeError, TypeError, RuntimeException):
+            # note: the output is null before the first timestep, or the
+            # array can change size while it is being written
+            self.stale = True
+
+        return self.buffer
+
+    def copy(self):
+        """Returns the contents of the buffer as a list (or None if there is
+        no data)."""
+
+        if self.buffer is None:
+            return None
+        return list(self.buffer)
+
+
+class DecoderBuffer:
+    """Direct access to the decoders of an origin, for applying changes in
+    place."""
+
+    def __init__(self, origin):
+        """Initialize buffer.
+
+        :param origin: origin whose decoders will be modified
+        """
+
+        self.origin = origin
+
+        # if the decoder array we get from the origin is the one the origin
+        # actually uses, we can modify it in place rather than calling
+        # setDecoders
+        self.live = decoders_are_live(origin)
+
+    def get(self):
+        """Returns the decoder array (a Java float[][])."""
+
+        return self.origin.getDecoders()
+
+    def commit(self, decoders):
+        """Make sure that changes made to decoders (as returned by get) are
+        used by the origin."""
+
+        if not self.live:
+            self.origin.setDecoders(decoders)
+
+    def add_outer(self, activity, vec, reference=None):
+        """Add the outer product of activity and vec to the decoders,
+        skipping the rows where activity is zero.
+
+        :param activity: vector (e.g. Java array) with one value per row
+        :param vec: vector with one value per decoder dimension
+        :param reference: if not None, a matrix the same shape as the
+            decoders, used to calculate the cross term (see below)
+        :returns: squared norm of the change, total absolute change in each
+            dimension, and the cross term sum((decoders - reference) *
+            change) (calculated with the decoder values before the change)
+        """
+
+        dims = range(len(vec))
+        decoders = self.get()
+        sum_sq = 0.0
+        sum_abs = 0.0
+        cross = 0.0
+        for i, a in enumerate(activity):
+            if a != 0:
+                row = decoders[i]
+                if reference is not None:
+                    ref = reference[i]
+                    for j in dims:
+                        cross += a * vec[j] * (row[j] - ref[j])
+                for j in dims:
+                    row[j] += a * vec[j]
+                sum_sq += a * a
+                sum_abs += abs(a)
+        self.commit(decoders)
+
+        return (sum_sq * sum([v * v for v in vec]),
+                [sum_abs * abs(v) for v in vec], cross)
+
+    def add_rows(self, deltas, reference=None):
+        """Add changes to a subset of decoder rows.
+
+        :param deltas: dict mapping row index to the change for that row
+        :param reference: see add_outer
+        :returns: see add_outer
+        """
+
+        decoders = self.get()
+        sum_sq = 0.0
+        mass = None
+        cross = 0.0
+        for i, delta in deltas.iteritems():
+            row = decoders[i]
+            if reference is not None:
+                ref = reference[i]
+                for j, d in enumerate(delta):
+                    cross += d * (row[j] - ref[j])
+            for j, d in enumerate(delta):
+                row[j] += d
+                sum_sq += d * d
+            if mass is None:
+                mass = [abs(d) for d in delta]
+            else:
+                mass = [m + abs(d) for m, d in zip(mass, delta)]
+        self.commit(decoders)
+
+        return sum_sq, mass, cross
+
+    def distance(self, reference):
+        """Returns the Frobenius norm of (decoders - reference)."""
+
+        total = 0.0
+        for row, ref in zip(self.get(), reference):
+            for x, y in zip(row, ref):
+                total += (x - y) ** 2
+        return math.sqrt(total)
+
+    def copy(self):
+        """Returns a copy of the current decoders (as lists)."""
+
+        return [list(row) for row in self.get()]
+
+
+def decoders_are_live(origin):
+    """Returns True if modifying the array returned by origin.getDecoders()
+    modifies the decoders used by the origin (rather than a copy)."""
+
+    decoders = origin.getDecoders()
+    old = decoders[0][0]
+    decoders[0][0] = old + 1.0
+    live = origin.getDecoders()[0][0] != old
+    decoders[0][0] = old
+
+    return live
+
+
+def count_below(vals, threshold):
+    """Number of values below threshold."""
+
+    count = 0
+    for x in vals:
+        if x < threshold:
+            count += 1
+    return count
@@ -0,0 +1,137 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+"""Fixed size buffers for recording data over long runs."""
+
+
+class RingBuffer:
+    """A circular buffer holding the most recent capacity items."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = [None for _ in range(capacity)]
+        self.start = 0
+        self.size = 0
+
+    def append(self, x):
+        self.data[(self.start + self.size) % self.capacity] = x
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            # overwrite the oldest item
+            self.start = (self.start + 1) % self.capacity
+
+    def items(self):
+        """Returns the stored items, oldest first."""
+
+        return [self.data[(self.start + i) % self.capacity]
+                for i in range(self.size)]
+
+    def clear(self):
+        self.data = [None for _ in range(self.capacity)]
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+
+class MultiResBuffer:
+    """Stores a history of vector samples at several resolutions.
+
+    Level 0 keeps the most recent capacity samples at full resolution. Each
+    subsequent level keeps capacity bins, where each bin summarizes factor
+    bins of the level below (so a bin in level i covers factor**i samples).
+    Every bin records the min, mean, and max (per dimension) of the samples it
+    covers. Anything older than the coarsest level is discarded, so the
+    memory used is fixed no matter how long we record for.
+
+    Bins are lists of the form [start_time, end_time, num_samples, mins,
+    means, maxs].
+    """
+
+    def __init__(self, capacity=1000, factor=10, levels=4):
+        """Initialize the buffers.
+
+        :param capacity: number of bins stored at each level
+        :param factor: number of bins from one level that are combined to
+            form a bin in the next level
+        :param levels: number of levels of resolution
+        """
+
+        assert capacity >= factor
+
+        self.capacity = capacity
+        self.factor = factor
+        self.levels = [RingBuffer(capacity) for _ in range(levels)]
+
+        # partially filled bins for each level (and the number of bins from
+        # the level below that have been merged into them)
+        self.pending = [None for _ in range(levels)]
+        self.pending_count = [0 for _ in range(levels)]
+
+    def add(self, t, vals):
+        """Add a new full resolution sample.
+
+        :param t: time of sample
+        :param vals: vector of sample values
+        """
+
+        self._add(0, [t, t, 1, list(vals), list(vals), list(vals)])
+
+    def _add(self, level, b):
+        self.levels[level].append(b)
+
+        if level + 1 == len(self.levels):
+            return
+
+        # merge b into the pending bin of the next level
+        p = self.pending[level + 1]
+        if p is None:
+            # note: means are stored as sums while the bin is pending
+            p = [b[0], b[1], b[2], list(b[3]), [x * b[2] for x in b[4]],
+                 list(b[5])]
+            self.pending[level + 1] = p
+        else:
+            p[1] = b[1]
+            p[2] += b[2]
+            p[3] = [min(x, y) for x, y in zip(p[3], b[3])]
+            p[4] = [x + y * b[2] for x, y in zip(p[4], b[4])]
+            p[5] = [max(x, y) for x, y in zip(p[5], b[5])]
+        self.pending_count[level + 1] += 1
+
+        if self.pending_count[level + 1] == self.factor:
+            p[4] = [float(x) / p[2] for x in p[4]]
+            self.pending[level + 1] = None
+            self.pending_count[level + 1] = 0
+            self._add(level + 1, p)
+
+    def query(self, t0=None, t1=None):
+        """Returns the bins overlapping the time range t0--t1, at the best
+        available resolution.
+
+        Recent data comes from the finest level, and each coarser level fills
+        in the time before that covered by the finer levels.
+
+        :param t0: start of time range (None for no limit)
+        :param t1: end of time range (None for no limit)
+        :returns: list of bins (see class docstring), ordered by time
+        """
+
+        result = []
+        boundary = None  # earliest time covered by a finer level
+        for level in self.levels:
+            bins = [b for b in level.items()
+                    if boundary is None or b[0] < boundary]
+            if len(bins) == 0:
+                continue
+            boundary = bins[0][0]
+
+            # the last coarse bin may overlap the oldest fine bins, in which
+            # case we drop those fine bins (so the bins don't overlap in time)
+            result = bins + [b for b in result if b[0] > bins[-1][1]]
+
+        return [b for b in result if (t0 is None or b[1] >= t0) and
+                (t1 is None or b[0] <= t1)]
+
+    def __len__(self):
+        return sum([len(l) for l in self.levels])
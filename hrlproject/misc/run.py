@@ -4,6 +4,7 @@
 
 from __future__ import with_statement
 
+import atexit
 import inspect
 import os
 import sys
@@ -20,17 +21,106 @@ from ca.nengo.util.impl import NodeThreadPool, RandomHypersphereVG
 from hrlproject.agent import smdpagent
 from hrlproject.environment import (deliveryenvironment, contextenvironment,
                                     badreenvironment, gridworldenvironment)
-from hrlproject.misc import (HRLutils, gridworldwatch)
-from hrlproject.simplenodes import terminationnode, datanode
+from hrlproject.misc import (HRLutils, gridworldwatch, evalpoints,
+                              evalsampler, weightstore, buildprofiler,
+                              sizing)
+from hrlproject.simplenodes import (terminationnode, datanode,
+                                    checkpointmanager, evalreservoir,
+                                    tickprofiler)
+
+# if not None, a TickProfiler is added to each model, reporting with this
+# period (see add_tickprofiler)
+PROFILE_TICKS = None
+
+
+def load_evalpoints(tag, reduction=None):
+    """Load the eval points for the state population (see gen_evalpoints
+    and sample_evalpoints).
+
+    The binary eval point files (see convert_evalpoints) are memory mapped
+    and shared, so calling this for several agents doesn't load the points
+    more than once.
+
+    :param tag: tag of eval point file (usually the seed)
+    :param reduction: if not None, the eval points are reduced with
+        evalpoints.reduce_points, using this dict as kwargs (e.g.
+        {"size": 2000, "method": "kmeans++"}). Weighted reduction isn't
+        supported, since the agent has no way to use the weights.
+    """
+
+    if reduction is not None and reduction.get("weighted", False):
+        raise ValueError("weighted eval point reduction isn't supported "
+                         "for the agent's state population")
+
+    filename = HRLutils.datafile("contextbmp_evalpoints_%s" % tag)
+    print "loading", filename
+    evals = weightstore.load(filename)
+
+    if reduction is not None:
+        n = len(evals)
+        evals = evalpoints.reduce_points([list(e) for e in evals],
+                                         rand=HRLutils.stream("evalpoints"),
+                                         **reduction)
+        print "reduced eval points from %d to %d" % (n, len(evals))
+
+    return evals
+
+
+def add_evalreservoir(net, agent, source, stateD, tag, args):
+    """Attach an EvalReservoir to an agent, sampling the states sent to its
+    state_input (see simplenodes.evalreservoir).
+
+    :param net: network containing the agent
+    :param agent: SMDPAgent
+    :param source: origin connected to the agent's state_input
+    :param stateD: dimension of the state
+    :param tag: tag for the refreshed parameter file
+    :param args: kwargs for the EvalReservoir (e.g. {"refresh_period": 500})
+    """
 
+    args = dict(args)
+    args.setdefault("prefix", os.path.join("weights", "%s_%s_refreshed" %
+                                           (agent.name, tag)))
+    reservoir = evalreservoir.EvalReservoir(agent.getNode("QNetwork"),
+                                            stateD,
+                                            name=agent.name + "Reservoir",
+                                            **args)
+    net.add(reservoir)
+    net.connect(source, reservoir.getTermination("state"))
+    return reservoir
 
-def run_deliveryenvironment(navargs, ctrlargs, tag=None, seed=None):
+
+def add_tickprofiler(net):
+    """Add a TickProfiler to the network, if tick profiling is on (see
+    PROFILE_TICKS and simplenodes.tickprofiler).
+
+    Must be called after all the other nodes have been added to the network.
+
+    :param net: network to profile
+    """
+
+    if PROFILE_TICKS is None:
+        return None
+
+    profiler = tickprofiler.TickProfiler(
+        net, period=PROFILE_TICKS,
+        filename=HRLutils.datafile("tickprofile_%s.txt" %
+                                   net.network.getName()))
+    net.add(profiler)
+    return profiler
+
+
+def run_deliveryenvironment(navargs, ctrlargs, tag=None, seed=None,
+                            eval_reduction=None, eval_refresh=None):
     """Runs the model on the delivery task.
 
     :param navargs: kwargs for the nav_agent (see SMDPAgent.__init__)
     :param ctrlargs: kwargs for the ctrl_agent (see SMDPAgent.__init__)
     :param tag: string appended to datafiles associated with this run
     :param seed: random seed used for this run
+    :param eval_reduction: eval point reduction (see load_evalpoints)
+    :param eval_refresh: if not None, kwargs for an EvalReservoir attached
+        to each agent (see add_evalreservoir)
     """
 
     if seed is not None:
@@ -74,8 +164,7 @@ def run_deliveryenvironment(navargs, ctrlargs, tag=None, seed=None):
     enc = MU.prod(enc, 1.0 / max_state_input)
 
     # read in eval points from file
-    with open(HRLutils.datafile("contextbmp_evalpoints_%s.txt" % tag)) as f:
-        evals = [[float(x) for x in l.split(" ")] for l in f.readlines()]
+    evals = load_evalpoints(tag, eval_reduction)
 
     nav_agent = smdpagent.SMDPAgent(stateN, len(env.placecells) + contextD,
                                     actions, name="NavAgent",
@@ -90,10 +179,13 @@ def run_deliveryenvironment(navargs, ctrlargs, tag=None, seed=None):
     net.connect(nav_agent.getOrigin("action_output"),
                 env.getTermination("action"))
 
+    # termination conditions for both agents are checked by the same engine
+    term_engine = terminationnode.TerminationEngine(env)
+
     # termination node for nav_agent (just a timer that goes off regularly)
     nav_term_node = terminationnode.TerminationNode(
         {terminationnode.Timer((0.6, 0.9)): None}, env, contextD=2,
-        name="NavTermNode")
+        name="NavTermNode", engine=term_engine)
     net.add(nav_term_node)
 
     net.connect(nav_term_node.getOrigin("reset"),
@@ -129,7 +221,8 @@ def run_deliveryenvironment(navargs, ctrlargs, tag=None, seed=None):
     # in one action
     ctrl_term_node = terminationnode.TerminationNode(
         {"a": [0, 1], "b": [1, 0], terminationnode.Timer((30, 30)): None},
-        env, contextD=2, name="CtrlTermNode", rewardval=1.5)
+        env, contextD=2, name="CtrlTermNode", rewardval=1.5,
+        engine=term_engine)
     net.add(ctrl_term_node)
 
     # reward for nav_agent is the pseudoreward from ctrl_agent termination
@@ -172,18 +265,19 @@ def run_deliveryenvironment(navargs, ctrlargs, tag=None, seed=None):
     # period to save weights (realtime, not simulation time)
     weight_save = 600.0
 
-    threads = [
-        HRLutils.WeightSaveThread(nav_agent.getNode("QNetwork").saveParams,
-                                  os.path.join("weights", "%s_%s" %
-                                               (nav_agent.name, tag)),
-                                  weight_save),
-        HRLutils.WeightSaveThread(ctrl_agent.getNode("QNetwork").saveParams,
-                                  os.path.join("weights", "%s_%s" %
-                                               (ctrl_agent.name, tag)),
-                                  weight_save)]
+    checkpoints = checkpointmanager.CheckpointManager(period=weight_save)
+    net.add(checkpoints)
+    checkpoints.add(nav_agent.getNode("QNetwork"),
+                    os.path.join("weights", "%s_%s" % (nav_agent.name, tag)))
+    checkpoints.add(ctrl_agent.getNode("QNetwork"),
+                    os.path.join("weights", "%s_%s" % (ctrl_agent.name, tag)))
 
-    for t in threads:
-        t.start()
+    if eval_refresh is not None:
+        stateD = len(env.placecells) + contextD
+        add_evalreservoir(net, nav_agent, ctrl_output_relay, stateD, tag,
+                          eval_refresh)
+        add_evalreservoir(net, ctrl_agent, env.getOrigin("placewcontext"),
+                          stateD, tag, eval_refresh)
 
     # data collection node
     data = datanode.DataNode(period=5,
@@ -197,20 +291,29 @@ def run_deliveryenvironment(navargs, ctrlargs, tag=None, seed=None):
     data.record_sparsity(q_net.getNode("state_pop").getOrigin("AXON"))
     data.record_avg(q_net.getNode("valdiff").getOrigin("X"))
     data.record_avg(ctrl_agent.getNode("ErrorNetwork").getOrigin("error"))
+    # peak error during each ctrl_agent learning period
+    data.record_triggered(
+        ctrl_agent.getNode("ErrorNetwork").getOrigin("error"),
+        ctrl_term_node.getOrigin("learn"), summary=datanode.window_peak)
 
 #     net.add_to_nengo()
 #     net.run(10000)
+#     checkpoints.stop()
+    # note: the simulation runs in the GUI after view() returns, so the
+    # final checkpoint is saved on exit (see CheckpointManager.stop)
+    add_tickprofiler(net)
     net.view()
 
-    for t in threads:
-        t.stop()
 
-
-def run_contextenvironment(args, seed=None):
+def run_contextenvironment(args, seed=None, eval_reduction=None,
+                           eval_refresh=None):
     """Runs the model on the context task.
 
     :param args: kwargs for the agent
     :param seed: random seed
+    :param eval_reduction: eval point reduction (see load_evalpoints)
+    :param eval_refresh: if not None, kwargs for an EvalReservoir attached
+        to each agent (see add_evalreservoir)
     """
 
     if seed is not None:
@@ -252,9 +355,7 @@ def run_contextenvironment(args, seed=None):
     enc = MU.prod(enc, 1.0 / max_state_input)
 
     # load eval points from file
-    with open(HRLutils.datafile("contextbmp_evalpoints_%s.txt" % seed)) as f:
-        print "loading contextbmp_evalpoints_%s.txt" % seed
-        evals = [[float(x) for x in l.split(" ")] for l in f.readlines()]
+    evals = load_evalpoints(seed, eval_reduction)
 
     agent = smdpagent.SMDPAgent(stateN, len(env.placecells) + contextD,
                                 actions, state_encoders=enc, state_evals=evals,
@@ -265,11 +366,14 @@ def run_contextenvironment(args, seed=None):
 
     # period to save weights (realtime, not simulation time)
     weight_save = 600.0
-    t = HRLutils.WeightSaveThread(agent.getNode("QNetwork").saveParams,
-                                  os.path.join("weights", "%s_%s" %
-                                               (agent.name, seed)),
-                                  weight_save)
-    t.start()
+    checkpoints = checkpointmanager.CheckpointManager(period=weight_save)
+    net.add(checkpoints)
+    checkpoints.add(agent.getNode("QNetwork"),
+                    os.path.join("weights", "%s_%s" % (agent.name, seed)))
+
+    if eval_refresh is not None:
+        add_evalreservoir(net, agent, env.getOrigin("placewcontext"),
+                          len(env.placecells) + contextD, seed, eval_refresh)
 
     # data collection node
     data = datanode.DataNode(period=5,
@@ -298,13 +402,23 @@ def run_contextenvironment(args, seed=None):
 
 #    net.add_to_nengo()
 #    net.run(2000)
+#    checkpoints.stop()
+    # note: the simulation runs in the GUI after view() returns, so the
+    # final checkpoint is saved on exit (see CheckpointManager.stop)
+    add_tickprofiler(net)
     net.view()
 
-    t.stop()
 
+def run_flat_delivery(args, seed=None, eval_reduction=None,
+                      eval_refresh=None):
+    """Runs the model on the delivery task with only one hierarchical level.
 
-def run_flat_delivery(args, seed=None):
-    """Runs the model on the delivery task with only one hierarchical level."""
+    :param args: kwargs for the agent
+    :param seed: random seed
+    :param eval_reduction: eval point reduction (see load_evalpoints)
+    :param eval_refresh: if not None, kwargs for an EvalReservoir attached
+        to each agent (see add_evalreservoir)
+    """
 
     if seed is not None:
         HRLutils.set_seed(seed)
@@ -337,8 +451,7 @@ def run_flat_delivery(args, seed=None):
     enc = env.gen_encoders(stateN, contextD, context_scale)
     enc = MU.prod(enc, 1.0 / max_state_input)
 
-    with open(HRLutils.datafile("contextbmp_evalpoints_%s.txt" % seed)) as f:
-        evals = [[float(x) for x in l.split(" ")] for l in f.readlines()]
+    evals = load_evalpoints(seed, eval_reduction)
 
     nav_agent = smdpagent.SMDPAgent(stateN, len(env.placecells) + contextD,
                                     actions, name="NavAgent",
@@ -376,10 +489,14 @@ def run_flat_delivery(args, seed=None):
 
     # period to save weights (realtime, not simulation time)
     weight_save = 600.0
-    HRLutils.WeightSaveThread(nav_agent.getNode("QNetwork").saveParams,
-                              os.path.join("weights", "%s_%s" %
-                                           (nav_agent.name, seed)),
-                              weight_save).start()
+    checkpoints = checkpointmanager.CheckpointManager(period=weight_save)
+    net.add(checkpoints)
+    checkpoints.add(nav_agent.getNode("QNetwork"),
+                    os.path.join("weights", "%s_%s" % (nav_agent.name, seed)))
+
+    if eval_refresh is not None:
+        add_evalreservoir(net, nav_agent, env.getOrigin("placewcontext"),
+                          len(env.placecells) + contextD, seed, eval_refresh)
 
     # data collection node
     data = datanode.DataNode(period=5,
@@ -392,9 +509,17 @@ def run_flat_delivery(args, seed=None):
     data.record_sparsity(q_net.getNode("state_pop").getOrigin("AXON"))
     data.record_avg(q_net.getNode("valdiff").getOrigin("X"))
     data.record_avg(nav_agent.getNode("ErrorNetwork").getOrigin("error"))
+    # integrated error over each learning period
+    data.record_triggered(
+        nav_agent.getNode("ErrorNetwork").getOrigin("error"),
+        nav_term_node.getOrigin("learn"), summary=datanode.window_integral)
 
 #    net.add_to_nengo()
 #    net.run(10000)
+#    checkpoints.stop()
+    # note: the simulation runs in the GUI after view() returns, so the
+    # final checkpoint is saved on exit (see CheckpointManager.stop)
+    add_tickprofiler(net)
     net.view()
 
 
@@ -435,9 +560,11 @@ def run_badreenvironment(nav_args, ctrl_args, bias=0.0, seed=None, flat=False,
     print "agent neurons:", nav_agent.countNeurons()
 
     # actions terminate on fixed schedule (aligned with environment)
+    term_engine = terminationnode.TerminationEngine(env)
     nav_term_node = terminationnode.TerminationNode(
         {terminationnode.Timer((0.6, 0.6)): None}, env, name="NavTermNode",
-        state_delay=0.1, reset_delay=0.05, reset_interval=0.1)
+        state_delay=0.1, reset_delay=0.05, reset_interval=0.1,
+        engine=term_engine)
     net.add(nav_term_node)
 
     net.connect(nav_term_node.getOrigin("reset"),
@@ -470,7 +597,8 @@ def run_badreenvironment(nav_args, ctrl_args, bias=0.0, seed=None, flat=False,
 
     ctrl_term_node = terminationnode.TerminationNode(
         {terminationnode.Timer((0.6, 0.6)): None}, env, name="CtrlTermNode",
-        state_delay=0.1, reset_delay=0.05, reset_interval=0.1)
+        state_delay=0.1, reset_delay=0.05, reset_interval=0.1,
+        engine=term_engine)
     net.add(ctrl_term_node)
 
     net.connect(ctrl_term_node.getOrigin("reset"),
@@ -566,17 +694,12 @@ def run_badreenvironment(nav_args, ctrl_args, bias=0.0, seed=None, flat=False,
 
     # save weights
     weight_save = 1.0  # period to save weights (realtime, not simulation time)
-    threads = [
-        HRLutils.WeightSaveThread(nav_agent.getNode("QNetwork").saveParams,
-                                  os.path.join("weights", "%s_%s" %
-                                               (nav_agent.name, seed)),
-                                  weight_save),
-        HRLutils.WeightSaveThread(ctrl_agent.getNode("QNetwork").saveParams,
-                                  os.path.join("weights", "%s_%s" %
-                                               (ctrl_agent.name, seed)),
-                                  weight_save)]
-    for t in threads:
-        t.start()
+    checkpoints = checkpointmanager.CheckpointManager(period=weight_save)
+    net.add(checkpoints)
+    checkpoints.add(nav_agent.getNode("QNetwork"),
+                    os.path.join("weights", "%s_%s" % (nav_agent.name, seed)))
+    checkpoints.add(ctrl_agent.getNode("QNetwork"),
+                    os.path.join("weights", "%s_%s" % (ctrl_agent.name, seed)))
 
     # data collection node
     data = datanode.DataNode(period=1,
@@ -589,24 +712,26 @@ def run_badreenvironment(nav_args, ctrl_args, bias=0.0, seed=None, flat=False,
     net.add(data)
     nav_q = nav_agent.getNode("QNetwork")
     ctrl_q = ctrl_agent.getNode("QNetwork")
-    ctrl_bg = ctrl_agent.getNode("BGNetwork").getNode("weight_actions")
     data.record_avg(env.getOrigin("reward"))
     data.record_avg(ctrl_q.getNode("actionvals").getOrigin("X"))
     data.record_sparsity(ctrl_q.getNode("state_pop").getOrigin("AXON"))
     data.record_sparsity(nav_q.getNode("state_pop").getOrigin("AXON"))
     data.record_avg(ctrl_q.getNode("valdiff").getOrigin("X"))
     data.record_avg(ctrl_agent.getNode("ErrorNetwork").getOrigin("error"))
-    data.record_avg(ctrl_bg.getNode("0").getOrigin("AXON"))
-    data.record_avg(ctrl_bg.getNode("1").getOrigin("AXON"))
+    if ctrl_agent.backends["selection"] == "neural":
+        ctrl_bg = ctrl_agent.getNode("BGNetwork").getNode("weight_actions")
+        data.record_avg(ctrl_bg.getNode("0").getOrigin("AXON"))
+        data.record_avg(ctrl_bg.getNode("1").getOrigin("AXON"))
     data.record(env.getOrigin("score"))
 
 #     net.add_to_nengo()
 #     net.network.simulator.run(0, 300, 0.001)
+#     checkpoints.stop()
+    # note: the simulation runs in the GUI after view() returns, so the
+    # final checkpoint is saved on exit (see CheckpointManager.stop)
+    add_tickprofiler(net)
     net.view()
 
-    for t in threads:
-        t.stop()
-
 
 def run_gridworld(args, seed=None):
 
@@ -640,12 +765,22 @@ def run_gridworld(args, seed=None):
     net.connect(agent.getOrigin("action_output"), env.getTermination("action"))
     net.connect(agent.getOrigin("Qs"), env.getTermination("Qs"))
 
+    checkpoints = checkpointmanager.CheckpointManager(period=600.0)
+    net.add(checkpoints)
+    checkpoints.add(agent.getNode("QNetwork"),
+                    os.path.join("weights", "%s_%s" % (agent.name, seed)))
+
     # net.add_to_nengo()
     # view = timeview.View(net.network, update_frequency=5)
     # view.add_watch(gridworldwatch.GridWorldWatch())
     # view.restore()
 
-    net.network.simulator.run(0, 1000, 0.001)
+    add_tickprofiler(net)
+
+    try:
+        net.network.simulator.run(0, 1000, 0.001)
+    finally:
+        checkpoints.stop()
 
     print "latencies"
     print len(env.latencies)
@@ -725,43 +860,189 @@ def gen_evalpoints(filename, seed=None):
 #     net.view()
 
 
+def sample_evalpoints(filename, seed=None, num_points=10000, visitation=0.5):
+    """Samples eval points directly from the environment (rather than
+    running it, as in gen_evalpoints), see evalsampler.
+
+    :param filename: base name of file in which to save eval points
+    :param seed: random seed
+    :param num_points: number of eval points
+    :param visitation: fraction of points sampled from optimal trajectories
+    """
+
+    if seed is not None:
+        HRLutils.set_seed(seed)
+    seed = HRLutils.SEED
+
+    contextD = 2
+    actions = [("up", [0, 1]), ("right", [1, 0]),
+               ("down", [0, -1]), ("left", [-1, 0])]
+
+    rewards = {"a": 1, "b": 1}
+
+    # note: same parameters as gen_evalpoints (the place cells only depend on
+    # the map and seed, so they will match the environment in the run_*
+    # functions)
+    env = contextenvironment.ContextEnvironment(
+        actions, HRLutils.datafile("contextmap.bmp"), contextD, rewards,
+        imgsize=(5, 5), dx=0.001, placedev=0.5,
+        colormap={-16777216: "wall", -1: "floor", -256: "a", -2088896: "b"})
+
+    points = evalsampler.sample(env, env.contexts, num_points,
+                                visitation=visitation)
+
+    filename = HRLutils.datafile("%s_%s" % (filename, seed))
+    evalsampler.save(filename, points, seed=seed)
+    print "saved %d eval points to %s" % (len(points),
+                                           weightstore.shard_name(filename, 0))
+
+
+def convert_evalpoints():
+    """Convert all the text eval point files in the data directory to the
+    binary format (see weightstore.convert_text)."""
+
+    datadir = HRLutils.datafile("")
+    for f in sorted(os.listdir(datadir)):
+        if ((f.startswith("contextbmp_evalpoints_") or
+             f == "badre_evalpoints.txt") and f.endswith(".txt")):
+            filename = weightstore.convert_text(os.path.join(datadir, f))
+            print "converted", f, "to", weightstore.shard_name(filename, 0)
+
+
+def estimate(task, seed=None, stateN=1200, backend="neural"):
+    """Estimate the resources needed to build the model for the given task
+    (without building it, see sizing).
+
+    :param task: "delivery", "context", or "flat_delivery"
+    :param seed: random seed (selects the eval point file)
+    :param stateN: number of neurons in the state populations
+    :param backend: see SMDPAgent.__init__
+    :returns: sizing.Estimate for the model
+    """
+
+    if seed is not None:
+        HRLutils.set_seed(seed)
+    seed = HRLutils.SEED
+
+    levels = {"delivery": 2, "context": 1, "flat_delivery": 1}[task]
+    contextD = 2
+
+    # note: the number of place cells only depends on the map and the place
+    # cell parameters (not the environment type)
+    env = deliveryenvironment.DeliveryEnvironment(
+        [("up", [0, 1]), ("right", [1, 0]), ("down", [0, -1]),
+         ("left", [-1, 0])], HRLutils.datafile("contextmap.bmp"),
+        colormap={-16777216: "wall", -1: "floor", -256: "a", -2088896: "b"},
+        imgsize=(5, 5), dx=0.001, placedev=0.5)
+
+    filename = HRLutils.datafile("contextbmp_evalpoints_%s" % seed)
+    if (weightstore.exists(filename) or
+            os.path.exists(filename + ".txt")):
+        num_evals = len(weightstore.load(filename))
+    else:
+        num_evals = None
+
+    return sizing.hierarchy(stateN, len(env.placecells), contextD,
+                            levels=levels, num_evals=num_evals,
+                            backend=backend)
+
+
 if __name__ == "__main__":
     # NodeThreadPool.setNumJavaThreads(4)
+    # e.g. "run.py delivery 0 --functional" to use the functional
+    # selection/error subsystems (see SMDPAgent.__init__)
+    backend = "neural"
+    if "--functional" in sys.argv:
+        sys.argv.remove("--functional")
+        backend = "functional"
+
+    # e.g. "run.py delivery 0 --profile-build" to report where the build
+    # time goes (see buildprofiler)
+    if "--profile-build" in sys.argv:
+        sys.argv.remove("--profile-build")
+        buildprofiler.enable(phases=[
+            (sys.modules[__name__], "load_evalpoints"),
+            (deliveryenvironment.DeliveryEnvironment, "gen_encoders"),
+            (contextenvironment.ContextEnvironment, "gen_encoders"),
+            (badreenvironment.BadreEnvironment, "gen_encoders")])
+
+    # e.g. "run.py delivery 0 --adaptive-evals" to choose the number of eval
+    # points for each ensemble by calibration (see evalpoints)
+    if "--adaptive-evals" in sys.argv:
+        sys.argv.remove("--adaptive-evals")
+        HRLutils.EVAL_POINTS = "adaptive"
+        atexit.register(evalpoints.report)
+
+    # e.g. "run.py delivery 0 --decoder-solver" to solve for the state
+    # population decoders with decodersolver (see HRLutils.make_ensemble)
+    if "--decoder-solver" in sys.argv:
+        sys.argv.remove("--decoder-solver")
+        HRLutils.DECODER_SOLVER = True
+
+    # e.g. "run.py delivery 0 --dry-run" to print the estimated size of the
+    # model without building it (see sizing)
+    dry_run = "--dry-run" in sys.argv
+    if dry_run:
+        sys.argv.remove("--dry-run")
+
+    # e.g. "run.py delivery 0 --profile-ticks" to report the time spent in
+    # each SimpleNode during the simulation (see add_tickprofiler)
+    if "--profile-ticks" in sys.argv:
+        sys.argv.remove("--profile-ticks")
+        PROFILE_TICKS = 300.0
+
     seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
 
-    if sys.argv[1] == "delivery":
+    if dry_run:
+        est = estimate(sys.argv[1], seed=seed, backend=backend)
+        est.report()
+        print "total: ~%.1fMB, ~%.1fs build" % (est.memory() / 2.0 ** 20,
+                                                est.build_time())
+    elif sys.argv[1] == "delivery":
         run_deliveryenvironment({"learningrate": 9e-10, "discount": 0.1,
-                                 "Qradius": 2.0, "load_weights": None},
+                                 "Qradius": 2.0, "load_weights": None,
+                                 "backend": backend},
                                 {"learningrate": 9e-10, "discount": 0.1,
-                                 "load_weights": None},
+                                 "load_weights": None,
+                                 "backend": backend},
                                 seed=seed)
     elif sys.argv[1] == "context":
         run_contextenvironment({"learningrate": 9e-10, "discount": 0.1,
-                                "Qradius": 2.0, "load_weights": None},
+                                "Qradius": 2.0, "load_weights": None,
+                                "backend": backend},
                                seed=seed)
     elif sys.argv[1] == "flat_delivery":
         run_flat_delivery({"learningrate": 9e-10, "discount": 0.1,
-                           "Qradius": 2.0, "load_weights": None},
+                           "Qradius": 2.0, "load_weights": None,
+                           "backend": backend},
                           seed=seed)
     elif sys.argv[1] == "badre_flat":
         run_badreenvironment({"learningrate": 4e-6,
                               "state_threshold": (0.4, 0.4),
-                              "noiselevel": 0.05},
+                              "noiselevel": 0.05,
+                              "backend": backend},
                              {"learningrate": 4e-5,
                               "state_threshold": (0.0, 0.0),
-                              "noiselevel": 0.05},
+                              "noiselevel": 0.05,
+                              "backend": backend},
                              bias=0.25, seed=seed, flat=True)
     elif sys.argv[1] == "badre_hierarchical":
         run_badreenvironment({"learningrate": 4e-6,
                               "state_threshold": (0.2, 0.2),
-                              "noiselevel": 0.05},
+                              "noiselevel": 0.05,
+                              "backend": backend},
                              {"learningrate": 4e-5,
                               "state_threshold": (0.35, 0.35),
-                              "noiselevel": 0.05},
+                              "noiselevel": 0.05,
+                              "backend": backend},
                              bias=0.25, seed=seed, flat=False)
     elif sys.argv[1] == "gridworld":
-        run_gridworld({"learningrate": 1e-9}, seed=seed)
+        run_gridworld({"learningrate": 1e-9, "backend": backend}, seed=seed)
     elif sys.argv[1] == "evalpoints":
         gen_evalpoints(sys.argv[3], seed=seed)
+    elif sys.argv[1] == "sample_evalpoints":
+        sample_evalpoints(sys.argv[3], seed=seed)
+    elif sys.argv[1] == "convert_evalpoints":
+        convert_evalpoints()
     else:
         print "Unknown function: %s" % sys.argv[1]
@@ -0,0 +1,507 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+"""Dry-run resource estimates for the model.
+
+The functions in this module follow the same construction logic as the
+networks in hrlproject.agent (QNetwork, BGNetwork, ErrorNetwork, Memory,
+etc.), but only record the size of each component rather than creating it.
+The result is a tree of Estimates (one per network), giving the number of
+neurons, the sizes of the encoder/decoder/eval point matrices, and the
+sizes of the connection transforms, from which the memory use and build
+time are estimated.
+
+The sizes that aren't derived from the inputs (the base number of neurons,
+HRLutils.BASE_N, and the neuron counts and eval points of particular
+populations) are imported from the network modules, and test.test_sizing
+compares the estimated neuron counts and eval points with a real build (so
+that the estimates don't drift from the networks they describe).
+
+The memory and time estimates are based on the constants below, which can
+be calibrated against a real build (see calibrate, which uses the output of
+buildprofiler).
+
+e.g.::
+
+    est = sizing.hierarchy(1200, 60, 2, levels=2)
+    est.report()
+    if est.memory() > 8 * 2 ** 30:
+        print "won't fit"
+"""
+
+from ca.nengo.model.nef.impl import NEFEnsembleFactoryImpl
+
+from hrlproject.misc import HRLutils
+from hrlproject.agent import memory as memory_module
+from hrlproject.agent import bgnetwork as bgnetwork_module
+from hrlproject.agent import errorcalc2 as errorcalc2_module
+from hrlproject.agent import positivebias as positivebias_module
+
+# approximate memory used by each neuron (neuron model objects and their
+# state), in bytes
+BYTES_PER_NEURON = 1000
+
+# bytes per value in encoder/decoder/eval point/transform matrices (floats)
+BYTES_PER_VALUE = 4
+
+# time taken per multiply-add in the decoder solve (seconds), the solve for
+# an ensemble with N neurons and P eval points takes about N*N*P (computing
+# the gamma matrix) + N*N*N (inverting it) operations
+SOLVE_RATE = 2e-9
+
+# build time per neuron, not including the decoder solve (seconds)
+BUILD_RATE = 1e-5
+
+
+def nengo_eval_points(d):
+    """Number of eval points used by Nengo's default ensemble factory."""
+
+    return NEFEnsembleFactoryImpl().getNumEvalPoints(d)
+
+
+class Estimate:
+    """Sizes of the components of one network."""
+
+    def __init__(self, name, kind):
+        """Initialize estimate.
+
+        :param name: name of network
+        :param kind: type of network (e.g. "QNetwork")
+        """
+
+        self.name = name
+        self.kind = kind
+        self.children = []
+
+        # (name, neurons, dimensions, eval points, decoded outputs, count)
+        # for each (set of) ensembles
+        self.ensembles = []
+
+        # (name, rows, columns) for each transform
+        self.transforms = []
+
+        # number of direct mode ensembles (these count as 1 neuron each in
+        # countNeurons, but have no encoders/decoders)
+        self.direct = 0
+
+    def add(self, child):
+        self.children += [child]
+        return child
+
+    def ensemble(self, name, N, d, eval_points=None, outputs=None,
+                 count=1):
+        """Record an ensemble.
+
+        :param name: name of ensemble
+        :param N: number of neurons
+        :param d: dimensions
+        :param eval_points: number of eval points (defaults to Nengo's
+            default for d)
+        :param outputs: total dimension of all decoded origins (defaults to
+            d, i.e. just the X origin)
+        :param count: number of identical ensembles (e.g. the
+            sub-ensembles of a make_array)
+        """
+
+        if eval_points is None:
+            eval_points = nengo_eval_points(d)
+        if outputs is None:
+            outputs = d
+        self.ensembles += [(name, N, d, eval_points, outputs, count)]
+
+    def array(self, name, N, n, eval_points=None, outputs=1):
+        """Record a network array (see nef.Network.make_array).
+
+        :param N: neurons per sub-ensemble
+        :param n: number of (1D) sub-ensembles
+        :param eval_points: eval points per sub-ensemble
+        :param outputs: total dimension of the decoded origins of each
+            sub-ensemble
+        """
+
+        self.ensemble(name, N, 1, eval_points, outputs, count=n)
+
+    def transform(self, name, rows, cols):
+        self.transforms += [(name, rows, cols)]
+
+    def make_direct(self, count=1):
+        self.direct += count
+
+    def walk(self):
+        """Returns this estimate and all its descendants."""
+
+        result = [self]
+        for c in self.children:
+            result += c.walk()
+        return result
+
+    def totals(self, recursive=True):
+        """Returns a dict of totals (neurons, encoder/decoder/eval
+        point/transform values, and the largest solve)."""
+
+        t = {"neurons": 0, "direct": 0, "ensembles": 0, "encoders": 0,
+             "decoders": 0, "eval_points": 0, "transforms": 0,
+             "solve_ops": 0, "max_solve_bytes": 0}
+        nodes = self.walk() if recursive else [self]
+        for e in nodes:
+            t["direct"] += e.direct
+            for _, N, d, P, out, count in e.ensembles:
+                t["neurons"] += N * count
+                t["ensembles"] += count
+                t["encoders"] += N * d * count
+                t["decoders"] += N * out * count
+                t["eval_points"] += P * d * count
+                t["solve_ops"] += (N * N * P + N * N * N) * count
+
+                # note: the solve holds the activities at the eval points and
+                # the gamma matrix (plus its inverse), as doubles
+                t["max_solve_bytes"] = max(t["max_solve_bytes"],
+                                           8 * (N * P + 2 * N * N))
+            for _, rows, cols in e.transforms:
+                t["transforms"] += rows * cols
+        return t
+
+    def memory(self, recursive=True):
+        """Estimated memory use (bytes) of the built network, including the
+        temporary memory needed to solve for decoders."""
+
+        t = self.totals(recursive)
+        values = (t["encoders"] + t["decoders"] + t["eval_points"] +
+                  t["transforms"])
+        return ((t["neurons"] + t["direct"]) * BYTES_PER_NEURON +
+                values * BYTES_PER_VALUE + t["max_solve_bytes"])
+
+    def build_time(self, recursive=True):
+        """Estimated build time (seconds), assuming no decoders are
+        cached."""
+
+        t = self.totals(recursive)
+        return (t["neurons"] * BUILD_RATE + t["solve_ops"] * SOLVE_RATE)
+
+    def lines(self, depth=0):
+        t = self.totals()
+        lines = ["%s%s [%s]: %d neurons, %d ensembles, encoders %d, "
+                 "decoders %d, eval points %d, transforms %d values, "
+                 "~%.1fMB, ~%.1fs" %
+                 ("  " * depth, self.name, self.kind, t["neurons"] +
+                  t["direct"], t["ensembles"], t["encoders"], t["decoders"],
+                  t["eval_points"], t["transforms"],
+                  self.memory() / 2.0 ** 20, self.build_time())]
+        for c in self.children:
+            lines += c.lines(depth + 1)
+        return lines
+
+    def report(self):
+        print "\n".join(self.lines())
+
+
+def memory(name, N, d, radius=1.0, direct_storage=False, functional=False):
+    """Estimate for memory.make_memory."""
+
+    est = Estimate(name, "GatedMemoryNode" if functional else "Memory")
+    if functional:
+        return est
+
+    if direct_storage:
+        est.make_direct()
+    else:
+        est.array("storage", N, d,
+                  eval_points=len(memory_module.storage_eval_points()))
+    est.transform("storage->storage", d, d)
+
+    est.array("storageinput", N, d)
+    est.transform("storageinput.target", d, d)
+    est.transform("storageinput->storage", d, d)
+    est.transform("storage->storageinput", d, d)
+
+    est.ensemble("transferinhib", N, 1)
+    est.transform("transferinhib.gate", N, 1)
+    est.transform("transferinhib->storageinput", N * d, 1)
+
+    est.make_direct()  # storageoutput
+    return est
+
+
+def actionvalues(name, N, stateN, num_actions, factored=False):
+    """Estimate for ActionValues."""
+
+    est = Estimate(name, "ActionValues")
+    est.make_direct()  # output
+    for i in range(num_actions):
+        est.ensemble("action_%d" % i, N * 4, 1)
+        if factored:
+            est.transform("learning", 1, num_actions)
+        else:
+            est.transform("error", 1, num_actions)
+            est.transform("learning", N * 4, stateN)
+        est.transform("action->output", num_actions, 1)
+    if factored:
+        # factors (one value per state neuron per action)
+        est.transform("factors", num_actions, stateN)
+    return est
+
+
+def qnetwork(stateN, stateD, num_actions, num_evals=None,
+             functional_memory=False, neuron_learning=False,
+             factored_weights=False):
+    """Estimate for QNetwork.
+
+    :param num_evals: number of eval points for the state populations
+        (defaults to Nengo's default for stateD, as with net.make)
+    """
+
+    N = HRLutils.BASE_N
+    if num_evals is None:
+        num_evals = nengo_eval_points(stateD)
+
+    est = Estimate("QNetwork", "QNetwork")
+    est.make_direct()  # state_relay
+    est.transform("state_relay.input", stateD, stateD)
+
+    outputs = stateD + (stateD if neuron_learning else num_actions)
+    est.ensemble("state_pop", stateN, stateD, num_evals, outputs)
+    est.transform("state_relay->state_pop", stateD, stateD)
+
+    est.add(memory("saved_state", N * 4, stateD, direct_storage=True,
+                   functional=functional_memory))
+
+    est.ensemble("old_state_pop", stateN, stateD, num_evals, outputs)
+    est.transform("saved_state->old_state_pop", stateD, stateD)
+
+    if neuron_learning:
+        est.add(actionvalues("actionvals", N, stateN, num_actions,
+                             factored_weights))
+        est.add(actionvalues("old_actionvals", N, stateN, num_actions,
+                             factored_weights))
+    else:
+        est.make_direct(2)  # actionvals, old_actionvals
+
+    est.array("valdiff", N, num_actions)
+    est.transform("old_actionvals->valdiff", num_actions, num_actions)
+    est.transform("actionvals->valdiff", num_actions, num_actions)
+
+    est.array("statediff", N, stateD)
+    est.transform("state_relay->statediff", stateD, stateD)
+    est.transform("saved_state->statediff", stateD, stateD)
+    est.transform("statediff->valdiff", N * num_actions, stateD)
+
+    return est
+
+
+def basalganglia(d, neurons=bgnetwork_module.BG_NEURONS):
+    """Estimate for nps.basalganglia.make_basal_ganglia (strD1, strD2, STN,
+    GPi, and GPe, each an array of d ensembles)."""
+
+    est = Estimate("bg", "BasalGanglia")
+    est.make_direct(2)  # bginput, bgoutput
+    for name in ["StrD1", "StrD2", "STN", "GPi", "GPe"]:
+        est.array(name, neurons, d)
+    # note: the connections between the nuclei are decoded (d x d)
+    for _ in range(10):
+        est.transform("bg", d, d)
+    return est
+
+
+def bgnetwork(num_actions, actionD, functional_memory=False):
+    """Estimate for BGNetwork."""
+
+    N = HRLutils.BASE_N
+    est = Estimate("BGNetwork", "BGNetwork")
+    est.add(basalganglia(num_actions))
+
+    est.array("invert", N, num_actions)
+    est.transform("invert->invert", num_actions, num_actions)
+
+    est.array("val_threshold", N * 2, num_actions, outputs=2)
+    est.array("weight_actions", bgnetwork_module.WEIGHT_ACTIONS_N, actionD)
+    est.transform("val_threshold->weight_actions", actionD, num_actions)
+
+    est.make_direct()  # save_relay
+    est.add(memory("saved_action", N * 2, actionD,
+                   functional=functional_memory))
+    est.add(memory("saved_values", N * 2, num_actions,
+                   functional=functional_memory))
+    est.array("saved_vals_threshold", N, num_actions, outputs=2)
+    return est
+
+
+def positivebias(N, d):
+    """Estimate for PositiveBias."""
+
+    est = Estimate("PositiveBias", "PositiveBias")
+    est.array("neg_thresh", N, d, outputs=2)
+    est.array("bias_pop", N, d,
+              eval_points=len(positivebias_module.bias_eval_points()))
+    est.transform("neg_thresh->bias_pop", N * d, d)
+    est.transform("bias_pop.learn", N * d, 1)
+    return est
+
+
+def errorcalc2(functional_memory=False):
+    """Estimate for ErrorCalc2."""
+
+    N = HRLutils.BASE_N
+    est = Estimate("ErrorCalc", "ErrorCalc2")
+    est.make_direct(2)  # currQ, storeQ
+    est.ensemble("reset", N, 1)
+    est.add(memory("acc_storeQ", N * 8, 1, functional=functional_memory))
+    est.ensemble("Qthresh", N * 2, 1,
+                 eval_points=len(errorcalc2_module.qthresh_eval_points()),
+                 outputs=2)
+    est.add(memory("reward", N * 4, 1, functional=functional_memory))
+    est.ensemble("error", N * 2, 1)
+    return est
+
+
+def errornetwork(num_actions, functional_memory=False):
+    """Estimate for ErrorNetwork."""
+
+    N = HRLutils.BASE_N
+    est = Estimate("ErrorNetwork", "ErrorNetwork")
+    est.make_direct(4)  # relays
+
+    for name in ["gatedQ", "gatedstoreQ"]:
+        est.array(name, N * 2, num_actions)
+        est.transform(name + " gate", N * 2 * num_actions, num_actions)
+    est.make_direct(2)  # currQ, storeQ
+
+    est.add(errorcalc2(functional_memory))
+
+    est.array("gatederror", N * 2, num_actions)
+    est.ensemble("learninggate", N, 1, outputs=2)
+    est.transform("learninggate.gate", N, 1)
+    est.transform("learninggate->gatederror", N * 2 * num_actions, 1)
+    est.transform("saved_bg_relay->gatederror", N * 2 * num_actions,
+                  num_actions)
+
+    est.add(positivebias(N, num_actions))
+    est.make_direct()  # biasederror
+    return est
+
+
+def smdpagent(stateN, stateD, num_actions, actionD, name="SMDPAgent",
+              num_evals=None, backend="neural", **kwargs):
+    """Estimate for SMDPAgent.
+
+    :param num_actions: number of actions
+    :param actionD: dimension of the action vectors
+    :param backend: see SMDPAgent.__init__
+    :param kwargs: passed to qnetwork (e.g. neuron_learning)
+    """
+
+    if isinstance(backend, dict):
+        backends = dict(backend)
+    else:
+        backends = {"selection": backend, "error": backend,
+                    "memory": backend}
+    functional_memory = backends.get("memory", "neural") == "functional"
+
+    est = Estimate(name, "SMDPAgent")
+    est.add(qnetwork(stateN, stateD, num_actions, num_evals,
+                     functional_memory=functional_memory, **kwargs))
+    if backends.get("selection", "neural") == "functional":
+        est.add(Estimate("BGNetwork", "BGNode"))
+    else:
+        est.add(bgnetwork(num_actions, actionD, functional_memory))
+    if backends.get("error", "neural") == "functional":
+        est.add(Estimate("ErrorNetwork", "ErrorNode"))
+    else:
+        est.add(errornetwork(num_actions, functional_memory))
+    return est
+
+
+def hierarchy(stateN, num_places, contextD, levels=2, num_actions=4,
+              actionD=2, num_evals=None, **kwargs):
+    """Estimate for a hierarchy of agents as built in the run_* functions
+    (e.g. run_deliveryenvironment with levels=2, run_flat_delivery and
+    run_contextenvironment with levels=1).
+
+    The bottom level selects between the num_actions basic actions, and each
+    higher level selects between contextD contexts for the level below.
+
+    :param stateN: number of neurons in each state population
+    :param num_places: number of place cells
+    :param contextD: dimension of the context vector
+    :param levels: number of levels in the hierarchy
+    :param num_actions: number of basic actions
+    :param actionD: dimension of the basic action vectors
+    :param num_evals: number of eval points for the state populations
+    :param kwargs: passed to smdpagent
+    """
+
+    est = Estimate("model", "Network")
+    stateD = num_places + contextD
+    for level in range(levels):
+        if level == 0:
+            n, d = num_actions, actionD
+        else:
+            n, d = contextD, contextD
+        est.add(smdpagent(stateN, stateD, n, d, name="Level%d" % level,
+                          num_evals=num_evals, **kwargs))
+    return est
+
+
+def calibrate(filename, est=None):
+    """Calibrate SOLVE_RATE and BUILD_RATE against a build profile (the .tsv
+    file saved by buildprofiler.report).
+
+    Only ensembles whose decoders were all solved (i.e. had no decoder cache
+    hits) are used to calibrate SOLVE_RATE, so the profile should be from a
+    build with an empty cache (the solve time is only recorded for decoders
+    that go through the cache, so the cache can't just be turned off).
+
+    :param filename: name of the .tsv file
+    :param est: if not None, an Estimate for the profiled model, whose
+        neuron counts are compared with the profile
+    :returns: dict with the new rates
+    """
+
+    global SOLVE_RATE, BUILD_RATE
+
+    f = open(filename, "r")
+    header = f.readline().strip().split("\t")
+    rows = [dict(zip(header, line.rstrip("\n").split("\t")))
+            for line in f if line.strip() != ""]
+    f.close()
+
+    if "cache_hits" not in header:
+        raise ValueError("%s has no decoder cache statistics (profile "
+                         "saved by an older version of buildprofiler)" %
+                         filename)
+
+    solve_time = 0.0
+    solve_ops = 0
+    build_time = 0.0
+    neurons = 0
+    for r in rows:
+        if r["kind"] != "ensemble" or "-" in (r["neurons"], r["dimensions"],
+                                              r["eval_points"]):
+            continue
+        N = int(r["neurons"])
+        P = int(r["eval_points"])
+        # note: the solve time includes cache lookups, so ensembles with any
+        # cache hits would calibrate the rate to the lookup time
+        if float(r["solve_time"]) > 0 and int(r["cache_hits"]) == 0:
+            solve_time += float(r["solve_time"])
+            solve_ops += N * N * P + N * N * N
+        build_time += float(r["time"]) - float(r["solve_time"])
+        neurons += N
+
+    if solve_ops > 0:
+        SOLVE_RATE = solve_time / solve_ops
+    if neurons > 0:
+        BUILD_RATE = build_time / neurons
+
+    if est is not None:
+        # compare the neuron counts of the top level networks
+        profiled = {}
+        for r in rows:
+            if r["kind"] == "network" and r["neurons"] != "-":
+                name = r["path"].split("/")[-1]
+                profiled.setdefault(name, int(r["neurons"]))
+        for e in est.walk():
+            if e.name in profiled:
+                t = e.totals()
+                print "%s: estimated %d neurons, built %d" % (
+                    e.name, t["neurons"] + t["direct"], profiled[e.name])
+
+    return {"solve_rate": SOLVE_RATE, "build_rate": BUILD_RATE}
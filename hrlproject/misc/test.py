@@ -9,6 +9,9 @@ import sys
 import math
 import os
 import inspect
+import time
+import jarray
+import threading
 
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(
     inspect.getfile(inspect.currentframe()))), "..", ".."))
@@ -16,25 +19,43 @@ sys.path.append(os.path.join(os.path.dirname(os.path.abspath(
 # from misc import HRLutils
 # HRLutils.full_reset()
 
-from hrlproject.misc import HRLutils, gridworldwatch
-from hrlproject.agent import smdpagent, errorcalc2, actionvalues, memory
+from hrlproject.misc import (HRLutils, gridworldwatch, decodersolver,
+                             evalpoints, weightstore, sizing)
+from hrlproject.agent import (smdpagent, errorcalc2, actionvalues, memory,
+                              bgnetwork, errornetwork)
 from hrlproject.environment import (gridworldenvironment,
                                     contextenvironment, deliveryenvironment,
                                     placecell_bmp, badreenvironment)
 from hrlproject.simplenodes import (datanode, terminationnode, errornode,
-                                    decoderlearningnode)
+                                    decoderlearningnode, bgnode)
 
 from ca.nengo.model import SimulationMode
 from ca.nengo.model.impl import NetworkImpl
+from ca.nengo.model.nef import NEFEnsemble
 from ca.nengo.math.impl import (ConstantFunction, IdentityFunction,
                                 IndicatorPDF)
 from ca.nengo.util import MU
+from Jama import Matrix
 
 import nef
 import timeview
 from nef.templates import hpes_termination
 
 
+def save_results(name, lines):
+    """Write the results of a comparison to data/<name>_results.txt (in
+    addition to printing them).
+
+    :param name: name of comparison
+    :param lines: list of lines of results
+    """
+
+    for line in lines:
+        print line
+    with open(HRLutils.datafile("%s_results.txt" % name), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
 def test_errorcalc():
     net = nef.Network("test_errorcalc")
 
@@ -79,6 +100,93 @@ def test_memorynetwork():
     net.view()
 
 
+def test_gatedmemorynode(simtime=3.0, mem_tolerance=(0.1, 0.3),
+                         acc_tolerance=(0.15, 0.4)):
+    """Compare the output of GatedMemoryNode to the neural Memory, for a
+    gated memory (storing a sine wave) and an integrator (as used in
+    ErrorCalc2).
+
+    :param simtime: length of simulation
+    :param mem_tolerance: maximum (rmse, max error) between the two gated
+        memories
+    :param acc_tolerance: maximum (rmse, max error) between the two
+        integrators
+    """
+
+    net = nef.Network("test_gatedmemorynode")
+
+    intPSC = 0.1
+
+    target = net.make_input("target", lambda t: math.sin(5 * t))
+    store = net.make_input("store", {0.6: 1.0, 1.2: 0.0, 2.0: 1.0, 2.1: 0.0})
+    reward = net.make_input("reward", {0.0: [0.0], 0.3: [1.0], 0.8: [0.0],
+                                       1.5: [-0.5], 1.9: [0.0]})
+    reset = net.make_input("reset", {0.0: [0.0], 2.5: [1.0], 2.6: [0.0]})
+    zero = net.make_input("zero", [0])
+
+    mems = []
+    for functional in [False, True]:
+        mem = memory.make_memory("mem_%s" % functional, 100, 1,
+                                 functional=functional, inputscale=10)
+        net.add(mem)
+        net.connect(target, mem.getTermination("target"))
+        net.connect(store, mem.getTermination("transfer"))
+
+        acc = memory.make_memory("acc_%s" % functional, 200, 1,
+                                 functional=functional, inputscale=50)
+        net.add(acc)
+        acc.addDecodedTermination("input", [[intPSC]], intPSC, False)
+        net.connect(reward, acc.getTermination("input"))
+        net.connect(zero, acc.getTermination("target"))
+        net.connect(reset, acc.getTermination("transfer"))
+
+        mems += [(mem, acc)]
+
+    class MemoryComparison(nef.SimpleNode):
+        def __init__(self):
+            self.vals = {}
+            self.sq_err = {"mem": 0.0, "acc": 0.0}
+            self.max_err = {"mem": 0.0, "acc": 0.0}
+            self.samples = 0
+
+            nef.SimpleNode.__init__(self, "MemoryComparison")
+
+            for name in ["mem_neural", "mem_func", "acc_neural",
+                         "acc_func"]:
+                self.vals[name] = 0.0
+                self.create_termination(name, self.gen_set_func(name))
+
+        def gen_set_func(self, name):
+            def set_func(x, dimensions=1, pstc=0.001):
+                self.vals[name] = x[0]
+
+            return set_func
+
+        def tick(self):
+            self.samples += 1
+            for name in ["mem", "acc"]:
+                e = abs(self.vals[name + "_neural"] - self.vals[name +
+                                                                "_func"])
+                self.sq_err[name] += e ** 2
+                self.max_err[name] = max(self.max_err[name], e)
+
+    comp = MemoryComparison()
+    net.add(comp)
+
+    for (mem, acc), label in zip(mems, ["neural", "func"]):
+        net.connect(mem.getOrigin("X"), comp.getTermination("mem_" + label))
+        net.connect(acc.getOrigin("X"), comp.getTermination("acc_" + label))
+
+    net.run(simtime)
+
+    for name, tolerance in [("mem", mem_tolerance), ("acc", acc_tolerance)]:
+        rmse = math.sqrt(comp.sq_err[name] / max(comp.samples, 1))
+        print "%s: rmse %.4f, max error %.4f" % (name, rmse,
+                                                 comp.max_err[name])
+        assert rmse <= tolerance[0]
+        assert comp.max_err[name] <= tolerance[1]
+
+
 def test_selectioncircuit():
     net = nef.Network("test_selectioncircuit")
 
@@ -143,6 +251,513 @@ def test_decoderlearning():
     net.view()
 
 
+def benchmark_decoderlearning():
+    net = nef.Network("benchmark_decoderlearning")
+
+    N = 1200
+    num_actions = 4
+    ticks = 1000
+
+    pop = net.make("pop", N, 2, node_factory=HRLutils.node_fac())
+    origin = pop.addDecodedOrigin("vals", [ConstantFunction(2, 0.2)
+                                           for _ in range(num_actions)],
+                                  "AXON")
+    dlnode = decoderlearningnode.DecoderLearningNode(pop, origin, 1e-9,
+                                                     errorD=num_actions)
+
+    # activities with ~80% of neurons silent (like state_threshold=0.8)
+    activity = jarray.array([HRLutils.rand.uniform(50, 150)
+                             if HRLutils.rand.random() < 0.2 else 0.0
+                             for _ in range(N)], "f")
+    error = [0.1, 0.0, 0.0, 0.0]
+    zero_error = [0.0] * num_actions
+
+    # check that the two updates give the same result
+    init_decoders = [list(d) for d in origin.getDecoders()]
+    dlnode.update_dense(activity, error)
+    dense_decoders = [list(d) for d in origin.getDecoders()]
+    origin.setDecoders(init_decoders)
+    dlnode.update(activity, error)
+    print "max difference:", max([abs(x - y) for d0, d1 in
+                                  zip(dense_decoders, origin.getDecoders())
+                                  for x, y in zip(d0, d1)])
+
+    for label, func, err in [("dense", dlnode.update_dense, error),
+                             ("sparse", dlnode.update, error),
+                             ("dense, zero error", dlnode.update_dense,
+                              zero_error),
+                             ("sparse, zero error", dlnode.update,
+                              zero_error)]:
+        start = time.time()
+        for _ in range(ticks):
+            func(activity, err)
+        print "%s: %.3f ms/tick" % (label,
+                                    1000 * (time.time() - start) / ticks)
+
+
+def test_decoderbatching(ticks=2000, window=50, gap=10):
+    """Check that batched decoder learning gives the same decoders as
+    per-timestep learning, for the same activity and error inputs."""
+
+    net = nef.Network("test_decoderbatching")
+
+    N = 200
+    num_actions = 4
+    rand = HRLutils.stream("test_decoderbatching")
+
+    pop = net.make("pop", N, 2, node_factory=HRLutils.node_fac())
+    nodes = []
+    for batch in [None, 10, "window"]:
+        origin = pop.addDecodedOrigin("vals_%s" % batch,
+                                      [ConstantFunction(2, 0.2)
+                                       for _ in range(num_actions)], "AXON")
+        dlnode = decoderlearningnode.DecoderLearningNode(
+            pop, origin, 1e-6, errorD=num_actions, batch=batch,
+            name="dlnode_%s" % batch)
+        dlnode.initial_decoders = dlnode.decoders.copy()
+        nodes += [dlnode]
+
+    # learning windows of noisy error, separated by small (but nonzero)
+    # errors, as from a filtered neural error signal
+    for t in range(ticks):
+        activity = jarray.array([rand.uniform(50, 150)
+                                 if rand.random() < 0.2 else 0.0
+                                 for _ in range(N)], "f")
+        scale = 0.5 if t % (window + gap) < window else 0.01
+        error = [rand.gauss(0, scale) for _ in range(num_actions)]
+        for dlnode in nodes:
+            if dlnode.batch is None:
+                dlnode.update(activity, error)
+            else:
+                dlnode.accumulate(activity, error)
+    for dlnode in nodes:
+        dlnode.commit()
+
+    target = nodes[0].origin.getDecoders()
+    size = max([abs(x) for d in target for x in d])
+    for dlnode in nodes[1:]:
+        diff = max([abs(x - y) for d0, d1 in
+                    zip(target, dlnode.origin.getDecoders())
+                    for x, y in zip(d0, d1)])
+        print "batch=%s: max difference %g (max decoder %g)" % (
+            dlnode.batch, diff, size)
+        assert diff <= 1e-4 * size
+        assert len(dlnode.pending) == 0
+
+
+def delivery_state_pop(net, evals):
+    """Make a state population like the one in the delivery task (see
+    run.run_deliveryenvironment) and add it to net."""
+
+    stateN = 1200
+    contextD = 2
+    max_state_input = 2
+    actions = [("up", [0, 1]), ("right", [1, 0]),
+               ("down", [0, -1]), ("left", [-1, 0])]
+
+    env = deliveryenvironment.DeliveryEnvironment(
+        actions, HRLutils.datafile("contextmap.bmp"),
+        colormap={-16777216: "wall", -1: "floor", -256: "a", -2088896: "b"},
+        imgsize=(5, 5), dx=0.001, placedev=0.5)
+    stateD = len(env.placecells) + contextD
+    enc = MU.prod(env.gen_encoders(stateN, contextD, 1.0), 1.0 /
+                  max_state_input)
+
+    state_fac = HRLutils.node_fac()
+    state_fac.setIntercept(IndicatorPDF(0.8, 1.0))
+    return HRLutils.make_ensemble(net, "state_pop", stateN, stateD,
+                                  node_factory=state_fac, encoders=enc,
+                                  eval_points=evals)
+
+
+def compare_decodersolver(seed=0, num_test=500, num_added=20,
+                          tolerance=0.1):
+    """Compare decodersolver with Nengo's solver on the state population from
+    the delivery task (same encoders, eval points, and neuron parameters).
+
+    Records (see save_results) the time taken by each solver, the decoding
+    error of each on held-out points, and the time taken to add new eval
+    points with rank-1 updates compared to refactoring (i.e. the number of
+    points below which the updates are faster, see
+    DecoderSolver.use_updates).
+
+    Checks that the decodersolver error is within tolerance (as a fraction)
+    of Nengo's error.
+
+    :param seed: random seed (also selects the eval point file)
+    :param num_test: number of eval points held out to measure accuracy
+    :param num_added: number of eval points added incrementally
+    :param tolerance: maximum relative difference between the errors
+    """
+
+    HRLutils.set_seed(seed)
+
+    evals = [list(e) for e in weightstore.load(
+        HRLutils.datafile("contextbmp_evalpoints_%s" % seed))]
+    HRLutils.rand.shuffle(evals)
+    test = evals[:num_test]
+    added = evals[num_test:num_test + num_added]
+    evals = evals[num_test + num_added:]
+
+    net = nef.Network("compare_decodersolver")
+
+    # note: building the ensemble without the cache, so that we time the
+    # actual solve
+    cache = HRLutils.DECODER_CACHE
+    HRLutils.DECODER_CACHE = False
+    try:
+        state_pop = delivery_state_pop(net, evals)
+    finally:
+        HRLutils.DECODER_CACHE = cache
+    stateD = state_pop.getDimension()
+
+    # decode the first few state dimensions
+    funcs = [IdentityFunction(stateD, i) for i in range(4)]
+
+    results = []
+
+    start = time.time()
+    origin = state_pop.addDecodedOrigin("nengo", funcs, "AXON")
+    results += ["nengo solve: %.2fs" % (time.time() - start)]
+    nengo_decoders = origin.getDecoders()
+
+    start = time.time()
+    solver = decodersolver.DecoderSolver(state_pop, evals, max_update=0)
+    mid = time.time()
+    decoders = solver.solve(funcs)
+    results += ["decodersolver: %.2fs (%.2fs factoring, %.2fs solving)" % (
+        time.time() - start, mid - start, time.time() - mid)]
+
+    rmse = {}
+    A_test = decodersolver.activities(state_pop, test)
+    target = decodersolver.evaluate(funcs, test)
+    for name, d in [("nengo", nengo_decoders), ("decodersolver", decoders)]:
+        err = A_test.times(Matrix([list(row) for row in d])).minus(target)
+        rmse[name] = err.normF() / math.sqrt(len(test) * len(funcs))
+        results += ["%s rmse: %.4f" % (name, rmse[name])]
+
+    solver.max_update = len(added)
+    start = time.time()
+    solver.add_points(added)
+    update_time = time.time() - start
+    results += ["add %d points with rank-1 updates: %.2fs" % (len(added),
+                                                               update_time)]
+    solver.factor()
+    results += ["refactor: %.2fs" % solver.factor_time,
+                "rank-1 updates are faster for < %.1f points" % (
+                    solver.factor_time * len(added) / update_time)]
+
+    save_results("compare_decodersolver_%s" % seed, results)
+
+    assert (abs(rmse["decodersolver"] - rmse["nengo"]) <=
+            tolerance * rmse["nengo"])
+
+
+def compare_evalpoint_reduction(seed=0, size=1000):
+    """Compare the decoding accuracy (over the full set of recorded states)
+    of decoders solved with the recorded eval points for the delivery task
+    and with reduced sets of points (see evalpoints.reduce_points).
+
+    :param seed: random seed (also selects the eval point file)
+    :param size: target number of points for the reduced sets
+    """
+
+    HRLutils.set_seed(seed)
+
+    evals = [list(e) for e in weightstore.load(
+        HRLutils.datafile("contextbmp_evalpoints_%s" % seed))]
+
+    net = nef.Network("compare_evalpoint_reduction")
+    state_pop = delivery_state_pop(net, evals[:10])
+    stateD = state_pop.getDimension()
+    funcs = [IdentityFunction(stateD, i) for i in range(stateD)]
+
+    A_full = decodersolver.activities(state_pop, evals)
+    target = decodersolver.evaluate(funcs, evals)
+
+    def rmse(decoders):
+        err = A_full.times(Matrix([list(row) for row in decoders])).minus(
+            target)
+        return err.normF() / math.sqrt(len(evals) * stateD)
+
+    start = time.time()
+    decoders = decodersolver.DecoderSolver(state_pop, evals).solve(funcs)
+    print "full (%d points): rmse %.4f, %.2fs" % (len(evals), rmse(decoders),
+                                                  time.time() - start)
+
+    for method in ["dedup", "kmeans++", "farthest"]:
+        for weighted in [False, True]:
+            if method == "dedup" and weighted:
+                continue
+
+            start = time.time()
+            points, weights = evalpoints.reduce_points(
+                evals, size, method=method, weighted=True,
+                rand=HRLutils.stream("evalpoints"))
+            reduce_time = time.time() - start
+
+            start = time.time()
+            solver = decodersolver.DecoderSolver(
+                state_pop, points, weights=weights if weighted else None)
+            decoders = solver.solve(funcs)
+            print "%s%s (%d points): rmse %.4f, %.2fs (+%.2fs reducing)" % (
+                method, " weighted" if weighted else "", len(points),
+                rmse(decoders), time.time() - start, reduce_time)
+
+
+def compare_backends(seed=None, simtime=5.0, segments=40, min_agree=0.9,
+                     max_error_diff=0.1):
+    """Compare the neural and functional backends of SMDPAgent.
+
+    First builds an agent with each backend and records the neuron count,
+    build time, and simulation speed. Then runs the neural and functional
+    selection/error subsystems side by side on the same recorded trace of
+    inputs (Q values, selected actions, reward, and learn/reset signals), and
+    records how closely their outputs agree (see save_results). Checks that
+    the agreement is within the given tolerances.
+
+    :param seed: random seed
+    :param simtime: length of simulation used to measure speed
+    :param segments: number of segments in the input trace (each 0.5s long,
+        with constant inputs)
+    :param min_agree: minimum fraction of samples where the two backends
+        select the same action (and where the errors have the same sign)
+    :param max_error_diff: maximum mean difference between the errors
+    """
+
+    if seed is not None:
+        HRLutils.set_seed(seed)
+
+    stateN = 1200
+    stateD = 2
+    Qradius = 1.0
+    actions = [("up", [0, 1]), ("right", [1, 0]),
+               ("down", [0, -1]), ("left", [-1, 0])]
+    num_actions = len(actions)
+
+    results = []
+
+    # speed/size comparison
+    for backend in ["neural", "functional"]:
+        HRLutils.set_seed(HRLutils.SEED)
+        net = nef.Network("compare_backends_%s" % backend)
+
+        start = time.time()
+        agent = smdpagent.SMDPAgent(stateN, stateD, actions,
+                                    learningrate=1e-9, Qradius=Qradius,
+                                    backend=backend)
+        net.add(agent)
+        build_time = time.time() - start
+
+        net.make_input("state", [0.5, 0.5])
+        net.connect("state", agent.getTermination("state_input"))
+
+        start = time.time()
+        net.run(simtime)
+        run_time = time.time() - start
+
+        results += [
+            "%s: %d neurons, built in %.2fs, %.2fs per simulated second" %
+            (backend, agent.countNeurons(), build_time, run_time / simtime)]
+
+    # behavioural comparison on a recorded trace
+    seg = 0.5
+    vals = {}
+    old_vals = {}
+    curr_bg = {}
+    saved_bg = {}
+    reward = {}
+    reset = {}
+    learn = {}
+    for i in range(segments):
+        t = i * seg
+        vals[t] = [HRLutils.rand.uniform(-0.2, 1.0) * Qradius
+                   for _ in range(num_actions)]
+        old_vals[t] = [HRLutils.rand.uniform(-0.2, 1.0) * Qradius
+                       for _ in range(num_actions)]
+        curr = HRLutils.rand.randint(0, num_actions - 1)
+        curr_bg[t] = [1.0 if j == curr else 0.0 for j in range(num_actions)]
+        saved = HRLutils.rand.randint(0, num_actions - 1)
+        saved_bg[t] = [1.0 if j == saved else 0.0 for j in range(num_actions)]
+        reward[t] = [HRLutils.rand.choice([0.0, 0.0, 0.5])]
+
+        # reset at the start of each segment, then learn
+        reset[t] = [1.0]
+        reset[t + 0.05] = [0.0]
+        learn[t] = [0.0]
+        learn[t + 0.1] = [1.0 if HRLutils.rand.random() < 0.5 else 0.0]
+
+    net = nef.Network("compare_backends_trace")
+
+    neural_bg = bgnetwork.BGNetwork(actions, Qradius, noiselevel=0.0)
+    net.add(neural_bg)
+    func_bg = bgnode.BGNode(actions)
+    net.add(func_bg)
+
+    neural_error = errornetwork.ErrorNetwork(num_actions, Qradius)
+    net.add(neural_error)
+    func_error = errornode.ErrorNode(num_actions, Qradius, errorcap=0.1)
+    net.add(func_error)
+
+    for name, trace in [("vals", vals), ("old_vals", old_vals),
+                        ("curr_bg_input", curr_bg),
+                        ("saved_bg_input", saved_bg), ("reward", reward),
+                        ("reset", reset), ("learn", learn)]:
+        inp = net.make_input(name, trace)
+        net.connect(inp, neural_error.getTermination(name))
+        net.connect(inp, func_error.getTermination(name))
+    net.connect("vals", neural_bg.getTermination("input"))
+    net.connect("vals", func_bg.getTermination("input"))
+
+    class TraceComparison(nef.SimpleNode):
+        def __init__(self):
+            self.neural_vals = [0.0 for _ in range(num_actions)]
+            self.func_vals = [0.0 for _ in range(num_actions)]
+            self.neural_error = [0.0 for _ in range(num_actions)]
+            self.func_error = [0.0 for _ in range(num_actions)]
+
+            self.samples = 0
+            self.action_agree = 0
+            self.error_samples = 0
+            self.error_agree = 0
+            self.error_diff = 0.0
+
+            nef.SimpleNode.__init__(self, "TraceComparison")
+
+        def tick(self):
+            # only compare once the neural versions have had time to settle
+            if self.t % seg < seg - 0.1:
+                return
+
+            self.samples += 1
+            if (self.neural_vals.index(max(self.neural_vals)) ==
+                    self.func_vals.index(max(self.func_vals))):
+                self.action_agree += 1
+
+            self.error_diff += max([abs(x - y) for x, y in
+                                    zip(self.neural_error, self.func_error)])
+            for x, y in zip(self.neural_error, self.func_error):
+                if abs(y) > 0.01:
+                    self.error_samples += 1
+                    if x * y > 0:
+                        self.error_agree += 1
+
+        def termination_neural_vals(self, x, dimensions=num_actions):
+            self.neural_vals = x
+
+        def termination_func_vals(self, x, dimensions=num_actions):
+            self.func_vals = x
+
+        def termination_neural_error(self, x, dimensions=num_actions):
+            self.neural_error = x
+
+        def termination_func_error(self, x, dimensions=num_actions):
+            self.func_error = x
+
+    comp = TraceComparison()
+    net.add(comp)
+
+    net.connect(neural_bg.getOrigin("curr_vals"),
+                comp.getTermination("neural_vals"))
+    net.connect(func_bg.getOrigin("curr_vals"),
+                comp.getTermination("func_vals"))
+    net.connect(neural_error.getOrigin("error"),
+                comp.getTermination("neural_error"))
+    net.connect(func_error.getOrigin("error"),
+                comp.getTermination("func_error"))
+
+    net.run(segments * seg)
+
+    action_agree = float(comp.action_agree) / max(comp.samples, 1)
+    error_agree = float(comp.error_agree) / max(comp.error_samples, 1)
+    error_diff = comp.error_diff / max(comp.samples, 1)
+    results += ["selected action agreement: %.3f" % action_agree,
+                "error sign agreement: %.3f" % error_agree,
+                "mean max error difference: %.4f" % error_diff]
+    save_results("compare_backends_%s" % HRLutils.SEED, results)
+
+    assert action_agree >= min_agree
+    assert error_agree >= min_agree
+    assert error_diff <= max_error_diff
+
+
+def test_sizing(stateN=200, stateD=4, backend="neural"):
+    """Check the neuron counts and eval points estimated by sizing against a
+    real build of an SMDPAgent."""
+
+    actions = [("up", [0, 1]), ("right", [1, 0]),
+               ("down", [0, -1]), ("left", [-1, 0])]
+
+    agent = smdpagent.SMDPAgent(stateN, stateD, actions, backend=backend)
+    est = sizing.smdpagent(stateN, stateD, len(actions), 2, backend=backend)
+
+    def eval_points(network):
+        # total eval point values (points * dimensions) of the neural
+        # ensembles in network (including sub-networks)
+        total = 0
+        if not isinstance(network, NetworkImpl):
+            # e.g. the functional backends
+            return total
+        for n in network.getNodes():
+            if isinstance(n, NetworkImpl):
+                total += eval_points(n)
+            elif (isinstance(n, NEFEnsemble) and
+                  n.getMode() != SimulationMode.DIRECT):
+                total += len(n.getEvalPoints()) * n.getDimension()
+        return total
+
+    # note: direct mode ensembles count as one neuron in countNeurons
+    ok = True
+    for e in [est] + est.children:
+        t = e.totals()
+        estimated = t["neurons"] + t["direct"]
+        node = agent if e is est else agent.getNode(e.name)
+        built = node.countNeurons()
+        built_evals = eval_points(node)
+        print "%s: estimated %d neurons, %d eval points, built %d, %d" % (
+            e.name, estimated, t["eval_points"], built, built_evals)
+        ok = (ok and estimated == built and
+              t["eval_points"] == built_evals)
+    assert ok
+
+
+def test_randomstreams():
+    """Check that random streams give the same results regardless of how the
+    draws are batched, the order streams are created in, or which threads
+    they are used in."""
+
+    names = ["NavAgent/NoiseNode", "CtrlAgent/NoiseNode", "GridWorld"]
+
+    # single draws vs blocks
+    s0 = HRLutils.stream(names[0])
+    s1 = HRLutils.stream(names[0])
+    assert s0.block(100) == [s1.random() for _ in range(100)]
+
+    # serial, in order
+    serial = dict([(n, HRLutils.stream(n).gauss_block(1000)) for n in names])
+
+    # reversed order, interleaved draws
+    streams = dict([(n, HRLutils.stream(n)) for n in reversed(names)])
+    interleaved = dict([(n, []) for n in names])
+    for _ in range(1000):
+        for n in reversed(names):
+            interleaved[n] += [streams[n].gauss()]
+    assert interleaved == serial
+
+    # one thread per stream
+    threaded = {}
+
+    def draw(n):
+        threaded[n] = HRLutils.stream(n).gauss_block(1000)
+
+    threads = [threading.Thread(target=draw, args=(n,)) for n in names]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert threaded == serial
+
+
 def test_actionvalues():
     net = nef.Network("testActionValues")
 
@@ -191,6 +806,125 @@ def test_actionvalues():
     net.view()
 
 
+def compare_actionvalues(seed=None, simtime=60.0, stateN=1200, window=5.0,
+                         tolerance=0.05):
+    """Compare the dense and factored forms of ActionValues (see the factored
+    parameter) on the same learning task.
+
+    The state follows a slowly varying random input, and each action has to
+    learn a different linear function of the state. Records the build time,
+    number of stored weights, simulation speed, and the learning curve (mean
+    absolute error in each window) for each form (see save_results).
+
+    Both forms use the same learning rate (see FactoredWeightNode), so their
+    learning curves should match; this checks that the error in each window
+    is within tolerance.
+
+    :param seed: random seed
+    :param simtime: length of simulation
+    :param stateN: number of state neurons
+    :param window: length of window for learning curve
+    :param tolerance: maximum difference between the learning curves
+    """
+
+    if seed is not None:
+        HRLutils.set_seed(seed)
+
+    N = 50
+    stateD = 2
+    learningrate = 1e-9
+    actions = [("up", [0, 1]), ("right", [1, 0]),
+               ("down", [0, -1]), ("left", [-1, 0])]
+    num_actions = len(actions)
+
+    class LearningCurve(nef.SimpleNode):
+        def __init__(self):
+            self.error = [0.0 for _ in range(num_actions)]
+            self.curve = []
+            self.total = 0.0
+            self.samples = 0
+            nef.SimpleNode.__init__(self, "LearningCurve")
+
+        def tick(self):
+            self.total += sum([abs(e) for e in self.error]) / num_actions
+            self.samples += 1
+            if self.t > 0.0 and self.t % window < 1e-6:
+                self.curve += [self.total / self.samples]
+                self.total = 0.0
+                self.samples = 0
+
+        def termination_error(self, x, dimensions=num_actions):
+            self.error = x
+
+    results = []
+    curves = []
+    for factored in [False, True]:
+        HRLutils.set_seed(HRLutils.SEED)
+        net = nef.Network("compare_actionvalues_%s" % factored)
+
+        fin1 = net.make_fourier_input("fin1", base=0.1, high=1, power=0.5,
+                                      seed=HRLutils.SEED)
+        fin2 = net.make_fourier_input("fin2", base=0.1, high=1, power=0.5,
+                                      seed=HRLutils.SEED + 1)
+
+        state_pop = net.make("state_pop", stateN, stateD,
+                             node_factory=HRLutils.node_fac())
+        state_pop.fixMode([SimulationMode.DEFAULT, SimulationMode.RATE])
+        net.connect(fin1, state_pop, transform=[[1], [0]])
+        net.connect(fin2, state_pop, transform=[[0], [1]])
+
+        decoders = state_pop.addDecodedOrigin(
+            "init_decoders", [ConstantFunction(stateD, 0.2)],
+            "AXON").getDecoders()
+
+        start = time.time()
+        actionvals = actionvalues.ActionValues("actionvals", N, stateN,
+                                               actions, learningrate,
+                                               init_decoders=decoders,
+                                               factored=factored,
+                                               state_pop=state_pop)
+        net.add(actionvals)
+        build_time = time.time() - start
+        if not factored:
+            net.connect(state_pop.getOrigin("AXON"),
+                        actionvals.getTermination("state"))
+
+        # error = target - Q values, where the target for each action is
+        # 0.5 * (state . action vector)
+        error = net.make("error", 1, num_actions, mode="direct")
+        net.connect(fin1, error, transform=[[0.5 * a[1][0]] for a in actions])
+        net.connect(fin2, error, transform=[[0.5 * a[1][1]] for a in actions])
+        net.connect(actionvals.getOrigin("X"), error,
+                    transform=MU.diag([-1] * num_actions))
+        net.connect(error, actionvals.getTermination("error"))
+
+        curve = LearningCurve()
+        net.add(curve)
+        net.connect(error, curve.getTermination("error"))
+
+        if factored:
+            num_weights = num_actions * stateN
+        else:
+            num_weights = num_actions * N * 4 * stateN
+
+        start = time.time()
+        net.run(simtime)
+        run_time = time.time() - start
+
+        results += [
+            "%s: built in %.2fs, %d weights, %.2fs per simulated second" %
+            ("factored" if factored else "dense", build_time, num_weights,
+             run_time / simtime),
+            "learning curve: " + " ".join(["%.3f" % e for e in curve.curve])]
+        curves += [curve.curve]
+
+    diff = max([abs(x - y) for x, y in zip(curves[0], curves[1])])
+    results += ["max learning curve difference: %.3f" % diff]
+    save_results("compare_actionvalues_%s" % HRLutils.SEED, results)
+
+    assert diff <= tolerance
+
+
 def test_terminationnode():
     net = nef.Network("testTerminationNode")
 
@@ -327,8 +1061,17 @@ def optimal_run(seed=None):
 # test_placecell_bmp()
 # test_errornode()
 # test_decoderlearning()
+# benchmark_decoderlearning()
+# test_decoderbatching()
+# compare_backends()
+# compare_decodersolver()
+# compare_evalpoint_reduction()
 # test_memorynetwork()
+# test_gatedmemorynode()
 # test_selectioncircuit()
 # test_errorcalc()
 # test_actionvalues()
+# compare_actionvalues()
+# test_randomstreams()
+# test_sizing()
 optimal_run(seed=0)
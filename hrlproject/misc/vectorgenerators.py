@@ -33,6 +33,32 @@ class DirectedVectorGenerator(VectorGenerator, Serializable):
         return([self.dir for _ in range(N)])
 
 
+class FixedVectorGenerator(VectorGenerator, Serializable):
+    """Returns a fixed set of vectors (e.g. given encoders or evaluation
+    points)."""
+
+    serialVersionUID = 1
+
+    def __init__(self, vectors):
+        if hasattr(vectors, "row"):
+            # note: memory mapped vectors (see weightstore.MappedMatrix) are
+            # not copied, so that all the ensembles using them share the
+            # mapping (the rows are read when the vectors are generated)
+            self.vectors = vectors
+        else:
+            self.vectors = [list(v) for v in vectors]
+
+    def genVectors(self, N, d):
+        # note: N is ignored, so that this can be used to supply any number
+        # of evaluation points
+        if len(self.vectors[0]) != d:
+            print "Error, vector dimension not equal to requested dimension"
+
+        if hasattr(self.vectors, "row"):
+            return [self.vectors.row(i) for i in range(len(self.vectors))]
+        return(self.vectors)
+
+
 class MultiplicationVectorGenerator(VectorGenerator, Serializable):
     """Generates vectors at 45 degrees (good for multiplication encoding
     vectors)."""
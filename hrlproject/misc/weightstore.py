@@ -0,0 +1,237 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+"""Binary storage for large connection weight matrices (e.g. the HPES
+terminations in ActionValues).
+
+Each matrix is stored in one or more shard files (filename.0.wts,
+filename.1.wts, ...), with each shard containing a contiguous block of rows.
+
+Shard format (big-endian): the string "HRLW", format version (int), seed
+(long), shard index (int), number of shards (int), total number of rows
+(int), number of columns (int), index of the first row in this shard (int),
+number of rows in this shard (int), followed by the data (float32,
+row-major).
+
+The files are accessed through memory mapping, so opening a matrix doesn't
+read the whole file up front (the data is paged in as rows are accessed),
+and rows are read/written in bulk rather than value by value. Note that
+this only helps users that access a subset of the rows (or access them
+gradually); e.g. ActionValues.loadWeights still reads every row, since the
+HPES terminations need their full weights before the simulation starts.
+
+Read-only matrices that are used by several parts of the model (e.g. eval
+points) can be opened with open_shared, so that every user in the process
+shares one mapping (and the mapped pages are shared with any other
+processes on the host that map the same file).
+"""
+
+import os
+
+import jarray
+
+from java.io import RandomAccessFile
+from java.nio.channels import FileChannel
+
+from hrlproject.misc import HRLutils, checkpoint
+
+MAGIC = "HRLW"
+FORMAT_VERSION = 1
+HEADER_SIZE = 4 + 4 + 8 + 4 * 6
+
+# matrices opened with open_shared, mapping absolute filename to
+# (modification time, MappedMatrix)
+shared = {}
+
+
+def shard_name(filename, shard):
+    return "%s.%d.wts" % (filename, shard)
+
+
+def exists(filename):
+    """Returns True if a matrix has been saved to filename."""
+
+    return os.path.exists(shard_name(filename, 0))
+
+
+def save(filename, rows, shards=1, seed=None):
+    """Save a matrix.
+
+    :param filename: base name of file to save to (see shard_name)
+    :param rows: list of matrix rows (e.g. Java float arrays)
+    :param shards: number of files to split the matrix across
+    :param seed: seed stored in the header (defaults to HRLutils.SEED)
+    """
+
+    if seed is None:
+        seed = HRLutils.SEED
+    nrows = len(rows)
+    ncols = len(rows[0]) if nrows > 0 else 0
+    shards = max(min(shards, nrows), 1)
+    per_shard = (nrows + shards - 1) // shards
+
+    for s in range(shards):
+        start = s * per_shard
+        block = rows[start:start + per_shard]
+
+        # write to a temporary file, then rename
+        tmpname = shard_name(filename, s) + ".tmp"
+        f = RandomAccessFile(tmpname, "rw")
+        try:
+            size = HEADER_SIZE + len(block) * ncols * 4
+            f.setLength(size)
+            buf = f.getChannel().map(FileChannel.MapMode.READ_WRITE, 0, size)
+            for c in MAGIC:
+                buf.put(ord(c))
+            buf.putInt(FORMAT_VERSION)
+            buf.putLong(seed)
+            for x in [s, shards, nrows, ncols, start, len(block)]:
+                buf.putInt(x)
+
+            view = buf.asFloatBuffer()
+            for row in block:
+                if getattr(row, "typecode", None) != "f":
+                    row = jarray.array(row, "f")
+                view.put(row)
+            buf.force()
+        finally:
+            f.close()
+        checkpoint.replace_file(tmpname, shard_name(filename, s))
+
+    # remove any leftover shards from an earlier save with more shards
+    s = shards
+    while os.path.exists(shard_name(filename, s)):
+        os.remove(shard_name(filename, s))
+        s += 1
+
+
+def open_shared(filename):
+    """Returns a MappedMatrix for filename, reusing the existing one if the
+    file has already been opened (and hasn't changed since)."""
+
+    key = os.path.abspath(filename)
+    mtime = os.path.getmtime(shard_name(filename, 0))
+    if key not in shared or shared[key][0] != mtime:
+        shared[key] = (mtime, MappedMatrix(filename))
+    return shared[key][1]
+
+
+def load_text(filename):
+    """Load a matrix from a text file (one row per line, with values
+    separated by whitespace)."""
+
+    f = open(filename, "r")
+    rows = []
+    for line in f:
+        if line.strip() != "":
+            rows += [[float(x) for x in line.split()]]
+    f.close()
+
+    return rows
+
+
+def load(filename):
+    """Load a matrix, falling back to the text file filename + ".txt" if it
+    hasn't been converted (see convert_text).
+
+    :returns: a shared MappedMatrix (see open_shared) or a list of rows
+    """
+
+    if exists(filename):
+        return open_shared(filename)
+    return load_text(filename + ".txt")
+
+
+def convert_text(textfile, filename=None, seed=None):
+    """Convert a matrix saved as text (see load_text) to the binary format.
+
+    :param textfile: name of the text file
+    :param filename: base name of the binary file (defaults to textfile
+        without the .txt extension)
+    :param seed: seed stored in the header
+    :returns: the base name of the binary file
+    """
+
+    if filename is None:
+        filename = os.path.splitext(textfile)[0]
+    save(filename, load_text(textfile), seed=seed)
+    return filename
+
+
+class MappedMatrix:
+    """A matrix saved by save, accessed through memory mapped files.
+
+    Shards are only opened when one of their rows is first accessed.
+    """
+
+    def __init__(self, filename):
+        """Read the matrix header.
+
+        :param filename: base name of saved matrix (see save)
+        """
+
+        self.filename = filename
+        self.buffers = {}  # shard index -> (first row, mapped buffer)
+
+        header = self.open_shard(0)
+        self.seed = header["seed"]
+        self.shards = header["shards"]
+        self.rows = header["rows"]
+        self.cols = header["cols"]
+        self.per_shard = header["shard_rows"]
+
+    def open_shard(self, s):
+        """Map shard s into memory.
+
+        :returns: the shard header (as a dict)
+        """
+
+        f = RandomAccessFile(shard_name(self.filename, s), "r")
+        try:
+            buf = f.getChannel().map(FileChannel.MapMode.READ_ONLY, 0,
+                                     f.length())
+        finally:
+            # note: the mapping remains valid after the file is closed
+            f.close()
+
+        magic = "".join([chr(buf.get()) for _ in range(4)])
+        if magic != MAGIC:
+            raise IOError("%s is not a weight file" %
+                          shard_name(self.filename, s))
+        header = {"version": buf.getInt(), "seed": buf.getLong()}
+        for key in ["shard", "shards", "rows", "cols", "start",
+                    "shard_rows"]:
+            header[key] = buf.getInt()
+        assert header["shard"] == s
+
+        self.buffers[s] = (header["start"], buf.asFloatBuffer())
+        return header
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.rows
+        if i < 0 or i >= self.rows:
+            raise IndexError("row index out of range")
+        return self.row(i)
+
+    def row(self, i, out=None):
+        """Read one row of the matrix.
+
+        :param i: row index
+        :param out: Java float array to read the row into (if None, a new
+            array is allocated)
+        :returns: the row, as a Java float array
+        """
+
+        s = i // self.per_shard
+        if s not in self.buffers:
+            self.open_shard(s)
+        start, view = self.buffers[s]
+
+        if out is None:
+            out = jarray.zeros(self.cols, "f")
+        view.position((i - start) * self.cols)
+        view.get(out)
+        return out
@@ -0,0 +1,184 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+import struct
+
+import nef
+
+from hrlproject.misc import originbuffer, decodersolver
+
+
+class ActivityProfiler(nef.SimpleNode):
+    """Node to collect statistics on the activity of individual neurons in an
+    ensemble (e.g. to see how many of the neurons in a state population are
+    actually being used).
+
+    Statistics are accumulated in fixed memory (a few values per neuron), and
+    periodically written to a binary file (see load_snapshots).
+
+    :output stats: [number of dead neurons, number of saturated neurons,
+        fraction of neurons active on the current sample]
+    """
+
+    def __init__(self, ens, period=10.0, dt=0.001, filename=None,
+                 active_threshold=1.0, saturation=0.9, sample_every=1,
+                 name="ActivityProfiler"):
+        """Initialize node variables.
+
+        :param ens: ensemble to be profiled (reads activities from its AXON
+            origin), or a list of ensembles (e.g. the sub-ensembles of a
+            network array) to be profiled together
+        :param period: time between snapshots
+        :param dt: simulation timestep
+        :param filename: name of file to save snapshots to (if None, the
+            statistics are only available through the node's attributes)
+        :param active_threshold: firing rate (Hz) above which a neuron
+            counts as active
+        :param saturation: a neuron is counted as saturated if its mean rate
+            is more than this fraction of its maximum rate (i.e. it is
+            driven close to its maximum most of the time, rather than just
+            being tonically active)
+        :param sample_every: only sample activities every n timesteps (to
+            reduce overhead)
+        :param name: name for node
+        """
+
+        self.ensembles = ens if isinstance(ens, (list, tuple)) else [ens]
+        self.period = period
+        self.dt = dt
+        self.filename = filename
+        self.active_threshold = active_threshold
+        self.saturation = saturation
+        self.sample_every = sample_every
+
+        self.N = sum([e.getNeurons() for e in self.ensembles])
+        self.readers = [originbuffer.OriginBuffer(e.getOrigin("AXON"))
+                        for e in self.ensembles]
+        self.max_rates = []
+        for e in self.ensembles:
+            self.max_rates += decodersolver.max_rates(e)
+        self.reset()
+
+        nef.SimpleNode.__init__(self, name)
+
+        if self.filename is not None:
+            # clear any old data
+            open(self.filename, "wb").close()
+
+    def reset(self):
+        """Clear all the accumulated statistics."""
+
+        self.samples = 0
+        self.ticks = 0
+        self.mean_rates = [0.0 for _ in range(self.N)]
+        self.active_counts = [0 for _ in range(self.N)]
+        self.curr_active = 0
+
+    def tick(self):
+        self.ticks += 1
+        if self.ticks % self.sample_every == 0:
+            self.sample()
+
+        if self.t > 0.0 and self.t % self.period < self.dt * 1e-3:
+            self.save()
+
+    def sample(self):
+        """Read the current activities and update the statistics."""
+
+        vals = []
+        for r in self.readers:
+            v = r.read()
+            if r.stale:
+                # this can fail if the simulator is currently in the process
+                # of writing to the origin
+                return
+
+            if v.typecode == "z":
+                # spiking output, so convert spikes to rates
+                v = [1.0 / self.dt if x else 0.0 for x in v]
+            vals += list(v)
+
+        # update streaming means
+        self.samples += 1
+        w = 1.0 / self.samples
+        m = self.mean_rates
+        c = self.active_counts
+        thresh = self.active_threshold
+        active = 0
+        for i, v in enumerate(vals):
+            m[i] += (v - m[i]) * w
+            if v > thresh:
+                c[i] += 1
+                active += 1
+        self.curr_active = active
+
+    def frac_active(self):
+        """Fraction of samples in which each neuron was active."""
+
+        if self.samples == 0:
+            return [0.0 for _ in range(self.N)]
+        return [float(c) / self.samples for c in self.active_counts]
+
+    def num_dead(self):
+        """Number of neurons that have never been active."""
+
+        return len([c for c in self.active_counts if c == 0])
+
+    def num_saturated(self):
+        """Number of neurons whose mean rate is close to their maximum rate
+        (see saturation)."""
+
+        s = self.saturation
+        return len([m for m, r in zip(self.mean_rates, self.max_rates)
+                    if r > 0 and m > s * r])
+
+    def origin_stats(self):
+        if self.samples == 0:
+            return [0.0, 0.0, 0.0]
+        return [float(self.num_dead()), float(self.num_saturated()),
+                float(self.curr_active) / self.N]
+
+    def save(self):
+        """Append a snapshot of the current statistics to file.
+
+        Snapshot format (big-endian): the string "APRF", number of neurons
+        (int), simulation time (double), number of samples (int), followed by
+        the mean rate and the fraction of time active for each neuron (double
+        arrays).
+        """
+
+        if self.filename is None:
+            return
+
+        f = open(self.filename, "ab")
+        f.write(struct.pack(">4sidi", "APRF", self.N, self.t, self.samples))
+        f.write(struct.pack(">%dd" % self.N, *self.mean_rates))
+        f.write(struct.pack(">%dd" % self.N, *self.frac_active()))
+        f.close()
+
+
+def load_snapshots(filename):
+    """Read the snapshots saved by an ActivityProfiler.
+
+    :returns: list of (time, num_samples, mean_rates, frac_active) tuples
+    """
+
+    f = open(filename, "rb")
+    data = f.read()
+    f.close()
+
+    header = struct.calcsize(">4sidi")
+    snapshots = []
+    i = 0
+    while i < len(data):
+        tag, N, t, samples = struct.unpack(">4sidi", data[i:i + header])
+        assert tag == "APRF"
+        i += header
+
+        means = struct.unpack(">%dd" % N, data[i:i + 8 * N])
+        i += 8 * N
+        frac = struct.unpack(">%dd" % N, data[i:i + 8 * N])
+        i += 8 * N
+
+        snapshots += [(t, samples, list(means), list(frac))]
+
+    return snapshots
@@ -6,19 +6,37 @@ import nef
 
 
 class BGNode(nef.SimpleNode):
-    """Node to emulate the function of BGNetwork."""
+    """Node to emulate the function of BGNetwork.
+
+    :input input: Q values (value of each action)
+    :input noise: noise added to the Q values
+    :input save_output: when this input~=1, the node will store the currently
+        selected action
+    :output curr_vals: num_actions dimensional vector with 1 for currently
+        selected action and 0 elsewhere
+    :output curr_action: vector corresponding to the currently selected action
+    :output saved_vals: saved curr_vals output (see save_output)
+    :output saved_action: saved curr_action output (see save_output)
+    """
+
+    def __init__(self, actions, name="BGNode"):
+        """Initialize node variables.
+
+        :param actions: actions available to the system
+            :type actions: list of tuples (action_name,action_vector)
+        :param name: name for node
+        """
 
-    def __init__(self, actions):
-
-        self.noise = None
         self.actions = actions
         self.d = len(actions)
         self.pstc = 0.01
         self.printtime = 0.0
+        self.noise = [0 for _ in range(self.d)]
+        self.save = 0
         self.vals = [0 for _ in range(self.d)]
         self.saved_vals = [0 for _ in range(self.d)]
 
-        nef.SimpleNode.__init__(self, "BGNode")
+        nef.SimpleNode.__init__(self, name)
 
         self.getTermination("input").setDimensions(self.d)
         self.getTermination("noise").setDimensions(self.d)
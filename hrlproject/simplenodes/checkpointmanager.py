@@ -0,0 +1,118 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+import Queue
+import atexit
+import threading
+import time
+
+import nef
+
+from hrlproject.misc import HRLutils, checkpoint
+
+
+class CheckpointManager(nef.SimpleNode):
+    """Node to periodically save the parameters of one or more QNetworks
+    (replaces HRLutils.WeightSaveThread).
+
+    Snapshots of the parameters are taken during the node's tick (so they
+    are consistent with the simulation, see QNetwork.snapshot), and then
+    written to file by a background thread (so the simulation isn't blocked
+    while the file is written). Networks whose parameters haven't changed
+    since the last save are skipped, and the last few checkpoints for each
+    network are kept (prefix_params.ckpt, prefix_params.ckpt.1, ...).
+
+    stop should be called when the simulation is finished, to save the final
+    parameters (this is also done automatically on exit).
+    """
+
+    def __init__(self, period=600.0, keep=3, dtype="f8",
+                 name="CheckpointManager"):
+        """Initialize node variables.
+
+        :param period: time between saves (realtime, not simulation time)
+        :param keep: number of checkpoints to keep for each network
+        :param dtype: storage type for checkpoints (see checkpoint.save)
+        :param name: name for node
+        """
+
+        self.period = period
+        self.keep = keep
+        self.dtype = dtype
+
+        self.networks = []  # list of (QNetwork, prefix) tuples
+        self.versions = {}  # parameter version at the last save, by prefix
+        self.last_save = time.time()
+
+        self.queue = Queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop,
+                                       name=name + "Writer")
+        self.writer.setDaemon(True)
+        self.writer.start()
+        self.stopped = False
+
+        atexit.register(self.stop)
+
+        nef.SimpleNode.__init__(self, name)
+
+    def add(self, qnet, prefix):
+        """Add a network to be saved.
+
+        :param qnet: QNetwork whose parameters will be saved
+        :param prefix: prefix for the saved file(s) (see QNetwork.saveParams)
+        """
+
+        self.networks += [(qnet, prefix)]
+
+    def tick(self):
+        if time.time() - self.last_save >= self.period:
+            self.last_save = time.time()
+            self.save()
+
+    def save(self):
+        """Take a snapshot of any networks that have changed since the last
+        save, and queue them to be written to file."""
+
+        for qnet, prefix in self.networks:
+            version = qnet.version()
+            if version is not None and version == self.versions.get(prefix):
+                continue
+            self.versions[prefix] = version
+
+            if qnet.neuron_learning:
+                # note: the connection weights can't be snapshotted, so the
+                # whole save is done by the writer thread
+                self.queue.put((qnet, prefix, None))
+            else:
+                self.queue.put((qnet, prefix, qnet.snapshot()))
+
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            qnet, prefix, arrays = item
+            filename = HRLutils.datafile(prefix + "_params.ckpt")
+            try:
+                # note: checkpoint.save only rotates the old checkpoints once
+                # the new one has been written
+                if arrays is None:
+                    qnet.saveParams(prefix, dtype=self.dtype, keep=self.keep)
+                else:
+                    checkpoint.save(filename, arrays, dtype=self.dtype,
+                                    keep=self.keep)
+            except Exception, e:
+                # note: don't want one failed save to stop all future saves
+                print "error saving checkpoint %s: %s" % (filename, e)
+
+    def stop(self):
+        """Save the current parameters, and wait for all the queued
+        checkpoints to be written."""
+
+        if self.stopped:
+            return
+        self.stopped = True
+
+        self.save()
+        self.queue.put(None)
+        self.writer.join()
@@ -2,17 +2,27 @@
 
 import nef
 
+from hrlproject.misc import ringbuffer, originbuffer
+
 
 class DataNode(nef.SimpleNode):
     """Node to collect data and output it to file."""
 
-    def __init__(self, period=1, dt=0.001, filename=None, header=""):
+    def __init__(self, period=1, dt=0.001, filename=None, header="",
+                 capacity=None, factor=10, levels=4):
         """Initialize node variables.
 
         :param period: specifies how often the node should create a new data
             entry
         :param filename: name of file to save data to
         :param header: will be written to top of file (for record keeping)
+        :param capacity: if not None, store the data in fixed size
+            multi-resolution buffers rather than keeping every entry (so that
+            memory use doesn't grow over long runs). capacity is the number of
+            entries kept at each resolution.
+        :param factor: number of entries combined to form one entry at the
+            next coarsest resolution (if capacity is not None)
+        :param levels: number of resolutions (if capacity is not None)
         """
 
         nef.SimpleNode.__init__(self, "DataNode")
@@ -21,48 +31,136 @@ class DataNode(nef.SimpleNode):
         self.dt = dt
         self.filename = filename
         self.header = header
+        self.capacity = capacity
+        self.factor = factor
+        self.levels = levels
 
         self.sources = []
+        self.readers = []
         self.records = []
         self.types = []
+        self.buffers = []
+        self.triggers = []
 
     def record(self, origin, func=lambda x: x):
         """Record data from the given origin.
 
         :param origin: origin to record data from
         :param func: function applied to the output of origin
+        :returns: index of the record (see query)
         """
 
         self.sources += [origin]
+        self.readers += [originbuffer.OriginBuffer(origin)]
         self.records += [[[self.t + 0.5 * self.period, None]]]
         self.types += [func]
+        if self.capacity is not None:
+            self.buffers += [ringbuffer.MultiResBuffer(self.capacity,
+                                                       self.factor,
+                                                       self.levels)]
+
+        return len(self.records) - 1
 
     def record_avg(self, origin):
-        self.record(origin, lambda s: [float(sum(s)) / len(s)])
+        return self.record(origin, lambda s: [float(sum(s)) / len(s)])
 
     def record_sparsity(self, origin):
-        self.record(origin, lambda s: [len([x for x in s if x < 0.01]) /
-                                       float(len(s))])
+        # note: counting directly on the buffer from the OriginBuffer, rather
+        # than building a list of the inactive neurons
+        return self.record(origin, lambda s: [originbuffer.count_below(
+            s, 0.01) / float(len(s))])
+
+    def record_triggered(self, origin, gate, func=lambda x: x, threshold=0.5,
+                         pre=0.0, post=0.0, summary=None):
+        """Record data from the given origin, but only while the gate signal
+        is above threshold (e.g., during the learn period).
+
+        Each contiguous period where the gate is open forms a window. Either
+        every sample in the window is recorded, or the window is reduced to
+        a single entry by the summary function.
+
+        :param origin: origin to record data from
+        :param gate: origin whose first dimension controls recording
+        :param func: function applied to the output of origin
+        :param threshold: recording is triggered while gate > threshold
+        :param pre: length of time to record before the gate opens
+        :param post: length of time to keep recording after the gate closes
+        :param summary: if not None, function mapping the samples in a window
+            (list of [time, vals]) and dt to a summary vector (see
+            window_peak, window_integral)
+        :returns: index of the triggered record (see windows)
+        """
+
+        self.triggers += [TriggeredRecord(origin, gate, func, threshold, pre,
+                                          post, summary)]
+
+        return len(self.triggers) - 1
+
+    def windows(self, index):
+        """Returns the entries [time, val0, val1, ...] recorded by a triggered
+        record (see record_triggered)."""
+
+        return self.triggers[index].entries
+
+    def query(self, index, t0=None, t1=None):
+        """Returns the data for a record over the given time range.
+
+        :param index: index of record (as returned by record)
+        :param t0: start of time range (None for no limit)
+        :param t1: end of time range (None for no limit)
+        :returns: list of entries [time, mins, means, maxs], at the best
+            available resolution for each point in the time range
+        """
+
+        if self.capacity is not None:
+            return [[0.5 * (b[0] + b[1]), b[3], b[4], b[5]]
+                    for b in self.buffers[index].query(t0, t1)]
+
+        # all entries are at full resolution (excluding the entry currently
+        # being accumulated)
+        return [[entry[0], entry[1], entry[1], entry[1]]
+                for entry in self.records[index][:-1]
+                if (t0 is None or entry[0] >= t0) and
+                (t1 is None or entry[0] <= t1)]
+
+    def read(self, reader, func=lambda x: x):
+        """Returns the output of an origin (with func applied), or None if
+        it can't be read.
+
+        :param reader: OriginBuffer for the origin
+        :param func: function applied to the output of the origin
+        """
+
+        # note: if the origin can't be read right now (e.g. the simulator is
+        # in the process of writing to it) this gives the previous value
+        vals = reader.read()
+        if vals is None:
+            return None
+
+        # apply function to data
+        s = func(vals)
+        if isinstance(s, (float, int)):
+            s = [s]
+        elif s is vals:
+            # the buffer will be overwritten on the next read
+            s = list(s)
+
+        return s
 
     def tick(self):
         for i, r in enumerate(self.records):
             # get data from origin
-            try:
-                s = self.sources[i].getValues().getValues()
-            except:
-                # this can fail if the simulator is currently in the process
-                # of writing to the origin
+            s = self.read(self.readers[i], self.types[i])
+            if s is None:
                 continue
 
-            # apply function to data
-            s = self.types[i](s)
-            if isinstance(s, (float, int)):
-                s = [s]
-
             # add data to entry
             r[-1][1] = s if r[-1][1] is None else [x + y for x, y in
                                                    zip(r[-1][1], s)]
 
+        for tr in self.triggers:
+            tr.update(self)
+
         # if period has elapsed, create a new data entry
         if self.t > 0.0 and self.t % self.period < self.dt * 1e-3:
             # divide to get avg
@@ -70,18 +168,125 @@ class DataNode(nef.SimpleNode):
             for r in self.records:
                 r[-1][1] = [float(x) / num_timesteps for x in r[-1][1]]
 
+            if self.capacity is not None:
+                # move the completed entry into the buffers
+                for r, b in zip(self.records, self.buffers):
+                    b.add(r[-1][0], r[-1][1])
+                    del r[:]
+
             # write data to file
             if self.filename is not None:
-                f = open(self.filename, "w")
-                f.write(self.header + "\n")
-                f.write("\n".join([";".join([" ".join([str(v)
-                                                       for v in [entry[0]] +
-                                                       entry[1]])
-                                             for entry in r])
-                                   for r in self.records]))
-                f.close()
+                self.save()
 
             # create new entry
             for r in self.records:
                 r += [[self.t + 0.5 * self.period, None]]
-                assert len(r) == int(self.t / self.period) + 1
+                if self.capacity is None:
+                    assert len(r) == int(self.t / self.period) + 1
+
+    def save(self):
+        """Write the recorded data to file.
+
+        Each record is written on one line, as ';' separated entries of the
+        form "time val0 val1 ...". If the data is being stored in buffers the
+        mean value is written for entries at coarser resolutions.
+        """
+
+        if self.capacity is not None:
+            data = [[[entry[0]] + entry[2] for entry in self.query(i)]
+                    for i in range(len(self.records))]
+        else:
+            data = [[[entry[0]] + entry[1] for entry in r
+                     if entry[1] is not None]
+                    for r in self.records]
+
+        # triggered records are written after the periodic records
+        data += [tr.entries for tr in self.triggers if len(tr.entries) > 0]
+
+        f = open(self.filename, "w")
+        f.write(self.header + "\n")
+        f.write("\n".join([";".join([" ".join([str(v) for v in entry])
+                                     for entry in r])
+                           for r in data]))
+        f.close()
+
+
+class TriggeredRecord:
+    """Data recorded by DataNode.record_triggered."""
+
+    def __init__(self, origin, gate, func, threshold, pre, post, summary):
+        self.origin = originbuffer.OriginBuffer(origin)
+        self.gate = originbuffer.OriginBuffer(gate)
+        self.func = func
+        self.threshold = threshold
+        self.pre = pre
+        self.post = post
+        self.summary = summary
+
+        self.entries = []  # completed entries
+        self.window = None  # samples in the currently open window
+        self.pre_samples = []  # samples preceding the window
+        self.closetime = None  # time at which to close the current window
+
+    def update(self, node):
+        """Check the gate and record data from the origin (called each tick
+        by node)."""
+
+        g = node.read(self.gate)
+        if g is None:
+            return
+        gate_open = g[0] > self.threshold
+
+        if gate_open:
+            if self.window is None:
+                # start a new window (including pre-trigger samples)
+                self.window = self.pre_samples
+                self.pre_samples = []
+            self.closetime = node.t + self.post
+        elif self.window is None and self.pre <= 0:
+            # nothing to record (note: we only read origin when we have to)
+            return
+
+        s = node.read(self.origin, self.func)
+        if s is None:
+            return
+
+        if self.window is not None:
+            self.window += [[node.t] + s]
+
+            if not gate_open and node.t >= self.closetime:
+                if self.summary is None:
+                    self.entries += self.window
+                else:
+                    self.entries += [[self.window[0][0]] +
+                                     list(self.summary(self.window, node.dt))]
+                self.window = None
+        else:
+            # keep a rolling set of samples to be used as the pre-trigger
+            # margin
+            self.pre_samples += [[node.t] + s]
+            if len(self.pre_samples) > self.pre / node.dt:
+                self.pre_samples = self.pre_samples[1:]
+
+
+def window_peak(samples, dt):
+    """Summary of a triggered window giving the value with the largest
+    magnitude in each dimension."""
+
+    return [max([s[i] for s in samples], key=abs)
+            for i in range(1, len(samples[0]))]
+
+
+def window_integral(samples, dt):
+    """Summary of a triggered window giving the integral of each dimension
+    over the window."""
+
+    return [sum([s[i] for s in samples]) * dt
+            for i in range(1, len(samples[0]))]
+
+
+def window_mean(samples, dt):
+    """Summary of a triggered window giving the mean of each dimension."""
+
+    return [sum([s[i] for s in samples]) / float(len(samples))
+            for i in range(1, len(samples[0]))]
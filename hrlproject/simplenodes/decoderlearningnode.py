@@ -2,17 +2,50 @@
 
 import nef
 import copy
+import math
+import threading
+
+from hrlproject.misc import originbuffer
 
 
 class DecoderLearningNode(nef.SimpleNode):
     """Implements a decoder learning rule (kind of a hack to get this into
     Nengo 1.4).
 
+    The updates can optionally be batched (see the batch parameter), so
+    that the activity*error products are accumulated over several
+    timesteps and then applied to the decoders all at once. The total change
+    over a batch is the same as with per-timestep updates given the same
+    activity and error inputs. The difference is that with per-timestep
+    updates the decoded output (and therefore anything downstream, e.g. the
+    error signal) reflects the changes from earlier in the batch. The
+    change in the decoded output that is delayed in this way is at most
+    n*rate*max_t(sum_i a_i(t)^2)*max(|error|) after n timesteps of a batch,
+    where a_i(t) is the activity of neuron i (i.e., the amount of learning
+    done within one batch). So batching is equivalent to per-timestep
+    learning to the extent that the learning within a single batch doesn't
+    significantly affect the error signal.
+
+    The error signal is usually decoded from neurons (and filtered), so it
+    is never exactly zero. A learning window ends when the error drops
+    below window_threshold (in every dimension), and a batch is always
+    applied when its window ends (or after max_batch timesteps).
+
+    The node also keeps statistics on the decoder changes, to monitor the
+    learning dynamics (e.g. whether the Q values have stopped changing, or
+    are thrashing). A learning window is a period over which the error is
+    above window_threshold (see in_window), for all the update methods.
+
     :input error: error signal driving learning
+    :output stats: [norm of the total change in the decoders over the last
+        learning window, norm of the difference between the current and
+        initial decoders, total absolute change in each dimension of the
+        decoders (e.g. for each action)]
     """
 
     def __init__(self, ens, origin, rate, errorD=1, learning=True,
-                 name="DecoderLearningNode"):
+                 name="DecoderLearningNode", sparse=True, batch=None,
+                 window_threshold=0.05, max_batch=1000, logfile=None):
         """Initialize node variables.
 
         :param ens: ensemble whose neural activities will drive learning
@@ -21,6 +54,22 @@ class DecoderLearningNode(nef.SimpleNode):
         :param errorD: dimension of error signal
         :param learning: whether or not to modify decoders
         :param name: name for node
+        :param sparse: if True, use the sparse update (see update), otherwise
+            use the original dense update (see update_dense)
+        :param batch: if None, update decoders every timestep. If an int n,
+            accumulate updates and apply them every n timesteps. If
+            "window", accumulate updates over a whole learning window (i.e.
+            until the error drops below window_threshold). Batches are always
+            applied at the end of a learning window.
+        :param window_threshold: the learning window ends when the magnitude
+            of the error is below this value in every dimension (note: this
+            only determines when windows end, learning is still applied for
+            any nonzero error)
+        :param max_batch: maximum number of timesteps in a batch (so that
+            the changes are still applied if a window never ends)
+        :param logfile: if not None, the learning statistics are appended to
+            this file at the end of each learning window (one line per
+            window: "time window_norm drift mass0 mass1 ...")
         """
 
         self.ens = ens
@@ -28,27 +77,273 @@ class DecoderLearningNode(nef.SimpleNode):
         self.error = None
         self.rate = rate
         self.learning = learning
+        self.sparse = sparse
+        self.batch = batch
+        self.window_threshold = window_threshold
+        self.max_batch = max_batch
+
+        # accumulated (unapplied) changes for each decoder row
+        self.pending = {}
+        self.pending_ticks = 0
+
+        self.activity = originbuffer.OriginBuffer(ens.getOrigin("AXON"))
+        self.decoders = originbuffer.DecoderBuffer(origin)
+
+        # held while the decoders are being modified (so that other threads
+        # can get a consistent copy of the decoders), and incremented each
+        # time they are modified
+        self.lock = threading.Lock()
+        self.version = 0
+
+        # learning statistics
+        self.logfile = logfile
+        self.initial_decoders = None  # set on the first tick
+        self.window_decoders = None  # decoders at the start of the window
+        self.drift_sq = 0.0
+        self.action_mass = [0.0 for _ in range(errorD)]
+        self.window_norm = 0.0  # for the last completed window
+        self.num_windows = 0
+        self.mean_window_norm = 0.0
+        self.max_window_norm = 0.0
+
+        if self.logfile is not None:
+            # clear any old data
+            open(self.logfile, "w").close()
 
         nef.SimpleNode.__init__(self, name)
         self.getTermination("error").setDimensions(errorD)
 
     def tick(self):
         if self.learning:
-            try:
-                activity = self.ens.getOrigin("AXON").getValues().getValues()
-            except:
+            activity = self.activity.read()
+            if self.activity.stale:
                 # activity was null for some reason, just skip this update
                 return
 
-            # update decoders
-            decoders = self.origin.getDecoders()
-            # weight change for decoder i is
-            # activity of neuron i * error(maybe a vector) * learning rate
-            deltas = [[a * e * self.rate for e in self.error]
-                      for a in activity]
+            if self.initial_decoders is None:
+                # note: doing this here rather than in __init__ so that we
+                # get the values after any decoders have been loaded
+                self.initial_decoders = self.decoders.copy()
+
+            if self.batch is not None:
+                self.accumulate(activity, self.error)
+            elif self.sparse:
+                self.update(activity, self.error)
+            else:
+                self.update_dense(activity, self.error)
+
+    def update(self, activity, error):
+        """Apply the learning rule to the decoders.
+
+        Nothing is done if the error is zero, only the rows of the decoders
+        corresponding to active neurons are modified, and the changes are
+        made in place on the existing decoder array.
+
+        :param activity: neural activities of ens
+        :param error: error signal
+        """
+
+        if error is None:
+            return
+
+        active = self.in_window(error)
+        if active:
+            self.start_window()
+
+        # weight change for decoder i is
+        # activity of neuron i * error(maybe a vector) * learning rate
+        scaled_error = [e * self.rate for e in error]
+        if any(scaled_error):
+            self.lock.acquire()
+            try:
+                change = self.decoders.add_outer(activity, scaled_error,
+                                                 self.initial_decoders)
+                self.version += 1
+            finally:
+                self.lock.release()
+            self.record_change(change)
+
+        if not active:
+            self.end_window()
+
+    def accumulate(self, activity, error):
+        """Accumulate the learning rule changes, and apply them to the
+        decoders when the batch is complete (see update).
+
+        :param activity: neural activities of ens
+        :param error: error signal
+        """
+
+        if error is None:
+            return
+
+        scaled_error = [e * self.rate for e in error]
+        if any(scaled_error):
+            dims = range(len(scaled_error))
+            pending = self.pending
+            for i, a in enumerate(activity):
+                if a != 0:
+                    row = pending.get(i)
+                    if row is None:
+                        pending[i] = [a * e for e in scaled_error]
+                    else:
+                        for j in dims:
+                            row[j] += a * scaled_error[j]
+            self.pending_ticks += 1
+
+        if not self.in_window(error):
+            # learning window has finished, so apply any pending changes
+            self.commit()
+            self.end_window()
+            return
+
+        self.start_window()
+
+        if self.batch == "window":
+            if self.pending_ticks >= self.max_batch:
+                self.commit()
+        elif self.pending_ticks >= min(self.batch, self.max_batch):
+            self.commit()
+
+    def in_window(self, error):
+        """Returns True if the error is large enough to be part of a
+        learning window (see window_threshold)."""
+
+        threshold = self.window_threshold
+        for e in error:
+            if e > threshold or e < -threshold:
+                return True
+        return False
+
+    def commit(self):
+        """Apply the accumulated changes to the decoders."""
+
+        if len(self.pending) == 0:
+            return
+
+        self.lock.acquire()
+        try:
+            change = self.decoders.add_rows(self.pending,
+                                            self.initial_decoders)
+            self.version += 1
+        finally:
+            self.lock.release()
+        self.record_change(change)
+
+        self.pending = {}
+        self.pending_ticks = 0
+
+    def reset_decoders(self, decoders):
+        """Replace the decoders (e.g. with decoders solved elsewhere).
+
+        Any pending (batched) changes are discarded, since they were
+        calculated relative to the old decoders, and the statistics are reset
+        to be relative to the new decoders.
+
+        :param decoders: new decoder matrix
+        """
+
+        self.lock.acquire()
+        try:
+            self.origin.setDecoders(decoders)
+            self.version += 1
+
+            self.pending = {}
+            self.pending_ticks = 0
+            self.initial_decoders = self.decoders.copy()
+            self.window_decoders = None
+            self.drift_sq = 0.0
+        finally:
+            self.lock.release()
+
+    def start_window(self):
+        """Called when the error is above window_threshold, to mark the start
+        of a learning window."""
+
+        if self.window_decoders is None:
+            self.window_decoders = self.decoders.copy()
+
+    def end_window(self):
+        """Called when the error is below window_threshold, to update the
+        statistics if a learning window has just finished."""
+
+        if self.window_decoders is None:
+            return
+
+        self.window_norm = self.decoders.distance(self.window_decoders)
+        self.window_decoders = None
+
+        self.num_windows += 1
+        self.mean_window_norm += ((self.window_norm - self.mean_window_norm) /
+                                  self.num_windows)
+        self.max_window_norm = max(self.max_window_norm, self.window_norm)
+
+        if self.logfile is not None:
+            f = open(self.logfile, "a")
+            f.write(" ".join([str(x) for x in [self.t] +
+                              self.origin_stats()]) + "\n")
+            f.close()
+
+    def record_change(self, change):
+        """Update the statistics based on a change to the decoders.
+
+        :param change: squared norm, absolute change per dimension, and
+            cross term with initial decoders (see
+            originbuffer.DecoderBuffer.add_outer)
+        """
+
+        sum_sq, mass, cross = change
+
+        # |d + delta - d0|^2 = |d - d0|^2 + 2<d - d0, delta> + |delta|^2
+        self.drift_sq += 2 * cross + sum_sq
+
+        self.action_mass = [x + y for x, y in zip(self.action_mass, mass)]
+
+    def origin_stats(self):
+        return ([self.window_norm, math.sqrt(max(self.drift_sq, 0.0))] +
+                self.action_mass)
+
+    def update_dense(self, activity, error):
+        """Apply the learning rule by building a complete new decoder matrix
+        (the original implementation, kept for comparison)."""
+
+        if error is None:
+            return
+
+        active = self.in_window(error)
+        if active:
+            self.start_window()
+
+        # update decoders
+        decoders = self.origin.getDecoders()
+        # weight change for decoder i is
+        # activity of neuron i * error(maybe a vector) * learning rate
+        deltas = [[a * e * self.rate for e in error]
+                  for a in activity]
+        self.lock.acquire()
+        try:
             self.origin.setDecoders([[delta[i] + val for i, val in
                                       enumerate(old_d)] for delta, old_d in
                                      zip(deltas, decoders)])
+            self.version += 1
+        finally:
+            self.lock.release()
+
+        # statistics (the same as those returned by DecoderBuffer.add_outer)
+        sum_sq = 0.0
+        mass = [0.0 for _ in error]
+        cross = 0.0
+        reference = self.initial_decoders
+        for i, (delta, old_d) in enumerate(zip(deltas, decoders)):
+            for j, d in enumerate(delta):
+                sum_sq += d * d
+                mass[j] += abs(d)
+                if reference is not None:
+                    cross += d * (old_d[j] - reference[i][j])
+        self.record_change((sum_sq, mass, cross))
+
+        if not active:
+            self.end_window()
 
     def termination_error(self, x, pstc=0.01):
         self.error = copy.deepcopy(x)
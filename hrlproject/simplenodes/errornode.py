@@ -4,14 +4,37 @@ import nef
 
 
 class ErrorNode(nef.SimpleNode):
-    """Node to emulate the function of ErrorCalc2."""
+    """Node to emulate the function of ErrorNetwork (ErrorCalc2 plus the
+    gating and positive bias).
+
+    :input vals: Q values of current state
+    :input old_vals: Q values of previous state
+    :input curr_bg_input: vector with 1 indicating currently selected action
+        and 0 elsewhere
+    :input saved_bg_input: as above, but indicating previously selected action
+    :input reward: reward signal
+    :input reset: if ~1, reset the error calculation
+    :input learn: if ~1, output the error signal, else 0
+    :output error: current error signal
+    :output curr_error: ungated TD error
+    """
+
+    def __init__(self, num_actions, Qradius=1.0, discount=0.3, errorcap=0.2,
+                 name="ErrorNode"):
+        """Initialize node variables.
+
+        :param num_actions: the number of actions available to the system
+        :param Qradius: expected radius of Q values
+        :param discount: discount factor
+        :param errorcap: maximum magnitude of the error signal
+        :param name: name for node
+        """
 
-    def __init__(self, num_actions, Qradius=1.0, discount=0.3):
         self.d = num_actions
         self.Qradius = Qradius
         self.discount = discount
 
-        self.errorcap = 0.2
+        self.errorcap = errorcap
         self.pos_bias = 0.03
 
         self.vals = [0 for _ in range(self.d)]
@@ -27,7 +50,7 @@ class ErrorNode(nef.SimpleNode):
 
         self.curr_error = 0
 
-        nef.SimpleNode.__init__(self, "ErrorNode")
+        nef.SimpleNode.__init__(self, name)
 
         self.create_termination("vals", self.gen_set_func("vals", self.d))
         self.create_termination("old_vals", self.gen_set_func("old_vals",
@@ -81,7 +104,9 @@ class ErrorNode(nef.SimpleNode):
         self.storeQ = self.old_vals[self.saved_bg.index(max(self.saved_bg))]
 
         self.reward_acc += 0.001 * self.reward
-        self.storeQ_acc += self.discount * 0.001 * self.storeQ
+        # note: the discount is not applied to negative Q values (see
+        # ErrorCalc2)
+        self.storeQ_acc += self.discount * 0.001 * max(self.storeQ, 0.0)
 
         self.curr_error = (self.currQ + self.reward_acc - self.storeQ -
                            self.storeQ_acc)
@@ -0,0 +1,203 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+import threading
+
+import nef
+
+from Jama import Matrix
+
+from hrlproject.misc import HRLutils, checkpoint, decodersolver
+
+
+class EvalReservoir(nef.SimpleNode):
+    """Keeps a bounded sample of the states the agent has visited, and
+    periodically re-solves the Q value decoders of a QNetwork over those
+    states.
+
+    The eval points for the state populations are generated offline (see
+    run.gen_evalpoints), so as the agent's behaviour changes the states it
+    visits can drift away from the points the decoders were solved for. The
+    node samples the input state every sample_period seconds into a
+    reservoir (each state seen is kept with equal probability, up to size
+    states). After each refresh the count of states seen is reset to the
+    size of the reservoir, so that states from before the last refresh are
+    gradually replaced (i.e., the sample is weighted towards recent states).
+
+    Every refresh_period seconds the decoders of the "vals" origins on
+    state_pop and old_state_pop are re-solved over the reservoir (see
+    decodersolver), in a background thread so that the simulation isn't
+    stopped. The target is either the initial Q values (the origin's
+    functions) or the Q values currently decoded at the reservoir states.
+    The new decoders are stored in self.decoders and, optionally, saved as a
+    parameter file that can be used to warm restart the agent (see
+    QNetwork.loadParams) and/or installed on the origins.
+
+    :input state: current state (connect to the same source as the agent's
+        state_input)
+    """
+
+    def __init__(self, qnet, stateD, size=2000, sample_period=0.05,
+                 refresh_period=None, target="initial", prefix=None,
+                 install=False, noise=0.1, name="EvalReservoir"):
+        """Initialize node variables.
+
+        :param qnet: QNetwork whose decoders will be re-solved (must be using
+            decoder learning, i.e. not neuron_learning)
+        :param stateD: dimension of state
+        :param size: maximum number of states in the reservoir
+        :param sample_period: time between state samples
+        :param refresh_period: time between decoder refreshes (if None,
+            refresh must be called manually)
+        :param target: "initial" to solve for the initial Q values, or
+            "current" to solve for the current Q values
+        :param prefix: if not None, the refreshed decoders are saved with
+            this prefix (see QNetwork.saveParams)
+        :param install: if True, the refreshed decoders are set on the
+            origins (replacing the learned decoders)
+        :param noise: noise level for the decoder solver
+        :param name: name for node
+        """
+
+        if qnet.neuron_learning:
+            raise ValueError("EvalReservoir requires decoder learning")
+        if target not in ["initial", "current"]:
+            raise ValueError("unknown target %s" % target)
+
+        self.qnet = qnet
+        self.stateD = stateD
+        self.size = size
+        self.sample_period = sample_period
+        self.refresh_period = refresh_period
+        self.target = target
+        self.prefix = prefix
+        self.install = install
+        self.noise = noise
+
+        self.state = None
+        self.points = []
+        self.seen = 0
+        self.next_sample = 0.0
+        self.next_refresh = refresh_period
+        self.rand = HRLutils.stream(name + "/reservoir")
+
+        self.decoders = None  # dict of refreshed decoders, by pop name
+        self.num_refreshes = 0
+        self.solver_thread = None
+
+        nef.SimpleNode.__init__(self, name)
+        self.getTermination("state").setDimensions(stateD)
+
+    def tick(self):
+        if self.state is not None and self.t >= self.next_sample:
+            self.add(self.state)
+            self.next_sample = self.t + self.sample_period
+
+        if (self.refresh_period is not None and self.t >= self.next_refresh
+                and len(self.points) > 0):
+            self.next_refresh = self.t + self.refresh_period
+            self.refresh()
+
+    def add(self, state):
+        """Add a state to the reservoir."""
+
+        self.seen += 1
+        if len(self.points) < self.size:
+            self.points += [list(state)]
+        else:
+            i = self.rand.randint(0, self.seen - 1)
+            if i < self.size:
+                self.points[i] = list(state)
+
+    def refresh(self):
+        """Start re-solving the decoders over the current reservoir (in a
+        background thread).
+
+        :returns: False if the previous refresh is still running (in which
+            case this one is skipped), True otherwise
+        """
+
+        if self.solver_thread is not None and self.solver_thread.isAlive():
+            return False
+
+        points = [p[:] for p in self.points]
+        self.seen = min(self.seen, self.size)
+
+        # note: the current decoders are copied now (rather than in the
+        # solver thread) so that the target corresponds to the states in the
+        # reservoir at this time
+        current = {}
+        if self.target == "current":
+            for pop, dec in self.snapshot():
+                current[pop] = dec
+
+        self.solver_thread = threading.Thread(
+            target=self.solve, args=(points, current),
+            name=self.getName() + "Solver")
+        self.solver_thread.setDaemon(True)
+        self.solver_thread.start()
+        return True
+
+    def snapshot(self):
+        """Returns a copy of the current Q value decoders, as a list of
+        (population name, decoders) tuples."""
+
+        arrays = dict(self.qnet.snapshot())
+        return [("state_pop", arrays["state_decoders"]),
+                ("old_state_pop", arrays["old_state_decoders"])]
+
+    def solve(self, points, current):
+        """Solve for the decoders over the given points.
+
+        :param points: reservoir states
+        :param current: dict mapping population names to their current
+            decoders (only used if target is "current")
+        """
+
+        decoders = {}
+        try:
+            for pop in ["state_pop", "old_state_pop"]:
+                ens = self.qnet.getNode(pop)
+                solver = decodersolver.DecoderSolver(ens, points,
+                                                     noise=self.noise)
+                if self.target == "current":
+                    funcs = solver.A.times(Matrix([list(row) for row in
+                                                   current[pop]]))
+                else:
+                    funcs = list(ens.getOrigin("vals").getFunctions())
+                decoders[pop] = solver.solve(funcs)
+        except Exception, e:
+            # note: don't want a failed solve to stop the simulation
+            print "error refreshing decoders: %s" % e
+            return
+
+        self.decoders = decoders
+        self.num_refreshes += 1
+
+        if self.prefix is not None:
+            self.save(self.prefix)
+        if self.install:
+            self.set_decoders()
+
+    def save(self, prefix):
+        """Save the refreshed decoders, in the same format as
+        QNetwork.saveParams (so the file can be loaded with load_weights).
+
+        :param prefix: prefix for the saved file
+        """
+
+        arrays = dict(self.qnet.snapshot())
+        arrays["state_decoders"] = self.decoders["state_pop"]
+        arrays["old_state_decoders"] = self.decoders["old_state_pop"]
+        checkpoint.save(HRLutils.datafile(prefix + "_params.ckpt"),
+                        arrays.items())
+
+    def set_decoders(self):
+        """Install the refreshed decoders on the Q value origins (see
+        DecoderLearningNode.reset_decoders)."""
+
+        for pop, node in zip(["state_pop", "old_state_pop"],
+                             self.qnet.learning_nodes()):
+            node.reset_decoders(self.decoders[pop])
+
+    def termination_state(self, x, dimensions=1):
+        self.state = x
@@ -0,0 +1,83 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+import nef
+
+from hrlproject.misc import originbuffer
+
+
+class FactoredWeightNode(nef.SimpleNode):
+    """Learned connection weights from a state ensemble to a set of action
+    populations, stored in factored form (see ActionValues).
+
+    The weights onto action population i are encoders_i x factors[i], where
+    encoders_i are the (fixed) encoders of the action population and
+    factors[i] is a learned vector with one value per state neuron. This node
+    computes factors[i] . activity for each action (which is then passed
+    through a decoded termination on the action population, applying the
+    encoders), and applies the PES rule to the factors. So the memory and
+    computation scale with the number of state neurons, rather than the
+    number of state neurons times the number of action neurons.
+
+    The same learning rate can be used as for the dense HPES terminations in
+    ActionValues. With supervisionRatio 1, HPES changes the weight from state
+    neuron j to action neuron i by rate * gain_i * (encoder_i . error) * a_j
+    each timestep, and the decoded termination applies gain_i * encoder_i to
+    the output of this node, so changing factors[j] by rate * error * a_j
+    gives the same change in the effective weights. The only difference is
+    that HPES uses the filtered state activities (see compare_actionvalues,
+    which checks that both forms learn at the same rate).
+
+    :input error: error signal for each action
+    :output X: factors . state activity (one value per action)
+    """
+
+    def __init__(self, ens, factors, rate, dt=0.001,
+                 name="FactoredWeightNode"):
+        """Initialize node variables.
+
+        :param ens: state ensemble (activities are read from its AXON origin)
+        :param factors: initial factors (one list, with one value per state
+            neuron, for each action)
+        :param rate: learning rate
+        :param dt: simulation timestep (used to convert spikes to rates)
+        :param name: name for node
+        """
+
+        self.factors = [list(f) for f in factors]
+        self.rate = rate
+        self.dt = dt
+        self.error = [0.0 for _ in factors]
+        self.output = [0.0 for _ in factors]
+
+        self.activity = originbuffer.OriginBuffer(ens.getOrigin("AXON"))
+
+        nef.SimpleNode.__init__(self, name)
+        self.getTermination("error").setDimensions(len(factors))
+
+    def tick(self):
+        activity = self.activity.read()
+        if self.activity.stale:
+            return
+
+        if activity.typecode == "z":
+            # spiking output, so convert spikes to rates
+            activity = [1.0 / self.dt if x else 0.0 for x in activity]
+        active = [(j, a) for j, a in enumerate(activity) if a != 0]
+
+        # note: the weight change for the full weight matrix is
+        # rate * encoder * error * activity, so in factored form only the
+        # factor changes (rate * error * activity)
+        for f, e in zip(self.factors, self.error):
+            if e != 0:
+                e *= self.rate
+                for j, a in active:
+                    f[j] += e * a
+
+        self.output = [sum([f[j] * a for j, a in active])
+                       for f in self.factors]
+
+    def origin_X(self):
+        return self.output
+
+    def termination_error(self, x, pstc=0.005):
+        self.error = x
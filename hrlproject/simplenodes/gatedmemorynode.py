@@ -0,0 +1,150 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+import nef
+
+
+class GatedMemoryNode(nef.SimpleNode):
+    """Node to emulate the function of memory.Memory (without the neurons).
+
+    Simulates the dynamics of the Memory network directly. The stored value
+    (divided by radius, as in Memory) is the sum of the recurrent input
+    (filtered by intPSC) and any decoded terminations that have been added to
+    the storage (see addDecodedTermination). When the transfer signal is
+    active the storage is driven towards the target at a rate controlled by
+    inputscale.
+
+    :input target: the value to be stored
+    :input transfer: if ~1, change the stored value to the current value of
+        target
+    :output X: stored value
+    """
+
+    def __init__(self, name, N, d, radius=1.0, inputscale=1.0,
+                 recurweight=1.0, direct_storage=False):
+        """Initialize node variables.
+
+        Takes the same arguments as Memory, so that it can be used as a drop
+        in replacement (see memory.make_memory).
+
+        :param name: name of node
+        :param N: base number of neurons (ignored)
+        :param d: dimension of stored value
+        :param radius: radius of stored value
+        :param inputscale: controls how fast the stored value moves to the
+            target
+        :param recurweight: controls the preservation of the stored value
+        :param direct_storage: ignored (storage is always direct)
+        """
+
+        self.dimension = d
+        self.radius = radius
+        self.inputscale = inputscale
+        self.recurweight = recurweight
+
+        self.tauPSC = 0.007
+        self.intPSC = 0.1
+
+        # the transfer signal needs to be above this to open the input gate
+        # (approximates the double inhibition in Memory)
+        self.gate_threshold = 0.1
+
+        self.target = [0.0 for _ in range(d)]
+        self.transfer = 0.0
+
+        # recurrent part of the stored value
+        self.recur = [0.0 for _ in range(d)]
+
+        # storageinput value (filtered by tauPSC)
+        self.storageinput = [0.0 for _ in range(d)]
+
+        # current value of each decoded termination (after transform)
+        self.inputs = {}
+
+        self.prev_t = 0.0
+
+        nef.SimpleNode.__init__(self, name)
+
+        self.create_termination("target", self.gen_target_func(d))
+
+    def gen_target_func(self, d):
+        def set_target(x, dimensions=d, pstc=self.tauPSC):
+            self.target = x
+
+        return set_target
+
+    def termination_transfer(self, x, pstc=0.007):
+        self.transfer = x[0]
+
+    def stored(self):
+        """Returns the current stored value (divided by radius)."""
+
+        x = list(self.recur)
+        for vals in self.inputs.values():
+            x = [a + b for a, b in zip(x, vals)]
+        return x
+
+    def tick(self):
+        dt = self.t - self.prev_t
+        self.prev_t = self.t
+        if dt <= 0:
+            return
+
+        x = self.stored()
+
+        # storageinput represents (target - stored_value), gated by transfer
+        if self.transfer > self.gate_threshold:
+            s = [t / self.radius - v for t, v in zip(self.target, x)]
+
+            # note: storageinput can't represent values outside its radius
+            s = [min(max(v, -1.0), 1.0) for v in s]
+        else:
+            s = [0.0 for _ in range(self.dimension)]
+        self.storageinput = [a + (b - a) * dt / self.tauPSC
+                             for a, b in zip(self.storageinput, s)]
+
+        # recurrent input plus storageinput, filtered by intPSC
+        drive = [self.recurweight * v + self.inputscale * self.intPSC * u
+                 for v, u in zip(x, self.storageinput)]
+        self.recur = [r + (v - r) * dt / self.intPSC
+                      for r, v in zip(self.recur, drive)]
+
+    def origin_X(self):
+        return [x * self.radius for x in self.stored()]
+
+    def addDecodedOrigin(self, name, funcs, origin):
+        """Add an origin computing the given functions of the stored value
+        (see Memory.addDecodedOrigin).
+
+        :param name: name of origin
+        :param funcs: list of ca.nengo.math.Functions (one for each output
+            dimension)
+        :param origin: ignored (functions are computed directly)
+        """
+
+        def func():
+            x = self.stored()
+            return [f.map(x) * self.radius for f in funcs]
+
+        self.create_origin(name, func)
+        return self.getOrigin(name)
+
+    def addDecodedTermination(self, name, transform, pstc, mod):
+        """Add a termination directly onto the stored value (not gated, see
+        Memory.addDecodedTermination).
+
+        :param name: name of termination
+        :param transform: transform applied to input (a d x input dimension
+            matrix)
+        :param pstc: time constant of termination
+        :param mod: ignored
+        """
+
+        transform = [list(row) for row in transform]
+        self.inputs[name] = [0.0 for _ in range(self.dimension)]
+
+        def set_input(x, dimensions=len(transform[0]), pstc=pstc):
+            self.inputs[name] = [sum([a * b for a, b in zip(row, x)])
+                                 for row in transform]
+
+        self.create_termination(name, set_input)
+        return self.getTermination(name)
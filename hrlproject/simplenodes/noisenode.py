@@ -1,9 +1,9 @@
 # Copyright 2014, Daniel Rasmussen.  All rights reserved.
 
-from ca.nengo.math.impl import GaussianPDF
-
 import nef
 
+from hrlproject.misc import HRLutils
+
 
 class NoiseNode(nef.SimpleNode):
     """Node to output gaussian noise with mean 0 and standard deviation driven
@@ -14,25 +14,26 @@ class NoiseNode(nef.SimpleNode):
     :output noise: vector of noisy values
     """
 
-    def __init__(self, frequency, dimension=1):
+    def __init__(self, frequency, dimension=1, name="NoiseNode"):
         """Initialize node variables.
 
         :param frequency: frequency to update noise values
         :param dimension: dimension of noise signal
+        :param name: name for node (also identifies its random stream)
         """
 
         self.period = 1.0 / frequency
         self.scale = 0.0
         self.updatetime = 0.0
         self.state = [0.0 for _ in range(dimension)]
-        self.pdf = GaussianPDF(0, 1)
+        self.rand = HRLutils.stream(name)
 
-        nef.SimpleNode.__init__(self, "NoiseNode")
+        nef.SimpleNode.__init__(self, name)
 
     def tick(self):
         if self.t > self.updatetime:
-            self.state = [self.pdf.sample()[0] * self.scale
-                          for _ in range(len(self.state))]
+            self.state = self.rand.gauss_block(len(self.state),
+                                               sigma=self.scale)
             self.updatetime = self.t + self.period
 
     def termination_scale(self, x):
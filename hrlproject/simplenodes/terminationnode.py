@@ -1,17 +1,24 @@
 # Copyright 2014, Daniel Rasmussen.  All rights reserved.
 
 import copy
+import heapq
+import math
+import threading
 
 import nef
 
 from hrlproject.misc import HRLutils
-from hrlproject.misc.HRLutils import rand as random
 
 
 class TerminationNode(nef.SimpleNode):
     """Node used to detect termination of action selected by RL agent, and
     generate appropriate signals to drive agent to respond.
 
+    The termination conditions are compiled at construction (see
+    TerminationEngine), so that each tick only involves checking the next
+    timer deadline, looking up the current region, and (if the agent is in
+    one of the termination regions) one dot product with the context.
+
     :input context: current goal that node will decide when to terminate
     :output learn: signal indicating that the agent should learn (if 1)
     :output reset: signal indicating that the agent should reset (if 1)
@@ -20,7 +27,7 @@ class TerminationNode(nef.SimpleNode):
 
     def __init__(self, conditions, env, contextD=0, name="TerminationNode",
                  rewardval=0.0, state_delay=0.0, learn_interval=0.1,
-                 reset_delay=0.1, reset_interval=0.05):
+                 reset_delay=0.1, reset_interval=0.05, engine=None):
         """Initialize node variables.
 
         :param conditions: dict mapping contexts to termination states
@@ -35,6 +42,8 @@ class TerminationNode(nef.SimpleNode):
         :param learn_interval: time to learn for
         :param reset_delay: time between learn and reset
         :param reset_interval: time to reset for
+        :param engine: TerminationEngine to use (can be shared between nodes
+            with the same environment); if None, a new engine will be created
         """
 
         nef.SimpleNode.__init__(self, name)
@@ -43,7 +52,9 @@ class TerminationNode(nef.SimpleNode):
         self.rewardval = rewardval
         self.env = env
         self.prev_state = [0]
+        self.prev_direction = [0.0]  # normalized prev_state
         self.context = [0]
+        self.context_norm = 0.0
         # reward value when no termination conditions met
         self.defaultreward = -0.05
         self.reward = self.defaultreward
@@ -63,8 +74,32 @@ class TerminationNode(nef.SimpleNode):
         # reset right at the beginning to set things up
         self.resettime = [0.05, 0.1]
 
+        # compile the termination conditions
+        self.engine = engine if engine is not None else TerminationEngine(env)
+
+        # mapping from region code to context vector (or None if the region
+        # always causes termination)
+        self.region_conds = {}
+        for c in self.conds:
+            if not isinstance(c, Timer):
+                target = self.conds[c]
+                if target is not None:
+                    target = [float(x) for x in target]
+                self.region_conds[self.engine.code(c)] = target
+
+        # give each timer its own random stream
+        # note: the iteration order of conditions isn't fixed, so unnamed
+        # timers are numbered in the order they were created
+        timers = [c for c in self.conds if isinstance(c, Timer)]
+        timers.sort(key=lambda c: c.index)
+        for i, c in enumerate(timers):
+            c.rand = HRLutils.stream("%s/%s" % (name, c.name or
+                                                "Timer%d" % i))
+            self.engine.schedule(self, c, 0)
+
         def contextf(x, dimensions=contextD, pstc=0.001):
             self.context = copy.deepcopy(x)
+            self.context_norm = math.sqrt(sum([v * v for v in x]))
 
         self.create_termination("context", contextf)
 
@@ -78,33 +113,36 @@ class TerminationNode(nef.SimpleNode):
 
     def tick(self):
         cond_active = False
-        for c in self.conds:
-            if isinstance(c, Timer):
-                # if it is a timer entry, just update the timer and check if it
-                # has expired
-                c.tick()
-                if c.ring():
-                    self.reward = self.rewardval
-                    self.activate()
-                    c.reset()
-                    cond_active = True
 
-            elif (self.env.is_in(self.env.state, c) and
-                  (self.conds[c] is None or
-                   HRLutils.similarity(HRLutils.normalize(self.context),
-                                       self.conds[c]) > 0.3)):
-                # if it is a state entry, check if the agent is in the region
-                # associated with that state, and check if that region is the
-                # one corresponding to the currently selected context
+        # check for expired timers
+        step = self.engine.step(self.t)
+        for timer in self.engine.expired(self, step):
+            self.reward = self.rewardval
+            self.activate()
+            self.engine.schedule(self, timer, step)
+            cond_active = True
+
+        # check if the agent is in a termination region, and if that region is
+        # the one corresponding to the currently selected context
+        if len(self.region_conds) > 0:
+            code = self.engine.region(self.env.state)
+            if code in self.region_conds:
+                target = self.region_conds[code]
 
-                self.reward = self.rewardval
+                # note: equivalent to
+                # similarity(normalize(context), target) > 0.3
+                if target is None or (self.context_norm > 0 and
+                                      sum([x * y for x, y in
+                                           zip(self.context, target)]) >
+                                      0.3 * self.context_norm):
+                    self.reward = self.rewardval
 
-                self.rewardamount += 1
-                if self.rewardamount > self.rewardresetamount:
-                    self.activate()
-                    self.rewardamount = 0
+                    self.rewardamount += 1
+                    if self.rewardamount > self.rewardresetamount:
+                        self.activate()
+                        self.rewardamount = 0
 
-                cond_active = True
+                    cond_active = True
 
         # if no termination conditions met, just give default reward
         if not cond_active:
@@ -115,15 +153,19 @@ class TerminationNode(nef.SimpleNode):
         if self.t > self.resettime[0] and self.t < self.resettime[1]:
             self.rewardamount = 0
 
-        # add a penalty if the state hasn't changed (to help prevent agent from
-        # getting stuck)
+        # add a penalty if the state hasn't changed direction (to help
+        # prevent agent from getting stuck)
+        # note: keeping the normalized previous state, so that only the
+        # current state needs to be normalized each tick
+        state = list(self.env.state)
+        direction = HRLutils.normalize(state)
         if sum(self.prev_state) != 0 and \
-                HRLutils.similarity(HRLutils.normalize(self.env.state),
-                                    HRLutils.normalize(self.prev_state)) < 1.0:
+                HRLutils.similarity(direction, self.prev_direction) < 1.0:
             self.state_penalty = 0.0
         else:
             self.state_penalty += 0.0001
-        self.prev_state = copy.deepcopy(self.env.state)
+        self.prev_state = state
+        self.prev_direction = direction
 
         self.reward = self.reward - self.state_penalty
 
@@ -135,21 +177,150 @@ class TerminationNode(nef.SimpleNode):
                           self.reset_interval]
 
 
+class TerminationEngine:
+    """Compiled termination conditions, which can be shared between several
+    TerminationNodes using the same environment.
+
+    Timers are stored as deadlines (in timesteps) in a heap, so checking
+    them only involves comparing the current timestep to the earliest
+    deadline. Region labels are mapped to integer codes, and the region code
+    of the environment's state is computed once per state (no matter how
+    many nodes/conditions ask for it).
+
+    The region cache compares the state by value (rather than identity), so
+    it doesn't matter whether environments modify the state in place.
+
+    The nodes sharing an engine may be ticked in different threads, so the
+    shared state (the timer heap, fired timers, and region cache) is only
+    accessed while holding the engine's lock.
+    """
+
+    def __init__(self, env, dt=0.001):
+        """Initialize engine.
+
+        :param env: environment whose regions are being checked
+        :param dt: simulation timestep
+        """
+
+        self.env = env
+        self.dt = dt
+
+        # mapping from region label to integer code
+        self.codes = {}
+
+        # region code of the last state we looked up
+        self.region_state = None
+        self.region_code = -1
+
+        # heap of (deadline, id, node, timer)
+        self.timers = []
+        self.count = 0
+
+        # timers that have expired but haven't been collected by their node
+        self.fired = {}
+
+        self.lock = threading.Lock()
+
+    def code(self, label):
+        """Returns the integer code for the given region label."""
+
+        self.lock.acquire()
+        try:
+            if label not in self.codes:
+                self.codes[label] = len(self.codes)
+            return self.codes[label]
+        finally:
+            self.lock.release()
+
+    def region(self, state):
+        """Returns the code of the region containing state (-1 if the
+        region isn't one of the termination regions)."""
+
+        state = list(state)
+
+        self.lock.acquire()
+        try:
+            if state != self.region_state:
+                self.region_state = state
+                self.region_code = self.codes.get(self.env.get_label(state),
+                                                  -1)
+            return self.region_code
+        finally:
+            self.lock.release()
+
+    def step(self, t):
+        """Convert time to timesteps."""
+
+        return int(t / self.dt + 0.5)
+
+    def schedule(self, node, timer, step):
+        """Reset the timer and schedule its deadline.
+
+        :param node: node that owns the timer
+        :param timer: Timer to be scheduled
+        :param step: current timestep
+        """
+
+        timer.reset()
+
+        # note: the timer rings on the first tick at which its time, counted
+        # down by dt each tick, reaches zero
+        ticks = max(int(math.ceil(timer.time / timer.dt - 1e-6)), 1)
+
+        self.lock.acquire()
+        try:
+            self.count += 1
+            heapq.heappush(self.timers, (step + ticks, self.count, node,
+                                         timer))
+        finally:
+            self.lock.release()
+
+    def expired(self, node, step):
+        """Returns the timers belonging to node that have expired by the
+        given timestep (each expired timer is only returned once)."""
+
+        self.lock.acquire()
+        try:
+            while len(self.timers) > 0 and self.timers[0][0] <= step:
+                _, _, n, timer = heapq.heappop(self.timers)
+                self.fired.setdefault(n, []).append(timer)
+
+            return self.fired.pop(node, [])
+        finally:
+            self.lock.release()
+
+
 class Timer:
-    """A simple timer that counts down from some point with a given dt."""
+    """A timer that rings after a random time in the given period.
+
+    The countdown itself is done by TerminationEngine (which converts the
+    time to a deadline in timesteps when the timer is scheduled).
+    """
+
+    # number of timers created (used to give each timer a unique name)
+    created = 0
+
+    def __init__(self, period, dt=0.001, name=None):
+        """Initialize timer.
 
-    def __init__(self, period, dt=0.001):
+        :param period: range of times (the timer is set to a random time in
+            this range each time it is reset)
+        :param dt: simulation timestep
+        :param name: name identifying the timer's random stream (if None,
+            timers are numbered in the order they are created, see also
+            TerminationNode)
+        """
+
+        self.index = Timer.created
+        Timer.created += 1
+
+        self.name = name
         self.period = period
         self.dt = dt
         self.time = 0
+        self.rand = HRLutils.stream(name or "Timer%d" % self.index)
 
         self.reset()
 
     def reset(self):
-        self.time = random.uniform(self.period[0], self.period[1])
-
-    def tick(self):
-        self.time -= self.dt
-
-    def ring(self):
-        return self.time <= 0.0
+        self.time = self.rand.uniform(self.period[0], self.period[1])
@@ -0,0 +1,191 @@
+# Copyright 2014, Daniel Rasmussen.  All rights reserved.
+
+import atexit
+import time
+
+import nef
+
+from java.lang import Runtime, System
+
+# number of latency histogram buckets (bucket b counts calls taking between
+# 2^(b-1) and 2^b microseconds, the last bucket counts everything longer)
+NUM_BUCKETS = 24
+
+# maximum number of heap samples kept (older samples are discarded)
+MAX_HEAP_SAMPLES = 1000
+
+
+class CallStats:
+    """Call count, total time, and latency histogram for one function."""
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0  # nanoseconds
+        self.max = 0
+        self.buckets = [0] * NUM_BUCKETS
+
+    def record(self, ns):
+        self.calls += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+        us = ns // 1000
+        b = 0
+        while us > 0 and b < NUM_BUCKETS - 1:
+            us >>= 1
+            b += 1
+        self.buckets[b] += 1
+
+    def percentile(self, p):
+        """Returns an upper bound on the p'th percentile latency (in
+        microseconds), based on the histogram."""
+
+        target = p / 100.0 * self.calls
+        count = 0
+        for b, n in enumerate(self.buckets):
+            count += n
+            if count >= target:
+                return 2 ** b
+        return 2 ** NUM_BUCKETS
+
+
+class TickProfiler(nef.SimpleNode):
+    """Node to measure the time spent in the Python SimpleNodes of a network.
+
+    When created, the node wraps the tick method, and the functions of the
+    origins and terminations, of every nef.SimpleNode in the network
+    (including subnetworks). Each call then records its latency (see
+    CallStats). The heap usage is sampled every heap_every timesteps. The
+    statistics are reported every period seconds (realtime, not simulation
+    time), and on exit.
+
+    Nothing is wrapped unless a TickProfiler is created, so there is no cost
+    when profiling is off. The node should be created after all the other
+    nodes have been added to the network.
+
+    Note: the origins/terminations created by nef.SimpleNode keep their
+    functions in a func attribute, which is what gets wrapped (other
+    origins/terminations are left alone).
+    """
+
+    def __init__(self, net, period=300.0, heap_every=1000, filename=None,
+                 name="TickProfiler"):
+        """Initialize node variables.
+
+        :param net: network to instrument (nef.Network or NetworkImpl)
+        :param period: time between reports (realtime, not simulation time)
+        :param heap_every: number of timesteps between heap samples
+        :param filename: if not None, the reports are appended to this file
+        :param name: name for node
+        """
+
+        self.period = period
+        self.heap_every = heap_every
+        self.filename = filename
+
+        self.stats = {}  # (node name, function name) -> CallStats
+        self.heap = []  # (simulation time, used heap bytes)
+        self.max_heap = 0
+        self.ticks = 0
+        self.last_report = time.time()
+
+        nef.SimpleNode.__init__(self, name)
+
+        self.instrument(getattr(net, "network", net))
+
+        if self.filename is not None:
+            # clear any old data
+            open(self.filename, "w").close()
+
+        atexit.register(self.report)
+
+    def instrument(self, network, prefix=""):
+        """Wrap the functions of all the SimpleNodes in network.
+
+        :param network: NetworkImpl to instrument
+        :param prefix: prefix for node names (the names of the parent
+            networks)
+        """
+
+        for node in network.getNodes():
+            name = prefix + node.getName()
+            if isinstance(node, nef.SimpleNode):
+                if node is self:
+                    continue
+                node.tick = self.wrap((name, "tick"), node.tick)
+                for o in node.getOrigins():
+                    if callable(getattr(o, "func", None)):
+                        o.func = self.wrap((name, "origin_" + o.getName()),
+                                           o.func)
+                for t in node.getTerminations():
+                    if callable(getattr(t, "func", None)):
+                        t.func = self.wrap(
+                            (name, "termination_" + t.getName()), t.func)
+            elif hasattr(node, "getNodes"):
+                self.instrument(node, name + ".")
+
+    def wrap(self, key, func):
+        """Returns a version of func that records its latency in
+        self.stats[key]."""
+
+        stats = self.stats.setdefault(key, CallStats())
+        nanotime = System.nanoTime
+
+        def wrapper(*args, **kwargs):
+            start = nanotime()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.record(nanotime() - start)
+        return wrapper
+
+    def tick(self):
+        self.ticks += 1
+        if self.ticks % self.heap_every == 0:
+            runtime = Runtime.getRuntime()
+            used = runtime.totalMemory() - runtime.freeMemory()
+            self.heap += [(self.t, used)]
+            if len(self.heap) > MAX_HEAP_SAMPLES:
+                del self.heap[0]
+            self.max_heap = max(self.max_heap, used)
+
+        if time.time() - self.last_report >= self.period:
+            self.last_report = time.time()
+            self.report()
+
+    def lines(self):
+        """Returns the report, as a list of lines."""
+
+        items = [(s.total, key, s) for key, s in self.stats.items()
+                 if s.calls > 0]
+        items.sort()
+        items.reverse()
+        total = sum([s.total for _, _, s in items])
+
+        lines = ["tick profile at t=%.3f (%d ticks)" % (self.t, self.ticks),
+                 "%-40s %-28s %9s %9s %6s %8s %8s %8s" %
+                 ("node", "function", "calls", "total_ms", "pct", "mean_us",
+                  "p99_us", "max_us")]
+        for _, (node, func), s in items:
+            lines += ["%-40s %-28s %9d %9.1f %5.1f%% %8.1f %8d %8d" %
+                      (node, func, s.calls, s.total / 1e6,
+                       100.0 * s.total / max(total, 1),
+                       s.total / 1e3 / s.calls, s.percentile(99),
+                       s.max // 1000)]
+        if len(self.heap) > 0:
+            lines += ["heap: %.1fMB (max %.1fMB)" %
+                      (self.heap[-1][1] / 2.0 ** 20,
+                       self.max_heap / 2.0 ** 20)]
+        return lines
+
+    def report(self):
+        """Print the statistics (and append them to the file)."""
+
+        lines = self.lines()
+        print "\n".join(lines)
+
+        if self.filename is not None:
+            f = open(self.filename, "a")
+            f.write("\n".join(lines) + "\n\n")
+            f.close()